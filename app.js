@@ -7,12 +7,22 @@ const { spawn } = require('child_process');
 const server = http.createServer(app);
 const io = socketio(server);
 const fs = require('fs');
+const crypto = require('crypto');
+const { createFrameDecoder } = require('./ipc');
+const { createBroadcaster } = require('./broadcast');
 
 app.set("view engine", "ejs");
 app.use(express.static(path.join(__dirname, "public")));
+app.use(express.json({ limit: '10mb' }));
 
 let pythonProcess = null;
-let dataBuffer = '';
+
+// Records are coalesced into 'anomaly-batch' events instead of one emit per record
+const broadcaster = createBroadcaster(io);
+
+function emitRecords(records) {
+    broadcaster.pushAll(records);
+}
 
 function runPythonScript() {
     if (pythonProcess) {
@@ -22,15 +32,18 @@ function runPythonScript() {
     const pythonScriptPath = path.join(__dirname, 'python_scripts', 'final.py');
     console.log(`Executing Python script: ${pythonScriptPath}`);
 
-    pythonProcess = spawn('python', ['final.py'], {
+    // Worker mode keeps TensorFlow and the models loaded for the life of the process.
+    // Records arrive as length-prefixed frames on fd 3; stdout/stderr carry logs only.
+    pythonProcess = spawn('python', ['final.py', '--worker', '--replay', 'anomalous_dataset.csv', '--ipc-fd', '3'], {
         cwd: path.join(__dirname, 'python_scripts'),
-        env: { ...process.env, PYTHONUNBUFFERED: '1' }
+        env: { ...process.env, PYTHONUNBUFFERED: '1' },
+        stdio: ['pipe', 'pipe', 'pipe', 'pipe']
     });
 
+    pythonProcess.stdio[3].on('data', createFrameDecoder(emitRecords));
+
     pythonProcess.stdout.on('data', (data) => {
         console.log(`Python stdout: ${data}`);
-        dataBuffer += data.toString();
-        processBuffer();
     });
 
     pythonProcess.stderr.on('data', (data) => {
@@ -48,25 +61,55 @@ function runPythonScript() {
     });
 }
 
-function processBuffer() {
-    let startIndex = dataBuffer.indexOf('JSON_START');
-    let endIndex = dataBuffer.indexOf('JSON_END');
-    
-    while (startIndex !== -1 && endIndex !== -1 && startIndex < endIndex) {
-        const jsonStr = dataBuffer.substring(startIndex + 10, endIndex);
-        try {
-            const jsonData = JSON.parse(jsonStr);
-            console.log('Parsed JSON data:', jsonData);  // Log the parsed data
-            io.emit('anomaly-data', jsonData);
-        } catch (error) {
-            console.error('Error parsing JSON:', error);
-            console.error('Problematic JSON string:', jsonStr);
+// Request types the HTTP endpoint may queue, and the fields that name input files.
+// Input files must live under PIPELINE_DATA_DIR; output paths are always chosen by the worker.
+const PIPELINE_REQUEST_TYPES = new Set(['csv', 'dataset', 'ais', 'nmea', 'retrain', 'image', 'images', 'scene', 'track', 'nearby']);
+const PIPELINE_DATA_DIR = path.resolve(process.env.PIPELINE_DATA_DIR || path.join(__dirname, 'python_scripts'));
+
+function resolveDataPath(requestPath) {
+    if (typeof requestPath !== 'string' || !requestPath) {
+        return null;
+    }
+    const resolved = path.resolve(PIPELINE_DATA_DIR, requestPath);
+    const relative = path.relative(PIPELINE_DATA_DIR, resolved);
+    if (relative === '..' || relative.startsWith('..' + path.sep) || path.isAbsolute(relative)) {
+        return null;
+    }
+    return resolved;
+}
+
+// Checked copy of an HTTP request body for the worker, or { error } if it can't be queued
+function buildPipelineRequest(body) {
+    if (!body || typeof body !== 'object' || Array.isArray(body)) {
+        return { error: 'request body must be a JSON object' };
+    }
+    if (!PIPELINE_REQUEST_TYPES.has(body.type)) {
+        return { error: `unknown request type: ${body.type}` };
+    }
+    const { save_path, id, ...request } = body;
+    if ('path' in request) {
+        request.path = resolveDataPath(request.path);
+        if (!request.path) {
+            return { error: `path must be a file under ${PIPELINE_DATA_DIR}` };
         }
-        
-        dataBuffer = dataBuffer.substring(endIndex + 8);
-        startIndex = dataBuffer.indexOf('JSON_START');
-        endIndex = dataBuffer.indexOf('JSON_END');
     }
+    if ('paths' in request) {
+        request.paths = Array.isArray(request.paths) ? request.paths.map(resolveDataPath) : [null];
+        if (request.paths.includes(null)) {
+            return { error: `paths must be files under ${PIPELINE_DATA_DIR}` };
+        }
+    }
+    // The id names output files, so it is never taken from the caller and never repeats
+    return { request: { id: `req_${crypto.randomUUID()}`, ...request } };
+}
+
+// Queue new work (csv / ais / image requests) on the running Python worker
+function submitPipelineRequest(request) {
+    if (!pythonProcess || !pythonProcess.stdin.writable) {
+        return false;
+    }
+    pythonProcess.stdin.write(JSON.stringify(request) + '\n');
+    return true;
 }
 
 io.on("connection", function(socket) {
@@ -80,6 +123,20 @@ io.on("connection", function(socket) {
     });
 });
 
+app.post('/pipeline/requests', function(req, res) {
+    if (!pythonProcess) {
+        runPythonScript();
+    }
+    const { request, error } = buildPipelineRequest(req.body);
+    if (error) {
+        res.status(400).json({ error });
+    } else if (submitPipelineRequest(request)) {
+        res.status(202).json({ id: request.id });
+    } else {
+        res.status(503).json({ error: 'Python worker is not running' });
+    }
+});
+
 app.get('/map', function(req, res) {
     res.render('map');  // Renders index.ejs
 });
@@ -115,6 +172,7 @@ server.listen(3000, () => {
 });
 
 process.on('SIGINT', () => {
+    broadcaster.stop();
     if (pythonProcess) {
         pythonProcess.kill();
     }
@@ -0,0 +1,103 @@
+// Socket.IO fan-out benchmark: per-record emits vs coalesced 'anomaly-batch' events.
+//   node bench_broadcast.js [records] [clients] [vessels]
+// Uses an in-process stand-in for io so only the server-side work is measured;
+// bytes are the JSON size each client would receive.
+const { createBroadcaster } = require('./broadcast');
+
+const total = parseInt(process.argv[2] || '100000', 10);
+const clientCount = parseInt(process.argv[3] || '10', 10);
+const vessels = parseInt(process.argv[4] || '200', 10);
+
+function makeRecord(i) {
+    return {
+        MMSI: 232000000 + (i % vessels),
+        BaseDateTime: new Date(Date.UTC(2023, 1, 22) + i * 1000).toISOString().slice(0, 19),
+        SOG: 6.3, COG: 235.2, LAT: 33.68298, LON: -78.24927, Change: 0.8,
+        anomaly: i % 50 === 0 ? 1 : 0, oil_spill: 0, image_path: null
+    };
+}
+
+// ackDelayMs < 0 never acknowledges within the run (a stalled client)
+function createFakeIo(ackDelayMs) {
+    const stats = { messages: 0, bytes: 0, records: 0 };
+    const sockets = new Map();
+    for (let i = 0; i < clientCount; i++) {
+        const socket = {
+            id: `client${i}`,
+            timeout() {
+                return socket;
+            },
+            emit(event, payload, ack) {
+                stats.messages++;
+                stats.bytes += JSON.stringify(payload).length;
+                stats.records += payload.rows ? payload.rows.length : 1;
+                if (ack && ackDelayMs >= 0) {
+                    setTimeout(ack, ackDelayMs);
+                }
+            }
+        };
+        sockets.set(socket.id, socket);
+    }
+    return {
+        stats,
+        sockets: { sockets },
+        on() {},
+        emit(event, payload) {
+            for (const socket of sockets.values()) {
+                socket.emit(event, payload);
+            }
+        }
+    };
+}
+
+function report(name, stats, elapsedMs) {
+    console.log(`${name}: ${stats.messages} messages, ${(stats.bytes / 1e6).toFixed(1)} MB, ` +
+        `${stats.records} records delivered, ${(elapsedMs).toFixed(0)} ms server time`);
+}
+
+function perRecord() {
+    const io = createFakeIo(0);
+    const start = process.hrtime.bigint();
+    for (let i = 0; i < total; i++) {
+        io.emit('anomaly-data', makeRecord(i));
+    }
+    report('per-record emit', io.stats, Number(process.hrtime.bigint() - start) / 1e6);
+}
+
+function batched(name, ackDelayMs) {
+    return new Promise((resolve) => {
+        const io = createFakeIo(ackDelayMs);
+        const broadcaster = createBroadcaster(io, { statsIntervalMs: 60000 });
+        let busyNs = 0n;
+        let i = 0;
+        // Feed in slices so flush timers and acks interleave with the producer
+        function feed() {
+            const start = process.hrtime.bigint();
+            const end = Math.min(i + 1000, total);
+            for (; i < end; i++) {
+                broadcaster.push(makeRecord(i));
+            }
+            busyNs += process.hrtime.bigint() - start;
+            if (i < total) {
+                setTimeout(feed, 1);
+                return;
+            }
+            setTimeout(() => {
+                const start = process.hrtime.bigint();
+                broadcaster.flush();
+                busyNs += process.hrtime.bigint() - start;
+                broadcaster.stop();
+                report(name, io.stats, Number(busyNs) / 1e6);
+                resolve();
+            }, 300);
+        }
+        feed();
+    });
+}
+
+(async () => {
+    console.log(`${total} records, ${clientCount} clients, ${vessels} vessels`);
+    perRecord();
+    await batched('batched, prompt acks', 0);
+    await batched('batched, stalled clients', -1);
+})();
@@ -0,0 +1,59 @@
+// End-to-end IPC benchmark: records/s from Python emit to the Socket.IO emit call.
+//   node bench_ipc.js [rows] [batchSize]
+const path = require('path');
+const { spawn } = require('child_process');
+const { createFrameDecoder, createMarkerDecoder } = require('./ipc');
+
+const rows = parseInt(process.argv[2] || '200000', 10);
+const batchSize = parseInt(process.argv[3] || '500', 10);
+
+// The processBuffer loop app.js used before the framed channel
+function createLegacyDecoder(onRecords) {
+    let dataBuffer = '';
+    return function onData(data) {
+        dataBuffer += data.toString();
+        let startIndex = dataBuffer.indexOf('JSON_START');
+        let endIndex = dataBuffer.indexOf('JSON_END');
+        while (startIndex !== -1 && endIndex !== -1 && startIndex < endIndex) {
+            onRecords([JSON.parse(dataBuffer.substring(startIndex + 10, endIndex))]);
+            dataBuffer = dataBuffer.substring(endIndex + 8);
+            startIndex = dataBuffer.indexOf('JSON_START');
+            endIndex = dataBuffer.indexOf('JSON_END');
+        }
+    };
+}
+
+function run(name, protocol, makeDecoder, batch) {
+    return new Promise((resolve) => {
+        let received = 0;
+        // Stand-in for io.emit: one call per record, as app.js does
+        const emitted = [];
+        const onRecords = (records) => {
+            for (const record of records) {
+                emitted.push(record.event || 'anomaly-data');
+                received++;
+            }
+            emitted.length = 0;
+        };
+        const start = process.hrtime.bigint();
+        const child = spawn('python', ['benchmark.py', 'ipc-emit', '--protocol', protocol,
+            '--rows', String(rows), '--batch-size', String(batch)], {
+            cwd: path.join(__dirname, 'python_scripts'),
+            stdio: ['ignore', 'pipe', 'inherit', 'pipe']
+        });
+        const decoder = makeDecoder(onRecords);
+        (protocol === 'framed' ? child.stdio[3] : child.stdout).on('data', decoder);
+        child.on('close', () => {
+            const seconds = Number(process.hrtime.bigint() - start) / 1e9;
+            console.log(`${name.padEnd(40)} ${String(received).padStart(10)} records ${seconds.toFixed(3).padStart(9)} s ${Math.round(received / seconds).toLocaleString().padStart(12)} records/s`);
+            resolve();
+        });
+    });
+}
+
+(async () => {
+    await run('legacy JSON_START/JSON_END scan', 'markers', createLegacyDecoder, 1);
+    await run('marker scan (incremental)', 'markers', createMarkerDecoder, 1);
+    await run('framed, 1 record per frame', 'framed', createFrameDecoder, 1);
+    await run(`framed, ${batchSize} records per frame`, 'framed', createFrameDecoder, batchSize);
+})();
@@ -0,0 +1,151 @@
+// Coalesces anomaly-data records into time-windowed 'anomaly-batch' events.
+//
+// Payload: { fields: [...], rows: [[...], ...] } - one array per record, in field order.
+// Each client has at most one unacknowledged batch in flight. While a client is
+// behind, new records are folded into a per-client backlog that keeps every
+// anomaly but only the latest position of each vessel; the backlog goes out
+// with the next batch once the client acknowledges.
+
+const DEFAULT_OPTIONS = {
+    intervalMs: 250,            // flush at least this often
+    maxRecords: 500,            // or as soon as this many records are pending
+    ackTimeoutMs: 5000,         // give up waiting for a client ack after this long
+    maxBacklogAnomalies: 1000,  // anomalies kept per slow client
+    statsIntervalMs: 10000
+};
+
+function encodeBatch(records) {
+    const fields = [];
+    const index = {};
+    for (const record of records) {
+        for (const key in record) {
+            if (!(key in index)) {
+                index[key] = fields.length;
+                fields.push(key);
+            }
+        }
+    }
+    const rows = records.map((record) => fields.map((field) => (field in record ? record[field] : null)));
+    return { fields, rows };
+}
+
+function vesselKey(record) {
+    return record.MMSI !== undefined ? `v${record.MMSI}` : 'unknown';
+}
+
+function createBroadcaster(io, options = {}) {
+    const settings = { ...DEFAULT_OPTIONS, ...options };
+    const clients = new Map();
+    let pending = [];
+    const stats = { recordsIn: 0, messagesOut: 0, positionsDropped: 0 };
+
+    function clientState(socket) {
+        let state = clients.get(socket.id);
+        if (!state) {
+            state = { inFlight: false, positions: new Map(), anomalies: [] };
+            clients.set(socket.id, state);
+        }
+        return state;
+    }
+
+    function addToBacklog(state, records) {
+        for (const record of records) {
+            if (record.anomaly) {
+                state.anomalies.push(record);
+            } else {
+                if (state.positions.has(vesselKey(record))) {
+                    stats.positionsDropped++;
+                }
+                state.positions.set(vesselKey(record), record);
+            }
+        }
+        if (state.anomalies.length > settings.maxBacklogAnomalies) {
+            state.anomalies.splice(0, state.anomalies.length - settings.maxBacklogAnomalies);
+        }
+    }
+
+    function takeBacklog(state) {
+        const records = state.anomalies.concat(Array.from(state.positions.values()));
+        state.anomalies = [];
+        state.positions.clear();
+        return records;
+    }
+
+    function sendTo(socket, records) {
+        const state = clientState(socket);
+        if (state.inFlight) {
+            addToBacklog(state, records);
+            return;
+        }
+        const backlog = takeBacklog(state);
+        const batch = backlog.length ? backlog.concat(records) : records;
+        if (!batch.length) {
+            return;
+        }
+        state.inFlight = true;
+        stats.messagesOut++;
+        socket.timeout(settings.ackTimeoutMs).emit('anomaly-batch', encodeBatch(batch), () => {
+            // Acknowledged or timed out: either way the client may receive again
+            state.inFlight = false;
+        });
+    }
+
+    function flush() {
+        const records = pending;
+        pending = [];
+        for (const socket of io.sockets.sockets.values()) {
+            const state = clientState(socket);
+            if (records.length || state.anomalies.length || state.positions.size) {
+                sendTo(socket, records);
+            }
+        }
+    }
+
+    function push(record) {
+        // Non-position events (e.g. segmentation results) are rare; send them as they come
+        if (record.event) {
+            io.emit(record.event, record);
+            stats.messagesOut++;
+            return;
+        }
+        stats.recordsIn++;
+        pending.push(record);
+        if (pending.length >= settings.maxRecords) {
+            flush();
+        }
+    }
+
+    io.on('connection', (socket) => {
+        clientState(socket);
+        socket.on('disconnect', () => clients.delete(socket.id));
+    });
+
+    const flushTimer = setInterval(flush, settings.intervalMs);
+    const statsTimer = setInterval(() => {
+        const seconds = settings.statsIntervalMs / 1000;
+        if (stats.recordsIn || stats.messagesOut) {
+            console.log(`Broadcast: ${(stats.recordsIn / seconds).toFixed(1)} records/s in, ` +
+                `${(stats.messagesOut / seconds).toFixed(1)} messages/s out, ` +
+                `${stats.positionsDropped} stale positions dropped, ${clients.size} clients`);
+        }
+        stats.recordsIn = 0;
+        stats.messagesOut = 0;
+        stats.positionsDropped = 0;
+    }, settings.statsIntervalMs);
+
+    return {
+        push,
+        pushAll(records) {
+            for (const record of records) {
+                push(record);
+            }
+        },
+        flush,
+        stop() {
+            clearInterval(flushTimer);
+            clearInterval(statsTimer);
+        }
+    };
+}
+
+module.exports = { createBroadcaster, encodeBatch };
@@ -0,0 +1,115 @@
+// Decoders for records coming from python_scripts/final.py.
+//
+// Framed channel (final.py --ipc-fd N), see python_scripts/ipc.py:
+//   uint32 BE length of what follows | uint8 frame type | payload
+// Legacy channel: JSON_START{...}JSON_END markers on stdout.
+
+const FRAME_JSON = 1;
+const FRAME_JSON_BATCH = 2;
+const FRAME_AIS_BATCH = 3;
+
+// mmsi u32, time_ms, lat, lon, sog, cog, change (f64 each), anomaly u8, oil_spill u8, path_len u16
+const AIS_RECORD_SIZE = 4 + 6 * 8 + 1 + 1 + 2;
+
+function formatTime(ms) {
+    // Same shape as Python's isoformat() for naive timestamps
+    const iso = new Date(ms).toISOString();
+    return iso.endsWith('.000Z') ? iso.slice(0, 19) : iso.slice(0, 23);
+}
+
+function decodeAisBatch(payload) {
+    const count = payload.readUInt32BE(0);
+    const records = new Array(count);
+    let pathOffset = 4 + count * AIS_RECORD_SIZE;
+    for (let i = 0; i < count; i++) {
+        const at = 4 + i * AIS_RECORD_SIZE;
+        const pathLength = payload.readUInt16BE(at + 54);
+        const imagePath = pathLength ? payload.toString('utf8', pathOffset, pathOffset + pathLength) : null;
+        pathOffset += pathLength;
+        records[i] = {
+            MMSI: payload.readUInt32BE(at),
+            BaseDateTime: formatTime(payload.readDoubleBE(at + 4)),
+            SOG: payload.readDoubleBE(at + 28),
+            COG: payload.readDoubleBE(at + 36),
+            LAT: payload.readDoubleBE(at + 12),
+            LON: payload.readDoubleBE(at + 20),
+            Change: payload.readDoubleBE(at + 44),
+            anomaly: payload.readUInt8(at + 52),
+            oil_spill: payload.readUInt8(at + 53),
+            image_path: imagePath
+        };
+    }
+    return records;
+}
+
+function decodeFrame(type, payload) {
+    switch (type) {
+        case FRAME_JSON:
+            return [JSON.parse(payload.toString('utf8'))];
+        case FRAME_JSON_BATCH:
+            return JSON.parse(payload.toString('utf8'));
+        case FRAME_AIS_BATCH:
+            return decodeAisBatch(payload);
+        default:
+            throw new Error(`Unknown frame type ${type}`);
+    }
+}
+
+// Calls onRecords(records) once per frame. Leftover bytes are at most one
+// partial frame, so each chunk is copied a bounded number of times.
+function createFrameDecoder(onRecords) {
+    let pending = Buffer.alloc(0);
+    return function onData(chunk) {
+        pending = pending.length ? Buffer.concat([pending, chunk]) : chunk;
+        let offset = 0;
+        while (pending.length - offset >= 5) {
+            const length = pending.readUInt32BE(offset);
+            if (pending.length - offset - 4 < length) {
+                break;
+            }
+            const type = pending.readUInt8(offset + 4);
+            const payload = pending.subarray(offset + 5, offset + 4 + length);
+            offset += 4 + length;
+            try {
+                onRecords(decodeFrame(type, payload));
+            } catch (error) {
+                console.error('Error decoding frame:', error);
+            }
+        }
+        pending = pending.subarray(offset);
+    };
+}
+
+// Legacy text scanning; resumes the search where the previous chunk ended
+function createMarkerDecoder(onRecords) {
+    let buffer = '';
+    return function onData(chunk) {
+        buffer += chunk.toString();
+        let consumed = 0;
+        let startIndex = buffer.indexOf('JSON_START');
+        let endIndex = startIndex === -1 ? -1 : buffer.indexOf('JSON_END', startIndex);
+        const records = [];
+        while (startIndex !== -1 && endIndex !== -1) {
+            const jsonStr = buffer.substring(startIndex + 10, endIndex);
+            try {
+                records.push(JSON.parse(jsonStr));
+            } catch (error) {
+                console.error('Error parsing JSON:', error);
+                console.error('Problematic JSON string:', jsonStr);
+            }
+            consumed = endIndex + 8;
+            startIndex = buffer.indexOf('JSON_START', consumed);
+            endIndex = startIndex === -1 ? -1 : buffer.indexOf('JSON_END', startIndex);
+        }
+        buffer = buffer.substring(startIndex === -1 ? consumed : startIndex);
+        if (startIndex === -1 && buffer.length > 10) {
+            // Keep only a possible partial marker, drop plain log text
+            buffer = buffer.slice(-10);
+        }
+        if (records.length) {
+            onRecords(records);
+        }
+    };
+}
+
+module.exports = { createFrameDecoder, createMarkerDecoder, decodeFrame };
@@ -9,6 +9,17 @@ L.tileLayer("https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png", {
 
 let markers = {};
 let circles = {};
+// One line per vessel through its positions; the server only sends the points that shape it.
+// Bounded for endless streams: past MAX_TRACKS the vessels updated longest ago lose their line,
+// and each line keeps its last MAX_TRACK_POINTS points.
+const MAX_TRACKS = 2000;
+const MAX_TRACK_POINTS = 500;
+let tracks = new Map();
+// Anomaly markers waiting for their 'oil-spill-result' (segmentation id -> marker id), and
+// results that arrived before their record; the oldest are forgotten past MAX_PENDING_SPILLS
+const MAX_PENDING_SPILLS = 1000;
+let pendingSpillMarkers = new Map();
+let earlySpillResults = new Map();
 const anomalyMarkers = [];
 let bounds = L.latLngBounds();
 let isFirstMarker = true;
@@ -25,13 +36,33 @@ map.on('movestart', function() {
     userInteracted = true;
 });
 
-// Function to update or create a marker
-function updateMarker(data) {
-    const { LAT, LON, BaseDateTime, SOG, COG, Change, anomaly, oil_spill } = data;
-    const id = `${LAT}-${LON}`;
-    const currentCoordinates = `${LAT},${LON}`;
+// oil_spill is 1/0, or 'pending' until its 'oil-spill-result' arrives ('skipped' if the queue was full,
+// 'failed' if segmentation raised)
+function oilSpillLabel(oilSpill) {
+    if (oilSpill === 'pending') {
+        return 'Checking...';
+    }
+    if (oilSpill === 'skipped') {
+        return 'Not checked (busy)';
+    }
+    if (oilSpill === 'failed') {
+        return 'Check failed';
+    }
+    return oilSpill ? 'Detected' : 'Not Detected';
+}
+
+// Top features behind an anomaly, e.g. "turn_rate +0.081, speed_discrepancy +0.034"
+function formatContributions(contributions, limit = 3) {
+    return Object.entries(contributions)
+        .filter(([, value]) => value > 0)
+        .slice(0, limit)
+        .map(([feature, value]) => `${feature} +${value.toFixed(3)}`)
+        .join(', ');
+}
 
-    let info = `
+function popupInfo(data) {
+    const { LAT, LON, BaseDateTime, SOG, COG, Change, anomaly, oil_spill } = data;
+    return `
         Location:<br>
         Latitude: ${LAT}<br>
         Longitude: ${LON}<br>
@@ -40,8 +71,31 @@ function updateMarker(data) {
         Course: ${COG}°<br>
         Speed Change: ${Change.toFixed(2)} knots<br>
         Anomaly: ${anomaly ? 'Yes' : 'No'}<br>
-        Oil Spill: ${oil_spill ? 'Detected' : 'Not Detected'}
+        ${data.contributions ? `Driven by: ${formatContributions(data.contributions)}<br>` : ''}
+        Oil Spill: ${oilSpillLabel(oil_spill)}
     `;
+}
+
+// Sets key as the newest entry of an insertion-ordered Map and returns the values
+// of the oldest entries removed to keep it at limit
+function setBounded(entries, key, value, limit) {
+    entries.delete(key);
+    entries.set(key, value);
+    const evicted = [];
+    while (entries.size > limit) {
+        const [oldestKey, oldest] = entries.entries().next().value;
+        entries.delete(oldestKey);
+        evicted.push(oldest);
+    }
+    return evicted;
+}
+
+// Function to update or create a marker
+// fitView = false lets batch handlers fit the map once per batch instead of per record
+function updateMarker(data, fitView = true) {
+    const { LAT, LON, anomaly, oil_spill } = data;
+    const id = `${LAT}-${LON}`;
+    const currentCoordinates = `${LAT},${LON}`;
 
     // Check if this is the start of a new loop
     if (firstPointCoordinates === currentCoordinates && !isFirstMarker) {
@@ -50,6 +104,29 @@ function updateMarker(data) {
         isFirstMarker = true;
     }
 
+    let info = popupInfo(data);
+    if (oil_spill === 'pending' && data.segmentation_id !== undefined) {
+        const result = earlySpillResults.get(data.segmentation_id);
+        if (result) {
+            earlySpillResults.delete(data.segmentation_id);
+            info = popupInfo(result);
+        } else {
+            setBounded(pendingSpillMarkers, data.segmentation_id, id, MAX_PENDING_SPILLS);
+        }
+    }
+
+    if (data.MMSI !== undefined) {
+        const track = tracks.get(data.MMSI) || L.polyline([], { color: 'black', weight: 2, opacity: 0.6 }).addTo(map);
+        for (const stale of setBounded(tracks, data.MMSI, track, MAX_TRACKS)) {
+            map.removeLayer(stale);
+        }
+        track.addLatLng([LAT, LON]);
+        const points = track.getLatLngs();
+        if (points.length > MAX_TRACK_POINTS) {
+            track.setLatLngs(points.slice(-MAX_TRACK_POINTS));
+        }
+    }
+
     // Change the previous blue marker to a small black circle
     if (currentBlueMarkerId && markers[currentBlueMarkerId]) {
         map.removeLayer(markers[currentBlueMarkerId]);
@@ -122,6 +199,12 @@ function updateMarker(data) {
 
     bounds.extend([LAT, LON]);
     
+    if (fitView) {
+        fitMapToBounds();
+    }
+}
+
+function fitMapToBounds() {
     // Only fit bounds if user hasn't interacted with the map
     if (!userInteracted) {
         map.fitBounds(bounds, { maxZoom: 10, padding: [50, 50] });  // Added maxZoom and padding
@@ -137,8 +220,14 @@ function clearAllMarkers() {
     for (let id in circles) {
         map.removeLayer(circles[id]);
     }
+    for (const track of tracks.values()) {
+        map.removeLayer(track);
+    }
     markers = {};
     circles = {};
+    tracks = new Map();
+    // earlySpillResults is kept: a result can arrive just before the record that restarts the loop
+    pendingSpillMarkers = new Map();
     anomalyMarkers.length = 0;
     bounds = L.latLngBounds();
     currentBlueMarkerId = null;
@@ -170,7 +259,9 @@ function updateImageBox(data) {
             <p>Longitude: ${data.LON}</p>
             <p>Speed Change: ${data.Change.toFixed(2)} knots</p>
             <p>Anomaly: ${data.anomaly ? 'Yes' : 'No'}</p>
-            <p>Oil Spill: ${data.oil_spill ? 'Detected' : 'Not Detected'}</p>
+            ${data.contributions ? `<p>Driven by: ${formatContributions(data.contributions)}</p>` : ''}
+            <p>Oil Spill: ${oilSpillLabel(data.oil_spill)}</p>
+            ${data.nearby_vessels ? `<p>Vessels nearby (last 6 h): ${data.nearby_vessels.map((v) => `${v.MMSI} (${v.distance_km} km)`).join(', ') || 'none'}</p>` : ''}
         `;
     } else {
         imgElement.style.display = 'none';
@@ -184,6 +275,87 @@ socket.on('anomaly-data', (data) => {
     updateMarker(data);
 });
 
+// Batched records: { fields: [...], rows: [[...], ...] }
+const batchStats = { batches: 0, records: 0, handlerMs: 0 };
+
+socket.on('anomaly-batch', (batch, ack) => {
+    const start = performance.now();
+    const { fields, rows } = batch;
+    for (const row of rows) {
+        const data = {};
+        for (let i = 0; i < fields.length; i++) {
+            data[fields[i]] = row[i];
+        }
+        updateMarker(data, false);
+    }
+    fitMapToBounds();
+    batchStats.batches++;
+    batchStats.records += rows.length;
+    batchStats.handlerMs += performance.now() - start;
+    // Acknowledge so the server sends the next batch
+    if (typeof ack === 'function') {
+        ack();
+    }
+});
+
+// Segmentation of an anomaly finished after its record went out with oil_spill 'pending'.
+// The result carries the row's own fields, so it doesn't matter which arrives first.
+socket.on('oil-spill-result', (data) => {
+    const id = pendingSpillMarkers.get(data.id);
+    if (id === undefined) {
+        setBounded(earlySpillResults, data.id, data, MAX_PENDING_SPILLS);
+    } else {
+        pendingSpillMarkers.delete(data.id);
+        if (markers[id]) {
+            markers[id].setPopupContent(popupInfo(data));
+        }
+    }
+    if (data.oil_spill !== 1) {
+        return;
+    }
+    L.circle([data.LAT, data.LON], {
+        color: 'purple',
+        fillColor: '#f03',
+        fillOpacity: 0.5,
+        radius: 500
+    }).addTo(map).bindPopup('Potential Oil Spill Detected');
+    updateImageBox(data);
+});
+
+// Georeferenced spill outlines from full-scene segmentation
+const spillLayers = {};
+
+// Areas are null for scenes without bounds or a pixel size
+function formatArea(areaKm2, digits) {
+    return areaKm2 == null ? 'unknown (no ground scale)' : `${areaKm2.toFixed(digits)} km²`;
+}
+
+socket.on('segmentation-result', (data) => {
+    if (!data.spills || !data.spills.features.length) {
+        return;
+    }
+    if (spillLayers[data.id]) {
+        map.removeLayer(spillLayers[data.id]);
+    }
+    spillLayers[data.id] = L.geoJSON(data.spills, {
+        style: { color: 'violet', weight: 1, fillOpacity: 0.4 },
+        onEachFeature: (feature, layer) => {
+            layer.bindPopup(`Oil spill<br>Area: ${formatArea(feature.properties.area_km2, 3)}`);
+        }
+    }).addTo(map);
+    console.log(`Scene ${data.id}: ${data.spills.features.length} spills, ${formatArea(data.spill_area_km2, 2)}`);
+});
+
+setInterval(() => {
+    if (batchStats.batches) {
+        console.log(`Received ${batchStats.records} records in ${batchStats.batches} batches, ` +
+            `${batchStats.handlerMs.toFixed(1)} ms handler time`);
+    }
+    batchStats.batches = 0;
+    batchStats.records = 0;
+    batchStats.handlerMs = 0;
+}, 10000);
+
 // Add a button to focus on anomalies
 const anomalyButton = L.control({position: 'topright'});
 anomalyButton.onAdd = function(map) {
@@ -0,0 +1,154 @@
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+# Columnar AIS storage: a Parquet dataset partitioned by day and MMSI bucket,
+#   ROOT/date=2023-02-22/mmsi_bucket=3/part-0.parquet
+# with rows sorted by (MMSI, BaseDateTime) so row-group statistics are tight.
+# Reads prune partitions and row groups with time, bounding-box and MMSI
+# filters and decode only the requested columns. pyarrow is imported lazily.
+
+AIS_COLUMNS = ['MMSI', 'BaseDateTime', 'LAT', 'LON', 'SOG', 'COG', 'Heading']
+DEFAULT_MMSI_BUCKETS = 16
+DEFAULT_ROW_GROUP_SIZE = 64 * 1024
+METADATA_FILE = '_ais_dataset.json'
+
+
+def mmsi_buckets(mmsi, n_buckets):
+    return np.asarray(mmsi, dtype=np.int64) % n_buckets
+
+
+def is_dataset(source):
+    return isinstance(source, str) and (os.path.isdir(source) or source.endswith(('.parquet', '.arrow', '.feather')))
+
+
+def dataset_metadata(root):
+    path = os.path.join(root, METADATA_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_ais_dataset(df, root, n_buckets=DEFAULT_MMSI_BUCKETS, row_group_size=DEFAULT_ROW_GROUP_SIZE, part_name=None):
+    # Appends df to the dataset at root (new part files, existing ones untouched).
+    # With part_name the files are named after it instead, replacing any earlier write under that name.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    existing = dataset_metadata(root).get('mmsi_buckets')
+    if existing is not None and existing != n_buckets:
+        raise ValueError(f"{root} uses {existing} MMSI buckets, not {n_buckets}")
+    df = df.copy()
+    df['BaseDateTime'] = pd.to_datetime(df['BaseDateTime'])
+    df['date'] = df['BaseDateTime'].dt.strftime('%Y-%m-%d')
+    df['mmsi_bucket'] = mmsi_buckets(df['MMSI'], n_buckets)
+    df = df.sort_values(['MMSI', 'BaseDateTime'], kind='stable')
+
+    os.makedirs(root, exist_ok=True)
+    written = 0
+    for (date, bucket), part in df.groupby(['date', 'mmsi_bucket'], sort=True):
+        directory = os.path.join(root, f"date={date}", f"mmsi_bucket={bucket}")
+        os.makedirs(directory, exist_ok=True)
+        if part_name is None:
+            index = len([name for name in os.listdir(directory) if name.endswith('.parquet')])
+            path = os.path.join(directory, f"part-{index}.parquet")
+        else:
+            path = os.path.join(directory, f"{part_name}.parquet")
+        table = pa.Table.from_pandas(part.drop(columns=['date', 'mmsi_bucket']), preserve_index=False)
+        pq.write_table(table, path, row_group_size=row_group_size)
+        written += len(part)
+    with open(os.path.join(root, METADATA_FILE), 'w') as f:
+        json.dump({'mmsi_buckets': n_buckets, 'columns': list(df.columns.drop(['date', 'mmsi_bucket']))}, f)
+    logging.info(f"Wrote {written} rows to {root}")
+    return written
+
+
+def build_filter(start=None, end=None, bbox=None, mmsi=None, n_buckets=None, partitioned=True):
+    # start/end: anything pd.Timestamp accepts (end is exclusive); bbox: (west, south, east, north).
+    # The date/mmsi_bucket conditions prune whole partitions; the others prune row groups by their statistics.
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    conditions = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        conditions.append(ds.field('BaseDateTime') >= pa.scalar(start.to_datetime64()))
+        if partitioned:
+            conditions.append(ds.field('date') >= start.strftime('%Y-%m-%d'))
+    if end is not None:
+        end = pd.Timestamp(end)
+        conditions.append(ds.field('BaseDateTime') < pa.scalar(end.to_datetime64()))
+        if partitioned:
+            conditions.append(ds.field('date') <= end.strftime('%Y-%m-%d'))
+    if bbox is not None:
+        west, south, east, north = bbox
+        conditions += [ds.field('LON') >= west, ds.field('LON') <= east,
+                       ds.field('LAT') >= south, ds.field('LAT') <= north]
+    if mmsi is not None:
+        mmsi = [int(m) for m in np.atleast_1d(mmsi)]
+        conditions.append(ds.field('MMSI').isin(mmsi))
+        if partitioned and n_buckets:
+            conditions.append(ds.field('mmsi_bucket').isin(sorted(set(mmsi_buckets(mmsi, n_buckets).tolist()))))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def open_ais_dataset(source):
+    # (pyarrow dataset, MMSI bucket count or None); source is a dataset directory or a single Parquet/Arrow file
+    import pyarrow.dataset as ds
+
+    if os.path.isdir(source):
+        dataset = ds.dataset(source, format='parquet', partitioning='hive', exclude_invalid_files=True)
+        return dataset, dataset_metadata(source).get('mmsi_buckets')
+    return ds.dataset(source, format='parquet' if source.endswith('.parquet') else 'arrow'), None
+
+
+def read_ais_dataset(source, start=None, end=None, bbox=None, mmsi=None, columns=AIS_COLUMNS):
+    # DataFrame of the matching rows, with only the requested columns decoded
+    dataset, n_buckets = open_ais_dataset(source)
+    names = dataset.schema.names
+    expression = build_filter(start, end, bbox, mmsi, n_buckets, partitioned='date' in names)
+    table = dataset.to_table(columns=[c for c in columns if c in names], filter=expression)
+    df = table.to_pandas()
+    if 'BaseDateTime' in df and df['BaseDateTime'].dt.tz is not None:
+        df['BaseDateTime'] = df['BaseDateTime'].dt.tz_convert(None)
+    return df
+
+
+def filter_ais_frame(df, start=None, end=None, bbox=None, mmsi=None):
+    # The same filters applied to an in-memory frame (the CSV path has nothing to push them into)
+    keep = np.ones(len(df), dtype=bool)
+    if start is not None:
+        keep &= (df['BaseDateTime'] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        keep &= (df['BaseDateTime'] < pd.Timestamp(end)).to_numpy()
+    if bbox is not None:
+        west, south, east, north = bbox
+        keep &= df['LON'].between(west, east).to_numpy() & df['LAT'].between(south, north).to_numpy()
+    if mmsi is not None:
+        keep &= df['MMSI'].isin([int(m) for m in np.atleast_1d(mmsi)]).to_numpy()
+    return df if keep.all() else df[keep]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert AIS CSV files into a partitioned Parquet dataset")
+    parser.add_argument('csv', nargs='+', help="AIS CSV files (MMSI, BaseDateTime, LAT, LON, SOG, COG, Heading)")
+    parser.add_argument('--out', required=True, help="dataset directory (appended to if it exists)")
+    parser.add_argument('--mmsi-buckets', type=int, default=DEFAULT_MMSI_BUCKETS)
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000, help="CSV rows converted at a time")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for path in args.csv:
+        for chunk in pd.read_csv(path, chunksize=args.chunk_rows):
+            write_ais_dataset(chunk, args.out, args.mmsi_buckets)
+
+
+if __name__ == "__main__":
+    main()
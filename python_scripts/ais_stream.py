@@ -0,0 +1,267 @@
+import io
+import logging
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from features import LOITER_WINDOW, VESSEL_FEATURES, compute_vessel_features
+from nmea import NmeaDecoder
+from trajectory_store import TrajectoryStore
+
+AIS_COLUMNS = ['MMSI', 'BaseDateTime', 'LAT', 'LON', 'SOG', 'COG', 'Heading']
+NUMERIC_COLUMNS = ['LAT', 'LON', 'SOG', 'COG', 'Heading']
+
+# Micro-batch limits: flush after this many records or this many seconds
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_BATCH_WAIT = 0.5
+
+# Lines buffered between the reader thread and the scorer; bounds memory when scoring falls behind
+LINE_QUEUE_SIZE = 10000
+
+# Vessels whose last message is remembered for delta features (least recently seen are dropped)
+DEFAULT_MAX_VESSELS = 200000
+
+FOLLOW_POLL_INTERVAL = 0.2
+UDP_PACKET_SIZE = 65535
+
+
+def stdin_lines():
+    for line in sys.stdin:
+        yield line
+
+
+def follow_file(path, from_start=True):
+    # tail -f: keep reading as the file grows, reopen from the top if it is truncated
+    with open(path, 'rb') as f:
+        if not from_start:
+            f.seek(0, os.SEEK_END)
+        pending = b''
+        while True:
+            chunk = f.readline()
+            if chunk:
+                # Hold back a partial line until the writer finishes it
+                pending += chunk
+                if pending.endswith(b'\n'):
+                    yield pending.decode('utf-8', errors='replace')
+                    pending = b''
+                continue
+            if os.path.getsize(path) < f.tell():
+                logging.info(f"{path} was truncated, reading from the start")
+                f.seek(0)
+                pending = b''
+            time.sleep(FOLLOW_POLL_INTERVAL)
+
+
+def tcp_lines(host, port):
+    # Accept one feeder connection at a time and read newline-delimited records
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen(1)
+    logging.info(f"Listening for AIS records on tcp://{host}:{port}")
+    with server:
+        while True:
+            connection, address = server.accept()
+            logging.info(f"AIS feed connected from {address[0]}:{address[1]}")
+            with connection, connection.makefile('r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    yield line
+            logging.info("AIS feed disconnected")
+
+
+def udp_lines(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    logging.info(f"Listening for AIS records on udp://{host}:{port}")
+    with sock:
+        while True:
+            packet, _ = sock.recvfrom(UDP_PACKET_SIZE)
+            for line in packet.decode('utf-8', errors='replace').splitlines():
+                yield line
+
+
+def open_source(spec):
+    # spec: "-" / "stdin", "file:PATH", "tcp:HOST:PORT" or "udp:HOST:PORT"
+    if spec in ('-', 'stdin'):
+        return stdin_lines()
+    kind, _, rest = spec.partition(':')
+    if kind == 'file':
+        return follow_file(rest)
+    if kind in ('tcp', 'udp'):
+        host, _, port = rest.rpartition(':')
+        reader = tcp_lines if kind == 'tcp' else udp_lines
+        return reader(host or '127.0.0.1', int(port))
+    raise ValueError(f"Unknown stream source: {spec}")
+
+
+def micro_batches(lines, batch_size=DEFAULT_BATCH_SIZE, batch_wait=DEFAULT_BATCH_WAIT):
+    # A reader thread drains the (blocking) source into a bounded queue so a
+    # partial batch can still be flushed after batch_wait seconds.
+    # Yields (lines, read times as datetime64[ms]); NMEA reports have no time of their own.
+    line_queue = queue.Queue(maxsize=LINE_QUEUE_SIZE)
+    end = object()
+
+    def read():
+        try:
+            for line in lines:
+                line_queue.put((line, time.time()))
+        except Exception as e:
+            logging.error(f"Error reading AIS stream: {str(e)}")
+        line_queue.put(end)
+
+    threading.Thread(target=read, daemon=True).start()
+
+    def read_times(times):
+        return (np.array(times) * 1000).astype(np.int64).astype('datetime64[ms]')
+
+    batch = []
+    times = []
+    deadline = None
+    while True:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            item = line_queue.get(timeout=timeout)
+        except queue.Empty:
+            item = None
+        if item is end:
+            if batch:
+                yield batch, read_times(times)
+            return
+        if item is not None:
+            batch.append(item[0])
+            times.append(item[1])
+            if deadline is None:
+                deadline = time.monotonic() + batch_wait
+        if batch and (len(batch) >= batch_size or time.monotonic() >= deadline):
+            yield batch, read_times(times)
+            batch = []
+            times = []
+            deadline = None
+
+
+class LineParser:
+    # Parses CSV record lines and raw NMEA !AIVDM/!AIVDO sentences, which may be
+    # mixed in one feed. A CSV header line (starting with MMSI) switches the column order.
+
+    def __init__(self, columns=AIS_COLUMNS):
+        self.columns = list(columns)
+        self.nmea = NmeaDecoder()
+
+    def parse(self, lines, received_at=None):
+        # received_at: read time of each line, used as the time of NMEA reports without a tag block time
+        records = []
+        sentences = []
+        sentence_times = []
+        for i, line in enumerate(lines):
+            line = line.strip()
+            if not line:
+                continue
+            if '!AIVD' in line:
+                sentences.append(line)
+                if received_at is not None:
+                    sentence_times.append(received_at[i])
+                continue
+            if line.startswith('MMSI'):
+                self.columns = [c.strip() for c in line.split(',')]
+                continue
+            records.append(line)
+
+        frames = []
+        if sentences:
+            self.nmea.feed(sentences, sentence_times if received_at is not None else None)
+            frames.append(self.nmea.buffer.to_frame())
+        if records:
+            frames.append(self.parse_csv(records))
+        if not frames:
+            return pd.DataFrame(columns=AIS_COLUMNS)
+        return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+    def parse_csv(self, records):
+        df = pd.read_csv(io.StringIO('\n'.join(records)), names=self.columns, header=None,
+                         on_bad_lines='skip', dtype=str)
+        df['MMSI'] = pd.to_numeric(df['MMSI'], errors='coerce')
+        for column in NUMERIC_COLUMNS:
+            if column in df:
+                df[column] = pd.to_numeric(df[column], errors='coerce')
+        df['BaseDateTime'] = pd.to_datetime(df['BaseDateTime'], errors='coerce')
+        df = df.dropna(subset=[c for c in AIS_COLUMNS if c in df])
+        df['MMSI'] = df['MMSI'].astype('int64')
+        return df
+
+
+class VesselStateTable:
+    # Recent messages per MMSI so deltas and windowed features (loiter_radius)
+    # continue across micro-batches. Bounded: the least recently seen vessels
+    # are forgotten past max_vessels, and each keeps at most history messages.
+    # Kept in a trajectory_store.TrajectoryStore, so lat/lon carried over from
+    # earlier batches are float32 (about a metre) and times whole seconds.
+
+    def __init__(self, max_vessels=DEFAULT_MAX_VESSELS, history=LOITER_WINDOW - 1):
+        self.max_vessels = max_vessels
+        self.history = history
+        self._tracks = TrajectoryStore(max_vessels, history)
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def add_features(self, batch):
+        vessels = pd.unique(batch['MMSI'])
+        recent = self._tracks.windows(vessels, self.history)
+        valid = recent.pop('valid')
+        combined = batch[AIS_COLUMNS].reset_index(drop=True)
+        n_history = int(valid.sum())
+        if n_history:
+            history = pd.DataFrame({
+                'MMSI': np.broadcast_to(vessels[:, None], valid.shape)[valid],
+                'BaseDateTime': recent['seconds'][valid].astype('datetime64[s]'),
+                'LAT': recent['lat'][valid], 'LON': recent['lon'][valid],
+                'SOG': recent['sog'][valid], 'COG': recent['cog'][valid], 'Heading': recent['heading'][valid],
+            }).astype(combined.dtypes.to_dict())
+            combined = pd.concat([history, combined], ignore_index=True)
+        compute_vessel_features(combined)
+
+        new_rows = combined.iloc[n_history:]
+        for name in VESSEL_FEATURES:
+            batch[name] = new_rows[name].to_numpy()
+
+        # Remember this batch's messages, oldest first; each ring keeps the newest history of them
+        self._tracks.add_frame(combined.iloc[n_history:])
+        return batch
+
+
+def read_ais_batches(spec, batch_size=DEFAULT_BATCH_SIZE, batch_wait=DEFAULT_BATCH_WAIT):
+    # Parsed micro-batches (no features yet) with a running index across the feed
+    parser = LineParser()
+    next_index = 0
+    for lines, received_at in micro_batches(open_source(spec), batch_size, batch_wait):
+        batch = parser.parse(lines, received_at)
+        if 'Heading' not in batch:
+            batch['Heading'] = 511
+        if batch.empty:
+            continue
+        batch.index = pd.RangeIndex(next_index, next_index + len(batch))
+        next_index += len(batch)
+        yield batch
+
+
+def featurize_batch(state, batch):
+    # Per-vessel features continued from earlier batches; rows without a usable delta are dropped.
+    # The copy detaches the result so callers can add columns (e.g. anomaly scores) to it.
+    state.add_features(batch)
+    return batch.dropna(subset=AIS_COLUMNS + ['sudden_speed_change']).copy()
+
+
+def read_ais_stream(spec, batch_size=DEFAULT_BATCH_SIZE, batch_wait=DEFAULT_BATCH_WAIT,
+                    max_vessels=DEFAULT_MAX_VESSELS):
+    # Yields feature-complete DataFrames (one per micro-batch) from an unbounded feed
+    state = VesselStateTable(max_vessels)
+    for batch in read_ais_batches(spec, batch_size, batch_wait):
+        batch = featurize_batch(state, batch)
+        if not batch.empty:
+            yield batch
@@ -0,0 +1,64 @@
+import logging
+
+import numpy as np
+
+from features import feature_matrix
+
+# Rows scored per decision_function call; keeps peak memory bounded on large frames
+DEFAULT_CHUNK_SIZE = 65536
+
+
+def score_anomalies(model, X, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Score the whole feature matrix in chunks instead of one predict per row.
+    # predict() is just decision_function() < 0, so one pass gives both outputs.
+    # Online models (online_anomaly.HalfSpaceTrees) also learn from each chunk right after scoring it.
+    # A model_registry.HotSwapModel is resolved once, so the whole frame sees one version.
+    model = getattr(model, 'current', model)
+    online = hasattr(model, 'score_partial_fit')
+    n_rows = len(X)
+    scores = np.empty(n_rows, dtype=np.float64)
+    for start in range(0, n_rows, chunk_size):
+        stop = min(start + chunk_size, n_rows)
+        chunk = X.iloc[start:stop] if hasattr(X, 'iloc') else X[start:stop]
+        scores[start:stop] = model.score_partial_fit(chunk) if online else model.decision_function(chunk)
+    labels = np.where(scores < 0, -1, 1)
+    return scores, labels
+
+
+def feature_contributions(model, X, baseline):
+    # How much each feature pushes each row towards anomalous: the rise in decision_function
+    # when that feature alone is set to its typical (baseline) value. Positive = it contributed.
+    model = getattr(model, 'current', model)
+    scores = model.decision_function(X)
+    contributions = np.empty(X.shape, dtype=np.float32)
+    typical = X.copy()
+    for j in range(X.shape[1]):
+        typical[:, j] = baseline[j]
+        contributions[:, j] = model.decision_function(typical) - scores
+        typical[:, j] = X[:, j]
+    return contributions
+
+
+def add_anomaly_columns(df, model, feature_columns, chunk_size=DEFAULT_CHUNK_SIZE, contributions=True):
+    # Store precomputed results on the frame so the emit loop only serializes.
+    # Anomalous rows also get 'anomaly_contributions': {feature: contribution}, largest first;
+    # the baseline is the training medians kept on the model (feature_baseline_), else this frame's.
+    model = getattr(model, 'current', model)
+    X = feature_matrix(df, feature_columns)
+    scores, labels = score_anomalies(model, X, chunk_size)
+    df['anomaly_score'] = scores
+    df['anomaly'] = (labels == -1).astype(np.int8)
+    if contributions:
+        anomalous = np.flatnonzero(labels == -1)
+        column = np.full(len(df), None, dtype=object)
+        if len(anomalous):
+            baseline = getattr(model, 'feature_baseline_', None)
+            if baseline is None:
+                baseline = np.median(X, axis=0)
+            values = feature_contributions(model, X[anomalous], baseline)
+            order = np.argsort(-values, axis=1)
+            for row, (ranked, row_values) in zip(anomalous, zip(order, values)):
+                column[row] = {feature_columns[j]: round(float(row_values[j]), 4) for j in ranked}
+        df['anomaly_contributions'] = column
+    logging.info(f"Scored {len(df)} rows, {int(df['anomaly'].sum())} anomalies")
+    return df
@@ -0,0 +1,250 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import time
+
+import pandas as pd
+
+from ais_dataset import (AIS_COLUMNS, DEFAULT_MMSI_BUCKETS, filter_ais_frame, is_dataset, read_ais_dataset,
+                         write_ais_dataset)
+from anomaly_scoring import add_anomaly_columns
+from features import LOITER_WINDOW, compute_vessel_features
+
+# Offline backfill: score an AIS archive in parallel and write the scored rows as
+# a Parquet dataset with the ais_dataset layout (so read_ais_dataset and its
+# filters work on the results). A task is one input file, or one
+#   date=.../mmsi_bucket=... partition of an ais_dataset directory.
+# A vessel's track runs through many tasks (daily files, date partitions), so each task is
+# featurized after its vessels' last positions in the task before it: the same mmsi_bucket
+# on the previous date, or the previous file in name order in the same directory. Deltas
+# then continue across task boundaries as in one pass over the whole archive, except for a
+# vessel missing from the previous task. Every input row is written; a row with no earlier
+# position has no deltas, which the model scores as no change. Worker processes read,
+# featurize and score tasks; the parent optionally segments anomalies, writes
+#   OUT/date=.../mmsi_bucket=.../task-<id>.parquet   (all removed first if the task reruns)
+# and records the task in OUT/_backfill_progress.jsonl, which a rerun skips.
+
+PROGRESS_FILE = '_backfill_progress.jsonl'
+INPUT_SUFFIXES = ('.csv', '.csv.gz', '.csv.zip', '.parquet', '.arrow', '.feather')
+# Tasks read, evenly spaced across the archive, when a model has to be fitted for the backfill
+TRAINING_SAMPLE_TASKS = 16
+
+
+def list_tasks(source):
+    if not os.path.isdir(source):
+        return [source]
+    tasks = []
+    for directory, subdirs, files in os.walk(source):
+        subdirs.sort()
+        if '=' in os.path.basename(directory) and any(name.endswith('.parquet') for name in files):
+            tasks.append(directory)
+        else:
+            tasks += [os.path.join(directory, name) for name in sorted(files) if name.endswith(INPUT_SUFFIXES)]
+    return tasks
+
+
+def task_id(task):
+    return hashlib.blake2b(os.path.abspath(task).encode(), digest_size=8).hexdigest()
+
+
+def task_parts(root):
+    # task id -> the part files it wrote under root, in every partition (a rerun may not reach all of them)
+    parts = {}
+    for directory, subdirs, files in os.walk(root):
+        for name in files:
+            if name.startswith('task-') and name.endswith('.parquet'):
+                parts.setdefault(name[len('task-'):-len('.parquet')], []).append(os.path.join(directory, name))
+    return parts
+
+
+def previous_tasks(tasks):
+    # task -> the task before it in time, for the tasks that have one: a partition's
+    # previous date with the same mmsi_bucket, or a file's predecessor by name (daily
+    # AIS archives are named by date)
+    chains = {}
+    for task in tasks:
+        if os.path.isdir(task):
+            date_dir = os.path.dirname(task)
+            chain, position = (os.path.dirname(date_dir), os.path.basename(task)), os.path.basename(date_dir)
+        else:
+            chain, position = os.path.dirname(task), os.path.basename(task)
+        chains.setdefault(chain, []).append((position, task))
+    previous = {}
+    for chain in chains.values():
+        chain.sort()
+        for (_, before), (_, task) in zip(chain, chain[1:]):
+            previous[task] = before
+    return previous
+
+
+def file_stats(path):
+    files = [path] if not os.path.isdir(path) else [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    return [(os.path.basename(f), os.stat(f).st_size, os.stat(f).st_mtime_ns) for f in files]
+
+
+def task_signature(task, filters, previous=None):
+    # Changes when the task's input files, the previous task's (its vessels' history) or the
+    # filters change, so the task is redone
+    stats = file_stats(task) if previous is None else [file_stats(task), file_stats(previous)]
+    return hashlib.blake2b(json.dumps([stats, filters], sort_keys=True, default=str).encode(),
+                           digest_size=16).hexdigest()
+
+
+class BackfillProgress:
+    def __init__(self, root):
+        self.path = os.path.join(root, PROGRESS_FILE)
+        self.done = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from an interrupted run
+                    self.done[entry['task']] = entry
+
+    def is_done(self, task, signature):
+        entry = self.done.get(task)
+        return entry is not None and entry['signature'] == signature
+
+    def mark(self, task, signature, **info):
+        entry = {'task': task, 'signature': signature, **info}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.done[task] = entry
+
+
+def pending_tasks(tasks, out, filters):
+    # Tasks not yet done for their current input files and filters
+    progress = BackfillProgress(out)
+    previous = previous_tasks(tasks)
+    return [task for task in tasks
+            if not progress.is_done(task, task_signature(task, filters or {}, previous.get(task)))]
+
+
+def read_task_rows(task, filters):
+    # The task's AIS rows, filtered like final.load_ais_frame
+    if is_dataset(task):
+        return read_ais_dataset(task, **filters)
+    df = pd.read_csv(task, usecols=lambda column: column in AIS_COLUMNS)
+    df['BaseDateTime'] = pd.to_datetime(df['BaseDateTime'])
+    if filters:
+        df = filter_ais_frame(df, **filters).copy()
+    return df
+
+
+def read_task(task, filters, previous=None):
+    # Every row of the task with vessel features, continued from the last LOITER_WINDOW - 1
+    # positions each of its vessels had in the previous task (enough for every feature)
+    df = read_task_rows(task, filters)
+    source_columns = list(df.columns)
+    n_history = 0
+    if previous is not None:
+        try:
+            history = read_task_rows(previous, filters)
+        except Exception as e:
+            logging.warning(f"{task}: featurizing without {previous}, which can't be read: {type(e).__name__}: {e}")
+        else:
+            history = history[history['MMSI'].isin(df['MMSI'].unique())].reindex(columns=source_columns)
+            history = history.sort_values(['MMSI', 'BaseDateTime'], kind='stable').groupby('MMSI').tail(LOITER_WINDOW - 1)
+            n_history = len(history)
+            df = pd.concat([history, df], ignore_index=True)
+    compute_vessel_features(df)
+    return df.iloc[n_history:].dropna(subset=source_columns).reset_index(drop=True)
+
+
+def training_sample(tasks, filters=None, n_tasks=TRAINING_SAMPLE_TASKS):
+    # Featurized rows from up to n_tasks tasks spread over the whole archive, not just its first file
+    filters = filters or {}
+    step = max(len(tasks) / n_tasks, 1)
+    sample = [tasks[int(i * step)] for i in range(min(n_tasks, len(tasks)))]
+    frames = []
+    for task in sample:
+        try:
+            # Like final.load_ais_frame, only rows with deltas are trained on
+            frames.append(read_task(task, filters).dropna(subset=['sudden_speed_change']))
+        except Exception as e:
+            logging.warning(f"Skipping {task} for training: {type(e).__name__}: {e}")
+    logging.info(f"Training sample: {sum(len(df) for df in frames)} rows from {len(frames)} of {len(tasks)} tasks")
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=AIS_COLUMNS)
+
+
+_worker_model = None
+_worker_feature_columns = None
+
+
+def init_worker(model_bytes, feature_columns):
+    global _worker_model, _worker_feature_columns
+    _worker_model = pickle.loads(model_bytes)
+    _worker_feature_columns = feature_columns
+
+
+def score_task(job):
+    # (task, scored frame or None, seconds, error); an online model keeps learning from this worker's tasks
+    task, previous, filters = job
+    start = time.perf_counter()
+    try:
+        df = read_task(task, filters, previous)
+        if not df.empty:
+            add_anomaly_columns(df, _worker_model, _worker_feature_columns)
+        return task, df, time.perf_counter() - start, None
+    except Exception as e:
+        return task, None, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+
+def run_backfill(source, out, model, feature_columns, workers=None, filters=None, segment=None,
+                 n_buckets=DEFAULT_MMSI_BUCKETS):
+    # segment(df) may add per-row columns (e.g. oil_spill) to each scored task before it is written;
+    # it should add the same columns, with fixed dtypes, to every task so the parts share one schema.
+    # Returns (rows, anomalies, failed tasks); failed tasks are left for the next run.
+    filters = filters or {}
+    tasks = list_tasks(source)
+    progress = BackfillProgress(out)
+    previous = previous_tasks(tasks)
+    signatures = {task: task_signature(task, filters, previous.get(task)) for task in tasks}
+    pending = [task for task in tasks if not progress.is_done(task, signatures[task])]
+    logging.info(f"Backfill of {source}: {len(tasks)} tasks, {len(tasks) - len(pending)} already done")
+
+    rows = anomalies = 0
+    failed = []
+    if not pending:
+        return rows, anomalies, failed
+    parts = task_parts(out)
+    start = time.perf_counter()
+    context = multiprocessing.get_context()
+    with context.Pool(workers, initializer=init_worker, initargs=(pickle.dumps(model), feature_columns)) as pool:
+        results = pool.imap_unordered(score_task, [(task, previous.get(task), filters) for task in pending])
+        for i, (task, df, seconds, error) in enumerate(results, 1):
+            if error is not None:
+                logging.error(f"[{i}/{len(pending)}] {task} failed: {error}")
+                failed.append(task)
+                continue
+            task_anomalies = int(df['anomaly'].sum()) if not df.empty else 0
+            # An earlier run of the task may have written partitions this one doesn't (e.g. other filters)
+            for path in parts.pop(task_id(task), []):
+                os.remove(path)
+            if not df.empty:
+                if segment is not None:
+                    segment(df)
+                if 'anomaly_contributions' in df:
+                    # JSON text; as a struct its type would depend on which rows happen to be anomalous
+                    df['anomaly_contributions'] = pd.array(
+                        [None if c is None else json.dumps(c) for c in df['anomaly_contributions']], dtype='string')
+                write_ais_dataset(df, out, n_buckets, part_name=f"task-{task_id(task)}")
+            progress.mark(task, signatures[task], rows=len(df), anomalies=task_anomalies)
+            rows += len(df)
+            anomalies += task_anomalies
+            elapsed = time.perf_counter() - start
+            logging.info(f"[{i}/{len(pending)}] {task}: {len(df)} rows, {task_anomalies} anomalies "
+                         f"in {seconds:.1f} s; {rows / elapsed:,.0f} rows/s overall")
+    elapsed = time.perf_counter() - start
+    rate = rows / elapsed if elapsed > 0 else 0
+    logging.info(f"Backfilled {rows} rows ({anomalies} anomalies) from {len(pending) - len(failed)} tasks "
+                 f"in {elapsed:.1f} s ({rate:,.0f} rows/s), {len(failed)} failed")
+    return rows, anomalies, failed
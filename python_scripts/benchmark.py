@@ -0,0 +1,812 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def make_synthetic_ais(n_rows, n_vessels=1, seed=42, days=1):
+    # Random-walk AIS tracks with the same columns as anomalous_dataset.csv
+    rng = np.random.default_rng(seed)
+    mmsi = rng.integers(200000000, 800000000, size=n_vessels)[rng.integers(0, n_vessels, size=n_rows)]
+    start = np.datetime64('2023-02-22T00:00:00')
+    times = start + np.sort(rng.integers(0, days * 86400, size=n_rows)).astype('timedelta64[s]')
+    df = pd.DataFrame({
+        'MMSI': mmsi,
+        'BaseDateTime': times,
+        'LAT': 33.0 + rng.normal(0, 0.5, n_rows),
+        'LON': -78.0 + rng.normal(0, 0.5, n_rows),
+        'SOG': np.clip(rng.normal(6, 2, n_rows), 0, None).round(1),
+        'COG': rng.uniform(0, 360, n_rows).round(1),
+        'Heading': rng.integers(0, 360, n_rows),
+    })
+    return df
+
+
+# Kinds of anomaly injected by make_synthetic_tracks
+INJECTED_ANOMALIES = {1: 'speed jump', 2: 'position jump', 3: 'AIS gap', 4: 'sharp turn', 5: 'drifting'}
+
+
+def make_synthetic_tracks(n_rows, n_vessels, anomaly_rate=0.01, seed=42):
+    # Dead-reckoned tracks (steady speed, slowly wandering course) with labelled injected anomalies;
+    # returns the frame and each row's INJECTED_ANOMALIES kind (0 = normal)
+    rng = np.random.default_rng(seed)
+    vessel = np.sort(rng.integers(0, n_vessels, size=n_rows))
+    dt = rng.integers(30, 120, size=n_rows).astype(np.float64)
+    sog = rng.uniform(5, 20, size=n_vessels)[vessel] + rng.normal(0, 0.3, n_rows)
+    cog = rng.uniform(0, 360, size=n_vessels)[vessel] + np.cumsum(rng.normal(0, 1, n_rows))
+
+    kind = np.zeros(n_rows, dtype=np.int64)
+    rows = rng.choice(n_rows, size=int(n_rows * anomaly_rate), replace=False)
+    kind[rows] = rng.integers(1, len(INJECTED_ANOMALIES) + 1, size=len(rows))
+    sog[kind == 1] += 10
+    dt[kind == 3] += 3 * 3600
+    cog += 120 * np.cumsum(kind == 4)  # the vessel keeps its new course
+    heading = cog + rng.normal(0, 2, n_rows)
+    heading[kind == 5] += 90
+
+    # Integrate positions per vessel from speed, course and elapsed time
+    step_m = np.clip(sog, 0, None) * dt * 1852 / 3600
+    frame = pd.DataFrame({'vessel': vessel, 'dlat': step_m * np.cos(np.radians(cog)) / 111320,
+                          'dlon': step_m * np.sin(np.radians(cog)) / (111320 * np.cos(np.radians(33))), 'dt': dt})
+    moves = frame.groupby('vessel')[['dlat', 'dlon', 'dt']].cumsum()
+    lat = 33.0 + rng.uniform(-1, 1, size=n_vessels)[vessel] + moves['dlat'].to_numpy()
+    lon = -78.0 + rng.uniform(-1, 1, size=n_vessels)[vessel] + moves['dlon'].to_numpy()
+    lat[kind == 2] += 0.2  # one spoofed/glitched position
+    times = np.datetime64('2023-02-22T00:00:00') + moves['dt'].to_numpy().astype('timedelta64[s]')
+    df = pd.DataFrame({
+        'MMSI': 200000000 + vessel,
+        'BaseDateTime': times,
+        'LAT': lat,
+        'LON': lon,
+        'SOG': np.clip(sog, 0, None).round(1),
+        'COG': (cog % 360).round(1),
+        'Heading': np.round(heading % 360).astype(np.int64),
+    })
+    return df, kind
+
+
+def report(name, count, elapsed, unit='rows'):
+    rate = count / elapsed if elapsed > 0 else float('inf')
+    print(f"{name:<40} {count:>10} {unit:<8} {elapsed:>9.3f} s  {rate:>14,.0f} {unit}/s")
+
+
+def bench_scoring(args):
+    from sklearn.ensemble import IsolationForest
+    from anomaly_scoring import score_anomalies
+
+    df = make_synthetic_ais(args.rows)
+    df['sudden_speed_change'] = abs(df['SOG'] - df['SOG'].shift(1))
+    df = df.dropna()
+    X = df[['sudden_speed_change']]
+    iso_forest = IsolationForest(contamination=0.02, random_state=42).fit(X)
+
+    # Old path: one-row DataFrame and predict() per AIS message
+    n_loop = min(len(df), args.loop_rows)
+    start = time.perf_counter()
+    for _, row in df.head(n_loop).iterrows():
+        row_features = pd.DataFrame({'sudden_speed_change': [row['sudden_speed_change']]})
+        iso_forest.predict(row_features)[0]
+    report('per-row predict (iterrows)', n_loop, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    score_anomalies(iso_forest, X)
+    report('vectorized decision_function', len(df), time.perf_counter() - start)
+
+
+def bench_multivariate(args):
+    # sudden_speed_change alone vs the multivariate feature matrix, on tracks with injected anomalies
+    import warnings
+    from sklearn.ensemble import IsolationForest
+    from anomaly_scoring import feature_contributions, score_anomalies
+    from features import ANOMALY_FEATURES, compute_vessel_features, feature_matrix
+
+    warnings.filterwarnings('ignore')
+    df, kind = make_synthetic_tracks(args.rows, args.vessels)
+    start = time.perf_counter()
+    compute_vessel_features(df)
+    report('all vessel features', len(df), time.perf_counter() - start)
+    keep = df['sudden_speed_change'].notna().to_numpy()
+    df, kind = df[keep], kind[keep]
+    start = time.perf_counter()
+    X = feature_matrix(df, ANOMALY_FEATURES)
+    report(f'float32 feature matrix ({X.shape[1]} columns)', len(X), time.perf_counter() - start)
+
+    for columns in (['sudden_speed_change'], ANOMALY_FEATURES):
+        features = feature_matrix(df, columns)
+        model = IsolationForest(contamination=0.02, random_state=42).fit(features)
+        start = time.perf_counter()
+        _, labels = score_anomalies(model, features)
+        report(f'score {len(columns)} feature(s)', len(X), time.perf_counter() - start)
+        flagged = labels == -1
+        caught = ', '.join(f"{name} {np.mean(flagged[kind == k]):.0%}" for k, name in INJECTED_ANOMALIES.items())
+        print(f"  flagged {flagged.sum()} rows; injected anomalies caught: {caught}")
+
+    anomalous = np.flatnonzero(flagged)
+    start = time.perf_counter()
+    contributions = feature_contributions(model, X[anomalous], np.median(X, axis=0))
+    report('contributions for flagged rows', len(anomalous), time.perf_counter() - start)
+    top = np.array(ANOMALY_FEATURES)[contributions.argmax(axis=1)]
+    for k, name in INJECTED_ANOMALIES.items():
+        found = top[kind[anomalous] == k]
+        if len(found):
+            values, counts = np.unique(found, return_counts=True)
+            print(f"  {name:<14} top contributor: {values[counts.argmax()]} ({counts.max() / len(found):.0%} of {len(found)})")
+
+
+def bench_online(args):
+    # Refit-per-restart IsolationForest vs half-space trees that learn while scoring
+    import pickle
+    from sklearn.ensemble import IsolationForest
+    from features import compute_vessel_features
+    from online_anomaly import HalfSpaceTrees
+
+    df = make_synthetic_ais(args.rows, args.vessels)
+    compute_vessel_features(df)
+    X = df[['sudden_speed_change']].dropna().to_numpy()
+
+    start = time.perf_counter()
+    iso_forest = IsolationForest(contamination=0.02, random_state=42).fit(X)
+    report('IsolationForest fit (every restart)', len(X), time.perf_counter() - start)
+    start = time.perf_counter()
+    batch_labels = iso_forest.predict(X) == -1
+    report('IsolationForest score', len(X), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    online = HalfSpaceTrees(contamination=0.02, random_state=42).fit(X[:1000])
+    report('half-space trees bootstrap', 1000, time.perf_counter() - start)
+    state_bytes = len(pickle.dumps(online))
+    start = time.perf_counter()
+    online_labels = np.concatenate([online.score_partial_fit(X[i:i + args.batch_size]) < 0
+                                    for i in range(0, len(X), args.batch_size)])
+    report(f'half-space trees score+learn, batch {args.batch_size}', len(X), time.perf_counter() - start)
+
+    n_loop = min(len(X), args.loop_rows)
+    single = HalfSpaceTrees(contamination=0.02, random_state=42).fit(X[:1000])
+    start = time.perf_counter()
+    for i in range(n_loop):
+        single.score_partial_fit(X[i:i + 1])
+    elapsed = time.perf_counter() - start
+    report('half-space trees score+learn, 1 record', n_loop, elapsed)
+    print(f"per-record latency {elapsed / n_loop * 1e6:.0f} us; model state {state_bytes / 1024:.0f} KB "
+          f"(IsolationForest: {len(pickle.dumps(iso_forest)) / 1024:.0f} KB)")
+
+    both = np.sum(batch_labels & online_labels)
+    print(f"label agreement {np.mean(batch_labels == online_labels):.2%}; anomalies: IsolationForest "
+          f"{batch_labels.sum()}, half-space trees {online_labels.sum()}, both {both} "
+          f"(recall {both / max(batch_labels.sum(), 1):.2%}, precision {both / max(online_labels.sum(), 1):.2%})")
+
+
+def registry_load_run(root, name, mmap):
+    # Model load in a fresh process (run_fresh): seconds, peak RSS. sklearn is imported
+    # first, as final.py already has it loaded when the model is read.
+    import joblib
+    import sklearn.ensemble
+    from model_registry import ModelRegistry
+
+    start = time.perf_counter()
+    ModelRegistry(root).load(name, mmap=mmap)
+    return time.perf_counter() - start, peak_rss_mb()
+
+
+def bench_registry(args):
+    # Refitting on start vs loading a registered model, and scoring latency across a hot swap
+    import shutil
+    import tempfile
+    import threading
+    from sklearn.ensemble import IsolationForest
+    from features import compute_vessel_features
+    from model_registry import HotSwapModel, ModelRegistry, data_fingerprint
+    from anomaly_scoring import score_anomalies
+
+    df = make_synthetic_ais(args.rows, args.vessels)
+    compute_vessel_features(df)
+    X = df[['sudden_speed_change']].dropna()
+    root = tempfile.mkdtemp()
+    try:
+        registry = ModelRegistry(root)
+        for n_estimators in (100, 1000):
+            name = f'forest-{n_estimators}'
+            start = time.perf_counter()
+            model = IsolationForest(n_estimators=n_estimators, contamination=0.02, random_state=42).fit(X)
+            fit_seconds = time.perf_counter() - start
+            registry.save(name, model, list(X.columns), data_fingerprint(X))
+            print(f"{name:<16} fit {fit_seconds:>7.3f} s")
+            for mmap in (False, True):
+                elapsed, peak_mb = run_fresh(registry_load_run, root, name, mmap)
+                print(f"{name:<16} load{' (mmap)' if mmap else '       '} {elapsed * 1000:>8.1f} ms  peak RSS {peak_mb:>6.0f} MB")
+
+        # Score micro-batches while a retrain runs in the background, then swaps
+        batches = [X.iloc[i:i + args.batch_size] for i in range(0, len(X), args.batch_size)]
+        holder = HotSwapModel(registry.load('forest-100')[0])
+
+        def score_all():
+            latencies = []
+            for batch in batches:
+                start = time.perf_counter()
+                score_anomalies(holder, batch)
+                latencies.append(time.perf_counter() - start)
+            return np.array(latencies) * 1000
+
+        quiet = score_all()
+        thread = holder.retrain_async(lambda: (IsolationForest(contamination=0.02, random_state=1).fit(X), {}))
+        busy = score_all()
+        thread.join()
+        for label, latencies in (('no retrain', quiet), ('during retrain', busy)):
+            print(f"batch of {args.batch_size} scored, {label:<15} p50 {np.median(latencies):>7.1f} ms  "
+                  f"max {latencies.max():>7.1f} ms")
+    finally:
+        shutil.rmtree(root)
+
+
+def bench_segmentation(args):
+    import glob
+    from tensorflow.keras.models import load_model
+    from segmentation import load_scene, segment_images
+
+    unet_model = load_model(args.model)
+    scenes = [load_scene(path)[1] for path in sorted(glob.glob('images/*.jpg'))]
+    scenes = [scenes[i % len(scenes)] for i in range(args.images)]
+
+    # Warm up graph tracing before timing
+    segment_images(unet_model, scenes[:1], 1)
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        segment_images(unet_model, scenes, batch_size)
+        report(f'U-Net batch_size={batch_size}', len(scenes), time.perf_counter() - start, 'images')
+
+
+def bench_tiled(args):
+    # Full-resolution tiled inference on a synthetic scene; --model as for the segmentation benchmark
+    import resource
+    from tensorflow.keras.models import load_model
+    from tiled_segmentation import segment_tiled
+
+    unet_model = load_model(args.model)
+    rng = np.random.default_rng(0)
+    scene = rng.integers(0, 256, size=(args.scene_size, args.scene_size, 3), dtype=np.uint8)
+    segment_tiled(unet_model, scene[:256, :256])
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        result = segment_tiled(unet_model, scene, args.overlap, batch_size)
+        report(f'tiled batch_size={batch_size}', result['tiles'], time.perf_counter() - start, 'tiles')
+    print(f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB "
+          f"for a {scene.nbytes / 2 ** 20:.0f} MB scene")
+
+
+def scene_memory_run(mode, path, tile):
+    # Runs in a fresh process (run_fresh) so its peak RSS is this access pattern alone
+    import cv2
+    from scene_reader import open_scene, read_window, thumbnail
+
+    start = time.perf_counter()
+    if mode == 'imports only':
+        pass
+    elif mode == 'cv2.imread + resize (current)':
+        image = cv2.cvtColor(cv2.imread(path, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+        cv2.resize(image, (256, 256))
+    elif mode == 'cv2.imread + all tiles':
+        image = cv2.cvtColor(cv2.imread(path, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+        for y in range(0, image.shape[0], tile):
+            for x in range(0, image.shape[1], tile):
+                image[y:y + tile, x:x + tile].astype(np.float32)
+    else:
+        scene = open_scene(path)
+        if mode == 'mmap one window':
+            np.array(read_window(scene, (0, tile), (0, tile)))
+        elif mode == 'mmap thumbnail':
+            thumbnail(scene, 1024)
+        else:
+            for y in range(0, scene.shape[0], tile):
+                for x in range(0, scene.shape[1], tile):
+                    read_window(scene, (y, y + tile), (x, x + tile)).astype(np.float32)
+    return time.perf_counter() - start, peak_rss_mb()
+
+
+def peak_rss_mb():
+    # VmHWM rather than ru_maxrss, which survives exec and so includes the parent's peak
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmHWM:')) / 1024
+
+
+def run_fresh(fn, *args):
+    # fn(*args) in a freshly spawned process, so its peak RSS is its own
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def bench_scene_memory(args):
+    # Peak RSS of reading a large uncompressed TIFF through cv2.imread vs the memory-mapped reader
+    import os
+    import tempfile
+    import cv2
+
+    size = args.scene_size
+    rng = np.random.default_rng(0)
+    path = os.path.join(tempfile.mkdtemp(), 'scene.tif')
+    cv2.imwrite(path, rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8), [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+    print(f"{size}x{size} RGB scene, {os.path.getsize(path) / 2 ** 20:.0f} MB uncompressed")
+    modes = ['imports only', 'cv2.imread + resize (current)', 'cv2.imread + all tiles', 'mmap one window', 'mmap thumbnail',
+             'mmap all tiles']
+    try:
+        for mode in modes:
+            elapsed, peak_mb = run_fresh(scene_memory_run, mode, path, 256)
+            print(f"{mode:<40} {elapsed:>8.3f} s  peak RSS {peak_mb:>8.0f} MB")
+    finally:
+        os.remove(path)
+
+
+def dataset_load_run(mode, csv_path, root, filters):
+    # One load in a fresh process (run_fresh): rows returned, seconds, peak RSS
+    from ais_dataset import AIS_COLUMNS, filter_ais_frame, read_ais_dataset
+
+    start = time.perf_counter()
+    if mode == 'csv':
+        df = pd.read_csv(csv_path)
+        df['BaseDateTime'] = pd.to_datetime(df['BaseDateTime'])
+        df = filter_ais_frame(df, **filters)
+    else:
+        df = read_ais_dataset(root, columns=AIS_COLUMNS, **filters)
+    return len(df), time.perf_counter() - start, peak_rss_mb()
+
+
+def bench_dataset(args):
+    # CSV (read everything, filter in pandas) vs the partitioned Parquet dataset with pushdown
+    import os
+    import shutil
+    import tempfile
+    from ais_dataset import write_ais_dataset
+
+    df = make_synthetic_ais(args.rows, args.vessels, days=args.days)
+    directory = tempfile.mkdtemp()
+    csv_path, root = os.path.join(directory, 'ais.csv'), os.path.join(directory, 'ais_parquet')
+    try:
+        df.to_csv(csv_path, index=False)
+        write_ais_dataset(df, root)
+        parquet_bytes = sum(os.path.getsize(os.path.join(d, name)) for d, _, names in os.walk(root) for name in names)
+        print(f"{len(df)} rows, {args.vessels} vessels over {args.days} days: CSV {os.path.getsize(csv_path) / 2 ** 20:.1f} MB, "
+              f"Parquet {parquet_bytes / 2 ** 20:.1f} MB")
+
+        day = pd.Timestamp('2023-02-22') + pd.Timedelta(days=args.days // 2)
+        queries = {
+            'everything': {},
+            'one day': {'start': day, 'end': day + pd.Timedelta(days=1)},
+            'bounding box': {'bbox': (-78.2, 32.8, -77.8, 33.2)},
+            'three vessels': {'mmsi': df['MMSI'].unique()[:3].tolist()},
+            'one day, box, three vessels': {'start': day, 'end': day + pd.Timedelta(days=1),
+                                            'bbox': (-78.2, 32.8, -77.8, 33.2),
+                                            'mmsi': df['MMSI'].unique()[:3].tolist()},
+        }
+        for name, filters in queries.items():
+            for mode in ('csv', 'parquet'):
+                rows, elapsed, peak_mb = run_fresh(dataset_load_run, mode, csv_path, root, filters)
+                print(f"{mode + ' ' + name:<40} {rows:>10} rows {elapsed:>9.3f} s  peak RSS {peak_mb:>6.0f} MB")
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_polygons(args):
+    # Vectorizing a scene full of slicks vs shipping the colourised mask as a PNG
+    import json
+    import cv2
+    from overlay_render import colorize_mask, compose_overlay, encode_png
+    from segmentation import load_scene
+    from spill_polygons import vectorize_spills
+
+    size = args.scene_size
+    rng = np.random.default_rng(0)
+    mask = np.ones((size, size), dtype=np.uint8)
+    for _ in range(args.components):
+        x, y = rng.integers(0, size, 2)
+        axes = (int(rng.integers(2, 40)), int(rng.integers(2, 12)))
+        cv2.ellipse(mask, (int(x), int(y)), axes, float(rng.uniform(0, 180)), 0, 360, 2, -1)
+
+    start = time.perf_counter()
+    spills = vectorize_spills(mask, bounds=(-79.0, 33.0, -78.0, 34.0))
+    report('label + contours + GeoJSON', len(spills['features']), time.perf_counter() - start, 'spills')
+    geojson = json.dumps(spills, separators=(',', ':')).encode()
+    mask_png = encode_png(colorize_mask(mask))
+    # What the dashboard gets today: the scene next to its mask (demo image stretched to scene size)
+    scene = cv2.resize(load_scene('images/img_0003.jpg')[0], (size, size))
+    overlay_png = encode_png(compose_overlay(scene, mask))
+    print(f"GeoJSON {len(geojson) / 1024:.0f} kB vs mask PNG {len(mask_png) / 1024:.0f} kB, "
+          f"overlay PNG {len(overlay_png) / 1024:.0f} kB ({spills['total_area_km2']:.1f} km2 of oil)")
+
+
+def bench_vessel_index(args):
+    # Insert --rows positions in --batch-size chunks, then time radius/time-window queries
+    from features import epoch_seconds
+    from vessel_index import VesselIndex
+
+    df = make_synthetic_ais(args.rows, args.vessels)
+    seconds = epoch_seconds(df['BaseDateTime'].values)
+    columns = (df['MMSI'].to_numpy(), seconds, df['LAT'].to_numpy(), df['LON'].to_numpy())
+    index = VesselIndex()
+    start = time.perf_counter()
+    for i in range(0, args.rows, args.batch_size):
+        index.add(*(column[i:i + args.batch_size] for column in columns))
+    report('index inserts', args.rows, time.perf_counter() - start)
+
+    end = int(seconds.max())
+    rng = np.random.default_rng(1)
+    centres = np.column_stack((33.0 + rng.normal(0, 0.5, args.queries), -78.0 + rng.normal(0, 0.5, args.queries)))
+    index.query(33.0, -78.0, 20, end - 6 * 3600, end)  # merges pending inserts
+    start = time.perf_counter()
+    for lat, lon in centres:
+        index.nearby_vessels(lat, lon, 20, end - 6 * 3600, end, 20)
+    elapsed = time.perf_counter() - start
+    found = sum(len(index.query(lat, lon, 20, end - 6 * 3600, end)['mmsi']) for lat, lon in centres)
+    report('query + nearest 20 vessels, 20 km / 6 h', args.queries, elapsed, 'queries')
+    print(f"{elapsed / args.queries * 1000:.2f} ms per query, {found / args.queries:.0f} positions in range")
+
+
+def bench_sharded(args):
+    # Features + scoring throughput inline vs sharded over worker processes, same batches
+    import os
+    import warnings
+    from sklearn.ensemble import IsolationForest
+    from ais_stream import VesselStateTable, featurize_batch
+    from anomaly_scoring import add_anomaly_columns
+    from features import ANOMALY_FEATURES, feature_matrix
+    from sharded import ShardedScorer
+
+    warnings.filterwarnings('ignore')
+    df = make_synthetic_ais(args.rows, args.vessels)
+    df.index = pd.RangeIndex(len(df))
+    batches = [df.iloc[i:i + args.batch_size].copy() for i in range(0, len(df), args.batch_size)]
+    training = featurize_batch(VesselStateTable(), df.iloc[:20000].copy())
+    model = IsolationForest(contamination=0.02, random_state=42).fit(feature_matrix(training, ANOMALY_FEATURES))
+    print(f"{os.cpu_count()} CPUs, {len(batches)} batches of {args.batch_size} rows, {args.vessels} vessels")
+
+    state = VesselStateTable()
+    start = time.perf_counter()
+    for batch in batches:
+        add_anomaly_columns(featurize_batch(state, batch.copy()), model, ANOMALY_FEATURES)
+    inline = time.perf_counter() - start
+    report('inline', args.rows, inline)
+
+    for workers in args.workers:
+        scorer = ShardedScorer(model, ANOMALY_FEATURES, workers)
+        start = time.perf_counter()
+        for _ in scorer.map(batch.copy() for batch in batches):
+            pass
+        elapsed = time.perf_counter() - start
+        scorer.close()
+        report(f'{workers} shards ({inline / elapsed:.2f}x inline)', args.rows, elapsed)
+
+
+def bench_async_segmentation(args):
+    # Per-record emit latency with segmentation inline vs in the background stage. U-Net is
+    # simulated with a fixed --segment-ms so the comparison doesn't depend on TensorFlow;
+    # records arrive every --record-ms.
+    from segmentation_jobs import BackgroundJobs
+
+    rng = np.random.default_rng(0)
+    anomalies = rng.random(args.loop_rows) < 0.02
+    segment_seconds = args.segment_ms / 1000
+
+    def segment(job):
+        time.sleep(segment_seconds)
+
+    print(f"{args.loop_rows} records every {args.record_ms} ms, {anomalies.sum()} anomalies, "
+          f"{args.segment_ms:.0f} ms per segmentation")
+    for mode in ('inline', 'background'):
+        jobs = BackgroundJobs(segment, max_pending=args.segmentation_queue) if mode == 'background' else None
+        latencies = np.empty(args.loop_rows)
+        start = time.perf_counter()
+        for i, anomaly in enumerate(anomalies):
+            time.sleep(args.record_ms / 1000)
+            emitted = time.perf_counter()
+            if anomaly:
+                if jobs is None:
+                    segment(None)
+                else:
+                    jobs.submit(i)
+            latencies[i] = time.perf_counter() - emitted
+        elapsed = time.perf_counter() - start
+        if jobs is not None:
+            jobs.drain()
+        skipped = '' if jobs is None else f", {jobs.rejected} skipped, all results after {time.perf_counter() - start:.2f} s"
+        print(f"{mode:<12} emit p50 {np.median(latencies) * 1e6:>8.1f} us  p99 {np.percentile(latencies, 99) * 1e3:>8.2f} ms  "
+              f"max {latencies.max() * 1e3:>8.2f} ms  stream done in {elapsed:.2f} s{skipped}")
+
+
+def bench_replay(args):
+    # Replay pacing: sleeping for each row's gap after emitting it (the previous loop) vs the
+    # monotonic replay clock, both playing --loop-rows records from one synthetic day at --speed;
+    # then unthrottled emission (speed 0, as in a backfill) one record per write vs clock batches.
+    # Records go to a framed writer on /dev/null, so only pacing and serialization are measured.
+    import os
+    from ipc import open_writer
+    from replay import ReplayClock, replay_schedule
+
+    writer = open_writer(os.open(os.devnull, os.O_WRONLY))
+
+    def as_records(df):
+        return df.assign(BaseDateTime=df['BaseDateTime'].astype(str)).to_dict('records')
+
+    records = as_records(make_synthetic_ais(args.loop_rows, args.vessels))
+    _, offsets = replay_schedule(pd.Series([r['BaseDateTime'] for r in records]), args.speed)
+    print(f"{len(records)} records over {offsets[-1]:.2f} s at {args.speed:g}x")
+
+    lags = np.empty(len(records))
+    start = time.monotonic()
+    for i, record in enumerate(records):
+        lags[i] = time.monotonic() - start - offsets[i]
+        writer.write_records([record])
+        if i + 1 < len(records):
+            time.sleep(offsets[i + 1] - offsets[i])
+    elapsed = time.monotonic() - start
+    print(f"{'sleep per row (previous)':<28} done in {elapsed:.3f} s ({len(records) / elapsed:,.0f} records/s), "
+          f"final lag {lags[-1] * 1000:.0f} ms, max {lags.max() * 1000:.0f} ms")
+
+    clock = ReplayClock(offsets)
+    for first, stop in clock.batches():
+        writer.write_records(records[first:stop])
+    print(f"{'replay clock':<28} {clock.summary()}")
+
+    records = as_records(make_synthetic_ais(args.rows, args.vessels))
+    start = time.perf_counter()
+    for record in records:
+        writer.write_records([record])
+    report('unthrottled, one per write', len(records), time.perf_counter() - start, 'records')
+    clock = ReplayClock(np.zeros(len(records)))
+    for first, stop in clock.batches():
+        writer.write_records(records[first:stop])
+    report(f'unthrottled, clock batches of {clock.max_batch}', len(records), clock.elapsed, 'records')
+
+
+def bench_trajectories(args):
+    # Per-vessel ring buffers: footprint for --vessels vessels, batched and single appends, windowed reads
+    from features import epoch_seconds
+    from trajectory_store import DEFAULT_CAPACITY, TrajectoryStore
+
+    store = TrajectoryStore(args.vessels, DEFAULT_CAPACITY)
+    print(f"{args.vessels} vessels x {DEFAULT_CAPACITY} positions: {store.nbytes / 2 ** 20:.1f} MB of arrays "
+          f"(1M vessels: {TrajectoryStore.bytes_per_vessel() * 1e6 / 2 ** 30:.2f} GB)")
+    df = make_synthetic_ais(args.rows, args.vessels)
+    columns = [df['MMSI'].to_numpy(), epoch_seconds(df['BaseDateTime'].values), df['LAT'].to_numpy(),
+               df['LON'].to_numpy(), df['SOG'].to_numpy(), df['COG'].to_numpy(), df['Heading'].to_numpy()]
+
+    start = time.perf_counter()
+    for i in range(0, args.rows, args.batch_size):
+        store.append_batch(*(column[i:i + args.batch_size] for column in columns))
+    report(f'append_batch ({args.batch_size} per call)', args.rows, time.perf_counter() - start)
+
+    rows = list(zip(*(column[:args.loop_rows].tolist() for column in columns)))
+    start = time.perf_counter()
+    for row in rows:
+        store.append(*row)
+    report('append (one position)', len(rows), time.perf_counter() - start)
+
+    rng = np.random.default_rng(0)
+    vessels = pd.unique(df['MMSI'])
+    queries = [rng.choice(vessels, size=min(500, len(vessels)), replace=False) for _ in range(args.queries)]
+    start = time.perf_counter()
+    for query in queries:
+        store.windows(query, 9)
+    report('windows (last 9, 500 vessels per call)', len(queries) * len(queries[0]), time.perf_counter() - start,
+           'vessels')
+
+
+def track_deviation_m(df, keep):
+    # Largest distance of a dropped position from its vessel's drawn line (straight segments between kept
+    # ones), leaving out segments that end at an anomaly: a position jump is drawn as the spike it is
+    from track_simplify import _local_xy
+
+    df = df.assign(kept=keep).sort_values(['MMSI', 'BaseDateTime'], kind='stable')
+    kept = df['kept'].to_numpy()
+    lat, lon = df['LAT'].to_numpy(), df['LON'].to_numpy()
+    # For every row, the kept rows before and after it in its vessel's track
+    index = np.arange(len(df))
+    before = np.maximum.accumulate(np.where(kept, index, 0))
+    after = np.minimum.accumulate(np.where(kept, index, len(df) - 1)[::-1])[::-1]
+    dropped = ~kept & (df['MMSI'].to_numpy()[before] == df['MMSI'].to_numpy()[after])
+    dropped &= df['anomaly'].to_numpy()[after] == 0
+    s, e, p = before[dropped], after[dropped], index[dropped]
+    px, py = _local_xy(lat[s], lon[s], lat[p], lon[p])
+    bx, by = _local_xy(lat[s], lon[s], lat[e], lon[e])
+    length2 = np.maximum(bx * bx + by * by, 1e-9)
+    t = np.clip((px * bx + py * by) / length2, 0, 1)
+    distance = np.hypot(px - t * bx, py - t * by)
+    return distance.max(initial=0.0)
+
+
+def bench_simplify(args):
+    # Positions sent to the map: all of them (previous) vs Douglas-Peucker over whole frames (replays)
+    # vs the dead-reckoning deadband on --batch-size micro-batches (streams), at --tolerance metres.
+    # Payload is the records as JSON; deviation is how far a dropped point is from the drawn line.
+    import json
+    from features import epoch_seconds
+    from track_simplify import DeadReckoningFilter, simplify_frame
+
+    df, kind = make_synthetic_tracks(args.rows, args.vessels)
+    df['anomaly'] = (kind > 0).astype(np.int8)
+    df = df.sort_values('BaseDateTime', kind='stable').reset_index(drop=True)
+    records = df.assign(BaseDateTime=df['BaseDateTime'].astype(str)).to_dict('records')
+
+    def payload_mb(keep):
+        return sum(len(json.dumps(record)) for record, k in zip(records, keep) if k) / 2 ** 20
+
+    print(f"{len(df)} positions of {args.vessels} vessels, {int(df['anomaly'].sum())} anomalies, "
+          f"tolerance {args.tolerance:g} m")
+    start = time.perf_counter()
+    dp_keep = simplify_frame(df, args.tolerance)
+    dp_seconds = time.perf_counter() - start
+
+    deadband = DeadReckoningFilter(args.tolerance)
+    start = time.perf_counter()
+    dr_keep = np.concatenate([deadband.filter_frame(df.iloc[i:i + args.batch_size])
+                              for i in range(0, len(df), args.batch_size)])
+    dr_seconds = time.perf_counter() - start
+
+    everything = np.ones(len(df), dtype=bool)
+    for name, keep, seconds in (('every position (previous)', everything, 0.0),
+                                ('Douglas-Peucker, whole frame', dp_keep, dp_seconds),
+                                (f'dead reckoning, batches of {args.batch_size}', dr_keep, dr_seconds)):
+        anomalies_kept = int((keep & (df['anomaly'].to_numpy() == 1)).sum())
+        rate = f"{len(df) / seconds:>12,.0f} rows/s" if seconds else ' ' * 19
+        print(f"{name:<36} {int(keep.sum()):>9} sent ({len(df) / keep.sum():>5.1f}x fewer)  {rate}  "
+              f"{payload_mb(keep):>7.2f} MB  {anomalies_kept} anomalies  "
+              f"max deviation {track_deviation_m(df, keep):>6.1f} m")
+
+
+def bench_render(args):
+    from overlay_render import render_lut, render_matplotlib
+    from segmentation import IMG_CLASSES, load_scene
+
+    image_resized, _ = load_scene('images/img_0003.jpg')
+    rng = np.random.default_rng(0)
+    masks = [rng.integers(0, IMG_CLASSES, size=image_resized.shape[:2]).astype(np.uint8) for _ in range(args.images)]
+
+    for name, render in (('matplotlib figure + savefig', render_matplotlib), ('palette LUT + cv2.imencode', render_lut)):
+        render(image_resized, masks[0])
+        start = time.perf_counter()
+        for mask in masks:
+            render(image_resized, mask)
+        report(name, len(masks), time.perf_counter() - start, 'images')
+
+
+def bench_features(args):
+    from features import compute_vessel_features
+
+    df = make_synthetic_ais(args.rows, args.vessels)
+    start = time.perf_counter()
+    compute_vessel_features(df)
+    report(f'grouped vector features ({args.vessels} MMSIs)', len(df), time.perf_counter() - start)
+
+    # Reference: the same speed delta with a pandas groupby per call
+    start = time.perf_counter()
+    ordered = df.sort_values(['MMSI', 'BaseDateTime'])
+    ordered.groupby('MMSI')['SOG'].diff().abs()
+    report('pandas sort + groupby diff (speed only)', len(df), time.perf_counter() - start)
+
+
+def bench_nmea(args):
+    from nmea import NmeaDecoder, encode_position_report
+
+    if args.nmea_log:
+        with open(args.nmea_log) as f:
+            sentences = f.read().splitlines()
+    else:
+        df = make_synthetic_ais(args.rows, args.vessels)
+        sentences = [encode_position_report(*values) for values in
+                     df[['MMSI', 'LAT', 'LON', 'SOG', 'COG', 'Heading']].itertuples(index=False, name=None)]
+
+    decoder = NmeaDecoder()
+    start = time.perf_counter()
+    for i in range(0, len(sentences), args.batch_size):
+        decoder.feed(sentences[i:i + args.batch_size])
+        decoder.buffer.to_frame()
+    report(f'NMEA decode (batch {args.batch_size})', len(sentences), time.perf_counter() - start, 'sentences')
+    if decoder.rejected:
+        print(f"rejected {decoder.rejected} sentences")
+
+
+def bench_ipc_emit(args):
+    # Producer half of the IPC benchmark; run through bench_ipc.js, which owns fd 3
+    import sys
+    from ipc import open_writer
+
+    writer = open_writer(3 if args.protocol == 'framed' else None)
+    record = {
+        'MMSI': 232029847, 'BaseDateTime': '2023-02-22T22:01:18', 'SOG': 6.3, 'COG': 235.2, 'LAT': 33.68298, 'LON': -78.24927,
+        'Change': 0.8, 'anomaly': 0, 'oil_spill': 0, 'image_path': None,
+    }
+    start = time.perf_counter()
+    for i in range(0, args.rows, args.batch_size):
+        writer.write_records([record] * min(args.batch_size, args.rows - i))
+    elapsed = time.perf_counter() - start
+    print(f"python emit: {args.rows / elapsed:,.0f} records/s", file=sys.stderr)
+
+
+def time_to_first_record(extra_args):
+    # Spawn the pipeline with a framed channel on a pipe and wait for the first frame
+    import os
+    import subprocess
+    import sys
+
+    read_fd, write_fd = os.pipe()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, 'final.py', '--ipc-fd', str(write_fd), '--delay', '0'] + extra_args,
+        pass_fds=(write_fd,), stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.close(write_fd)
+    try:
+        header = os.read(read_fd, 5)
+        elapsed = time.perf_counter() - start
+    finally:
+        process.kill()
+        process.wait()
+        os.close(read_fd)
+    return elapsed if len(header) == 5 else None
+
+
+def bench_startup(args):
+    # Time from spawn to the first record, as app.js sees it when it (re)starts the worker
+    mode = ['--worker', '--replay', 'anomalous_dataset.csv']
+    for name, extra in (('eager U-Net load (previous)', ['--eager-unet']), ('deferred U-Net load', [])):
+        times = [time_to_first_record(mode + extra) for _ in range(args.repeat)]
+        if None in times:
+            print(f"{name}: pipeline exited before emitting a record")
+            continue
+        print(f"{name:<40} first record after {min(times):.3f} s (best of {args.repeat})")
+
+
+BENCHMARKS = {
+    'scoring': bench_scoring,
+    'online': bench_online,
+    'multivariate': bench_multivariate,
+    'registry': bench_registry,
+    'segmentation': bench_segmentation,
+    'tiled': bench_tiled,
+    'scene-memory': bench_scene_memory,
+    'dataset': bench_dataset,
+    'polygons': bench_polygons,
+    'vessel-index': bench_vessel_index,
+    'trajectories': bench_trajectories,
+    'simplify': bench_simplify,
+    'sharded': bench_sharded,
+    'async-segmentation': bench_async_segmentation,
+    'replay': bench_replay,
+    'render': bench_render,
+    'features': bench_features,
+    'nmea': bench_nmea,
+    'ipc-emit': bench_ipc_emit,
+    'startup': bench_startup,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SagarSuraksha pipeline benchmarks")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--loop-rows', type=int, default=2000)
+    parser.add_argument('--vessels', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--nmea-log', help="recorded !AIVDM log for the nmea benchmark")
+    parser.add_argument('--protocol', choices=['framed', 'markers'], default='framed')
+    parser.add_argument('--model', default='unet_model.h5')
+    parser.add_argument('--images', type=int, default=64)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scene-size', type=int, default=4096)
+    parser.add_argument('--overlap', type=int, default=64)
+    parser.add_argument('--components', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--segment-ms', type=float, default=150, help="simulated U-Net time for async-segmentation")
+    parser.add_argument('--segmentation-queue', type=int, default=32)
+    parser.add_argument('--record-ms', type=float, default=5, help="AIS record spacing for async-segmentation")
+    parser.add_argument('--speed', type=float, default=10000, help="replay speed-up for the replay benchmark")
+    parser.add_argument('--tolerance', type=float, default=50, help="track simplification tolerance in metres")
+    parser.add_argument('--days', type=int, default=7, help="days of synthetic AIS for the dataset benchmark")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import logging
+import os
+import threading
+import time
+
+
+def load_keras_model(model_path):
+    # TensorFlow is only imported here, so processes that never segment never pay for it
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '3')
+    import tensorflow as tf
+    tf.get_logger().setLevel('ERROR')
+    from tensorflow.keras.models import load_model
+    return load_model(model_path)
+
+
+class DeferredModel:
+    # Stand-in for a model that is loaded on a background thread. start() kicks
+    # off the load; predict() (or get()) starts it if needed and waits for it.
+
+    def __init__(self, loader, *args, name='model'):
+        self.name = name
+        self._loader = loader
+        self._args = args
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+        self._model = None
+        self._error = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name=f"load-{self.name}", daemon=True)
+                self._thread.start()
+        return self
+
+    def _load(self):
+        start = time.perf_counter()
+        try:
+            self._model = self._loader(*self._args)
+            logging.info(f"{self.name} loaded in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            self._error = e
+            logging.error(f"Error loading {self.name}: {str(e)}")
+        finally:
+            self._done.set()
+
+    @property
+    def ready(self):
+        return self._done.is_set() and self._error is None
+
+    def get(self, timeout=None):
+        self.start()
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"{self.name} is still loading")
+        if self._error is not None:
+            raise self._error
+        return self._model
+
+    def predict(self, *args, **kwargs):
+        return self.get().predict(*args, **kwargs)
@@ -0,0 +1,147 @@
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+# AIS "heading not available" value
+HEADING_UNAVAILABLE = 511
+
+KNOTS_PER_M_S = 3600.0 / 1852.0
+
+# Positions (this one and earlier ones of the same vessel) behind the loitering radius
+LOITER_WINDOW = 10
+
+VESSEL_FEATURES = [
+    'sudden_speed_change',
+    'elapsed_seconds',
+    'acceleration',
+    'turn_rate',
+    'distance_jump',
+    'course_divergence',
+    'implied_speed',
+    'speed_discrepancy',
+    'loiter_radius',
+]
+
+# Columns of the anomaly model's feature matrix (see feature_matrix)
+ANOMALY_FEATURES = [
+    'sudden_speed_change',
+    'turn_rate',
+    'course_divergence',
+    'speed_discrepancy',
+    'loiter_radius',
+    'elapsed_seconds',
+]
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def angle_difference(a, b):
+    # Signed smallest difference b - a in degrees, in [-180, 180)
+    return (b - a + 180.0) % 360.0 - 180.0
+
+
+def epoch_seconds(times):
+    return np.asarray(times, dtype='datetime64[s]').astype(np.int64)
+
+
+def vessel_deltas(mmsi, seconds, lat, lon, sog, cog, heading):
+    # Consecutive-message features for columns already sorted by (MMSI, time).
+    # Element i describes the step from message i-1 to message i of the same
+    # vessel; the first message of every vessel gets NaN.
+    n = len(mmsi)
+    features = {name: np.full(n, np.nan) for name in VESSEL_FEATURES}
+    if n < 2:
+        return features
+
+    same_vessel = mmsi[1:] == mmsi[:-1]
+    dt = np.diff(seconds).astype(np.float64)
+    valid_dt = same_vessel & (dt > 0)
+    safe_dt = np.where(valid_dt, dt, np.nan)
+
+    d_sog = np.diff(sog)
+    # Prefer heading for turn rate; fall back to COG when either end has no heading
+    has_heading = (heading[1:] != HEADING_UNAVAILABLE) & (heading[:-1] != HEADING_UNAVAILABLE)
+    d_course = np.where(has_heading, angle_difference(heading[:-1], heading[1:]), angle_difference(cog[:-1], cog[1:]))
+
+    features['sudden_speed_change'][1:] = np.where(same_vessel, np.abs(d_sog), np.nan)
+    features['elapsed_seconds'][1:] = np.where(same_vessel, dt, np.nan)
+    features['acceleration'][1:] = d_sog / safe_dt                      # knots per second
+    features['turn_rate'][1:] = d_course / safe_dt * 60.0               # degrees per minute
+    features['distance_jump'][1:] = np.where(
+        same_vessel, haversine_m(lat[:-1], lon[:-1], lat[1:], lon[1:]), np.nan)  # metres
+
+    # Distance covered over elapsed time vs what the vessel reported; spoofed or glitched
+    # positions jump much further than the SOG allows
+    features['implied_speed'][1:] = features['distance_jump'][1:] / safe_dt * KNOTS_PER_M_S      # knots
+    features['speed_discrepancy'][1:] = np.abs(features['implied_speed'][1:] - (sog[1:] + sog[:-1]) / 2)
+
+    # Heading is where the bow points, COG where the vessel goes; they part when drifting or sideslipping
+    features['course_divergence'] = np.where(
+        heading != HEADING_UNAVAILABLE, np.abs(angle_difference(cog, heading)), 0.0)
+    features['loiter_radius'] = loiter_radius(mmsi, lat, lon)
+    return features
+
+
+def loiter_radius(mmsi, lat, lon, window=LOITER_WINDOW):
+    # Radius of gyration (metres) of each position and up to window-1 earlier ones of the same
+    # vessel. Offsets are taken from the current position on a local flat projection, so the
+    # window is summed as window shifted vectors instead of a per-vessel rolling loop.
+    n = len(mmsi)
+    vessel_start = np.zeros(n, dtype=np.int64)
+    boundaries = np.flatnonzero(mmsi[1:] != mmsi[:-1]) + 1
+    vessel_start[boundaries] = boundaries
+    vessel_start = np.maximum.accumulate(vessel_start)
+
+    metres_per_deg = np.radians(1.0) * EARTH_RADIUS_M
+    x_scale = np.cos(np.radians(lat)) * metres_per_deg
+    sum_x, sum_y, sum_sq = np.zeros(n), np.zeros(n), np.zeros(n)
+    count = np.zeros(n)
+    index = np.arange(n)
+    for k in range(window):
+        earlier = index - k
+        valid = earlier >= vessel_start
+        earlier = np.where(valid, earlier, index)
+        dx = np.where(valid, angle_difference(lon, lon[earlier]) * x_scale, 0.0)
+        dy = np.where(valid, (lat[earlier] - lat) * metres_per_deg, 0.0)
+        sum_x += dx
+        sum_y += dy
+        sum_sq += dx * dx + dy * dy
+        count += valid
+    variance = sum_sq / count - (sum_x / count) ** 2 - (sum_y / count) ** 2
+    return np.sqrt(np.clip(variance, 0, None))
+
+
+def feature_matrix(df, columns=ANOMALY_FEATURES):
+    # C-contiguous float32 matrix for the anomaly model; undefined deltas (e.g. two messages
+    # with the same timestamp) are 0, i.e. "no change"
+    X = np.ascontiguousarray(df[list(columns)].to_numpy(dtype=np.float32))
+    np.nan_to_num(X, copy=False, nan=0.0, posinf=np.finfo(np.float32).max, neginf=np.finfo(np.float32).min)
+    return X
+
+
+def compute_vessel_features(df):
+    # Sort once by (MMSI, time), compute grouped deltas over flat columns and
+    # scatter the results back so the frame keeps its original row order.
+    seconds = epoch_seconds(df['BaseDateTime'].values)
+    mmsi = df['MMSI'].to_numpy()
+    order = np.lexsort((seconds, mmsi))
+
+    heading = df['Heading'].to_numpy(dtype=np.float64) if 'Heading' in df else np.full(len(df), HEADING_UNAVAILABLE)
+    features = vessel_deltas(
+        mmsi[order],
+        seconds[order],
+        df['LAT'].to_numpy(dtype=np.float64)[order],
+        df['LON'].to_numpy(dtype=np.float64)[order],
+        df['SOG'].to_numpy(dtype=np.float64)[order],
+        df['COG'].to_numpy(dtype=np.float64)[order],
+        heading[order],
+    )
+    for name, values in features.items():
+        column = np.empty_like(values)
+        column[order] = values
+        df[name] = column
+    return df
@@ -1,18 +1,35 @@
 
-import random
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import IsolationForest
 import json
 import sys
 import time
-import cv2
-from tensorflow.keras.models import load_model
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
 import os
-import io
 import logging
+import argparse
+import queue
+import threading
+import itertools
+from concurrent.futures import Future
+
+from anomaly_scoring import add_anomaly_columns
+from online_anomaly import HalfSpaceTrees
+from model_registry import HotSwapModel, ModelRegistry, data_fingerprint
+from features import ANOMALY_FEATURES, compute_vessel_features, feature_matrix
+from ais_dataset import AIS_COLUMNS, filter_ais_frame, is_dataset, read_ais_dataset
+from ais_stream import DEFAULT_BATCH_SIZE, DEFAULT_BATCH_WAIT, read_ais_batches, read_ais_stream
+from nmea import decode_sentences
+from ipc import open_writer
+from segmentation_cache import SegmentationCache, cache_key, model_version
+from deferred_model import DeferredModel, load_keras_model
+from vessel_index import VesselIndex
+from trajectory_store import TrajectoryStore
+from track_simplify import DEFAULT_MAX_INTERVAL, DEFAULT_TOLERANCE_M, DeadReckoningFilter, simplify_frame
+from sharded import ShardedScorer
+from segmentation_jobs import DEFAULT_MAX_PENDING, BackgroundJobs
+from replay import ReplayClock, replay_schedule
+from backfill import list_tasks, pending_tasks, run_backfill, training_sample
 
 import sys
 import os
@@ -32,169 +49,790 @@ sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Suppress TensorFlow and Keras warnings
-import tensorflow as tf
-tf.get_logger().setLevel('ERROR')
+# Suppress TensorFlow and Keras warnings (TensorFlow itself is imported on first need)
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 import warnings
 warnings.filterwarnings('ignore')
 
-# Constants for image processing
-IMG_HEIGHT = 256
-IMG_WIDTH = 256
-IMG_CLASSES = 5
-IMG_CHANNELS = 3
-
-# Color map for oil spill detection
-COLOR_MAP = [
-    [0, 0, 0],        # Black (Background)
-    [0, 255, 255],    # Cyan (Sea)
-    [238, 130, 238],  # Violet (Oil Spill)
-    [255, 0, 0],      # Red (Ship)
-    [0, 128, 0]       # Green (Land)
-]
-
-scaled_color_map = [[c[0] / 255.0, c[1] / 255.0, c[2] / 255.0] for c in COLOR_MAP]
-cmap = mcolors.ListedColormap(scaled_color_map)
-
 # At the beginning of your script, add or update this constant:
 SINGLE_IMAGE_PATH = "images/img_0003.jpg"
+UNET_MODEL_PATH = "unet_model.h5"
+
+# Pending requests held by the worker before stdin reads block
+WORKER_QUEUE_SIZE = 64
+
+# Segmentation results kept in memory, keyed by image content + model version
+SEGMENTATION_CACHE_SIZE = 256
+segmentation_cache = SegmentationCache(SEGMENTATION_CACHE_SIZE)
+# Segmentations in progress, by cache key: a job that misses the cache while the same scene is
+# being segmented waits for that result instead of adding a copy of the scene to the batch
+segmentations_in_flight = {}
+segmentations_in_flight_lock = threading.Lock()
+
+# Where records go: JSON_START/JSON_END text on stdout, or length-prefixed frames with --ipc-fd
+record_writer = open_writer()
+
+# Recent positions of every vessel seen, for "who was near this spill" lookups
+vessel_index = VesselIndex()
+NEARBY_RADIUS_KM = 20
+NEARBY_WINDOW_SECONDS = 6 * 3600
+NEARBY_MAX_VESSELS = 20
+
+# Last TRACK_POSITIONS positions of every vessel seen, for track queries. Created in main() with the
+# --track-memory-mb budget, so importing this module doesn't allocate it
+TRACK_POSITIONS = 64
+TRACK_MEMORY_MB = 256
+trajectories = None
+
+# Positions sent to the map: only those that change a vessel's drawn track by more than
+# SIMPLIFY_TOLERANCE_M metres, plus every anomaly (0 = send every position)
+SIMPLIFY_TOLERANCE_M = DEFAULT_TOLERANCE_M
+SIMPLIFY_MAX_INTERVAL = DEFAULT_MAX_INTERVAL
+
+# 'isolation-forest' refits on the loaded history; 'half-space-trees' bootstraps from its
+# most recent rows and then keeps learning from every record it scores
+ANOMALY_MODEL = 'isolation-forest'
+ANOMALY_MODELS = ('isolation-forest', 'half-space-trees')
+ONLINE_BOOTSTRAP_ROWS = 1000
+ANOMALY_FEATURE_COLUMNS = ANOMALY_FEATURES
+
+# Fitted anomaly models on disk (--registry); None = fit on every start
+model_registry = None
+
+# Oil-spill segmentation runs here, off the AIS emit loop (None = inline, --inline-segmentation)
+segmentation_jobs = None
+# Background jobs hand their scenes to one BatchSegmenter, so anomalies segmented at the same
+# time share a forward pass; as many jobs run at once as fit in a batch
+SEGMENTATION_BATCH_SIZE = 16
+SEGMENTATION_BATCH_WAIT = 0.05
+unet_segmenter = None
+unet_segmenter_lock = threading.Lock()
+# Ids of pending segmentations: unique to this process start and counted up, so a row replayed
+# in a later cycle (same index) or by a restarted worker never gets the id of an earlier one
+SEGMENTATION_ID_PREFIX = f"{int(time.time()):x}"
+segmentation_ids = itertools.count()
+
+# Longest side of the colorized mask PNG written for a 'scene' request; the full-resolution
+# mask is kept as a memory-mapped .npy instead
+SCENE_PREVIEW_SIZE = 2048
+
+# 'lut' colorizes the mask with a palette lookup table; 'matplotlib' is the old figure path
+OVERLAY_RENDERER = 'lut'
+# Same as overlay_render.RENDERERS; listed here so argument parsing doesn't import cv2
+OVERLAY_RENDERERS = ('lut', 'matplotlib')
 
 logging.info(f"Current working directory: {os.getcwd()}")
 logging.info(f"SINGLE_IMAGE_PATH: {SINGLE_IMAGE_PATH}")
-logging.info(f"U-Net model path: {'unet_model.h5'}")
+logging.info(f"U-Net model path: {UNET_MODEL_PATH}")
 
-def detect_and_visualize_oil_spill(image_path, unet_model, save_path):
+def unet_model_version():
+    try:
+        return model_version(UNET_MODEL_PATH)
+    except OSError:
+        return 'unknown'
+
+def get_unet_segmenter(unet_model):
+    global unet_segmenter
+    from segmentation import BatchSegmenter
+    with unet_segmenter_lock:
+        if unet_segmenter is None or unet_segmenter.unet_model is not unet_model:
+            unet_segmenter = BatchSegmenter(unet_model, SEGMENTATION_BATCH_SIZE, SEGMENTATION_BATCH_WAIT)
+        return unet_segmenter
+
+def segment_and_cache(key, image_bytes, unet_model, segmenter=None):
+    # The cache entry for a scene that missed the cache, or None if it can't be decoded
+    # Imaging modules (cv2) are only imported once a scene actually has to be segmented
+    from segmentation import decode_scene, segment_batch
+    from overlay_render import render_overlay
+
+    # Preprocess the image
+    image_resized, image_normalized = decode_scene(image_bytes)
+    if image_resized is None:
+        return None
+    logging.info("Image read and preprocessed")
+
+    # Predict using U-Net model
+    if segmenter is not None:
+        result = segmenter.submit(image_normalized).result()
+    else:
+        result = segment_batch(unet_model, [image_normalized])[0]
+    logging.info("Prediction completed")
+
+    # Print class distribution
+    logging.info(f"Class distribution: {result['class_distribution']}")
+
+    # Check if oil spill is detected (class 2 in the color map)
+    logging.info(f"Oil spill detected: {result['oil_spill']}")
+
+    overlay_png = render_overlay(image_resized, result['mask'], OVERLAY_RENDERER)
+    return segmentation_cache.put(key, result['mask'], result['class_distribution'], result['oil_spill'], overlay_png)
+
+def detect_and_visualize_oil_spill(image_path, unet_model, save_path, segmenter=None):
+    # With a segmenter the prediction joins its next batch; without, it runs on its own
     try:
         logging.info(f"Processing image: {image_path}")
-        
-        # Read and preprocess the image
-        image = cv2.imread(image_path, cv2.IMREAD_COLOR)
-        if image is None:
+
+        # Read the raw bytes once; they are both the cache key and the decode input
+        try:
+            with open(image_path, 'rb') as f:
+                image_bytes = f.read()
+        except OSError:
             logging.error(f"Error: Unable to read image at {image_path}")
             return False
-        logging.info("Image read successfully")
-        
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)  # Convert BGR to RGB
-        image_resized = cv2.resize(image, (IMG_HEIGHT, IMG_WIDTH))
-        image_normalized = image_resized / 255.0
-        logging.info("Image preprocessed")
-
-        # Predict using U-Net model
-        prediction_unet = unet_model.predict(np.expand_dims(image_normalized, axis=0))
-        predicted_mask_unet = np.argmax(prediction_unet, axis=3)[0, :, :]
-        logging.info("Prediction completed")
-
-        # Print class distribution
-        unique, counts = np.unique(predicted_mask_unet, return_counts=True)
-        class_distribution = dict(zip(unique, counts))
-        logging.info(f"Class distribution: {class_distribution}")
-
-        # Check if oil spill is detected (class 2 in the color map)
-        oil_spill_detected = np.any(predicted_mask_unet == 2)
-        logging.info(f"Oil spill detected: {oil_spill_detected}")
-
-        # Visualize and save the results
-        logging.info(f"Saving visualization to: {save_path}")
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 6))
-        ax1.imshow(image_resized)
-        ax1.set_title("Original Image")
-        ax1.axis('off')
-        im = ax2.imshow(predicted_mask_unet, cmap=cmap, vmin=0, vmax=len(COLOR_MAP) - 1, interpolation='none')
-        ax2.set_title("Predicted Mask")
-        ax2.axis('off')
-        cbar = fig.colorbar(im, ax=ax2, orientation='vertical', fraction=0.046, pad=0.04)
-        cbar.set_ticks(range(len(COLOR_MAP)))
-        cbar.set_ticklabels(['Background', 'Sea', 'Oil Spill', 'Ship', 'Land'])
-        plt.tight_layout()
-        
-        # Save figure to a bytes buffer
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        
+
+        key = cache_key(image_bytes, f"{unet_model_version()}:{OVERLAY_RENDERER}")
+        # Looked up under the in-flight lock: a finished segmentation is in the cache before it
+        # leaves segmentations_in_flight, so every caller either finds it, waits for it, or runs it
+        with segmentations_in_flight_lock:
+            cached = segmentation_cache.get(key)
+            flight = owner = None
+            if cached is None or cached['overlay_png'] is None:
+                flight = segmentations_in_flight.get(key)
+                if flight is None:
+                    flight = owner = segmentations_in_flight[key] = Future()
+        if cached is not None and cached['overlay_png'] is not None:
+            logging.info(f"Segmentation cache hit for {image_path}")
+        elif owner is None:
+            logging.info(f"Waiting for the segmentation of {image_path} already in progress")
+            cached = flight.result()
+        else:
+            try:
+                cached = segment_and_cache(key, image_bytes, unet_model, segmenter)
+            except BaseException as e:
+                owner.set_exception(e)
+                raise
+            else:
+                owner.set_result(cached)
+            finally:
+                with segmentations_in_flight_lock:
+                    del segmentations_in_flight[key]
+        if cached is None:
+            logging.error(f"Error: Unable to read image at {image_path}")
+            return False
+
         # Write bytes to file
+        logging.info(f"Saving visualization to: {save_path}")
         with open(save_path, 'wb') as f:
-            f.write(buf.getvalue())
-        
-        plt.close(fig)
+            f.write(cached['overlay_png'])
         logging.info("Visualization saved successfully")
 
-        return oil_spill_detected
+        return cached['oil_spill']
     except Exception as e:
         logging.error(f"Error in detect_and_visualize_oil_spill: {str(e)}")
         return False
 
-def process_data():
+def load_ais_frame(source='anomalous_dataset.csv', filters=None):
+    # Accepts a CSV path, a Parquet/Arrow file or partitioned dataset, or an already-built DataFrame.
+    # filters: start/end/bbox/mmsi (see ais_dataset.build_filter); pushed down into Parquet reads.
+    filters = filters or {}
+    if is_dataset(source):
+        df = read_ais_dataset(source, columns=AIS_COLUMNS, **filters)
+    else:
+        df = pd.read_csv(source) if isinstance(source, str) else source
+    source_columns = list(df.columns)
+    df['BaseDateTime'] = pd.to_datetime(df['BaseDateTime'])
+    if filters and not is_dataset(source):
+        df = filter_ais_frame(df, **filters).copy()
+
+    # Deltas are taken per vessel (MMSI) in time order, not across the whole feed
+    compute_vessel_features(df)
+    df = df.dropna(subset=source_columns + ['sudden_speed_change'])
+    return df
+
+def train_anomaly_model(df):
+    if df.empty:
+        raise ValueError("no AIS rows to train on (check --data and the --start/--end/--bbox/--mmsi filters)")
+    X = feature_matrix(df, ANOMALY_FEATURE_COLUMNS)
+    if ANOMALY_MODEL == 'half-space-trees':
+        logging.info("Bootstrapping half-space trees...")
+        model = HalfSpaceTrees(contamination=0.02, random_state=42).fit(X[-ONLINE_BOOTSTRAP_ROWS:])
+    else:
+        logging.info("Training Isolation Forest model...")
+        model = IsolationForest(contamination=0.02, random_state=42).fit(X)
+    # Typical feature values; per-feature contributions are measured against them
+    model.feature_baseline_ = np.median(X, axis=0)
+    return model
+
+def is_online_model(model):
+    # Same test as anomaly_scoring: online models learn from every record they score
+    return hasattr(getattr(model, 'current', model), 'score_partial_fit')
+
+def fit_and_register(df, source):
+    # Fit on df; with a registry the result becomes its current version
+    model = train_anomaly_model(df)
+    meta = {'fingerprint': data_fingerprint(df[ANOMALY_FEATURE_COLUMNS])}
+    if is_online_model(model):
+        meta['n_seen'] = model.n_seen_
+    if model_registry is not None:
+        version = model_registry.save(ANOMALY_MODEL, model, ANOMALY_FEATURE_COLUMNS, meta.pop('fingerprint'),
+                                      rows=len(df), source=str(source), **meta)
+        meta = model_registry.metadata(ANOMALY_MODEL, version)
+    return model, meta
+
+def save_online_model(anomaly_model, source):
+    # An online model's learned state as a new registry version, so a restart resumes from it.
+    # Call it from the thread that scores, so the model isn't learning while it is written.
+    model = anomaly_model.current
+    if model_registry is None:
+        logging.info("Online anomaly model keeps learning in memory; use --registry to save its state")
+        return
+    if model.n_seen_ == anomaly_model.meta.get('n_seen'):
+        logging.info("Online anomaly model has learned nothing since it was saved")
+        return
+    version = model_registry.save(ANOMALY_MODEL, model, ANOMALY_FEATURE_COLUMNS, anomaly_model.meta.get('fingerprint'),
+                                  source=str(source), n_seen=model.n_seen_, snapshot=True)
+    anomaly_model.meta = model_registry.metadata(ANOMALY_MODEL, version)
+
+def load_anomaly_model(training_source='anomalous_dataset.csv', filters=None, load_training=None):
+    # The registry's current model if there is one (no training data is read), else fit and register.
+    # load_training() returns the training frame when reading training_source whole won't do.
+    if model_registry is not None:
+        start = time.perf_counter()
+        loaded = model_registry.load(ANOMALY_MODEL, feature_columns=ANOMALY_FEATURE_COLUMNS)
+        if loaded is not None:
+            model, meta = loaded
+            logging.info(f"Loaded {ANOMALY_MODEL} v{meta['version']} from {model_registry.root} "
+                         f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return HotSwapModel(model, meta)
+    df = load_training() if load_training is not None else load_ais_frame(training_source, filters)
+    return HotSwapModel(*fit_and_register(df, training_source))
+
+def retrain_anomaly_model(anomaly_model, source, filters=None):
+    # Fits on a background thread; scoring keeps using the old model until it is swapped.
+    # An online model is never refit: a fresh bootstrap would throw away everything it has
+    # learned since, so its current state is saved to the registry instead.
+    if is_online_model(anomaly_model):
+        save_online_model(anomaly_model, source)
+        return None
+
+    def train():
+        df = load_ais_frame(source, filters)
+        if anomaly_model.meta.get('fingerprint') == data_fingerprint(df[ANOMALY_FEATURE_COLUMNS]):
+            logging.info("Training data unchanged; keeping the current anomaly model")
+            return None
+        return fit_and_register(df, source)
+    return anomaly_model.retrain_async(train)
+
+def load_unet_and_imaging(model_path):
+    # Warm cv2 and the renderers on the same thread so the first anomaly only waits for what is left
+    import segmentation
+    import overlay_render
+    return load_keras_model(model_path)
+
+def load_unet_model(model_path=UNET_MODEL_PATH, eager=False):
+    # TensorFlow and the model load in the background; the AIS path doesn't wait for them
+    logging.info("Loading U-Net model...")
+    unet_model = DeferredModel(load_unet_and_imaging, model_path, name="U-Net model").start()
+    if eager:
+        unet_model.get()
+    return unet_model
+
+def load_models(training_csv='anomalous_dataset.csv', eager_unet=False, filters=None, retrain=False):
+    # Fit and load everything once so repeated cycles only pay for inference.
+    # With retrain, a registry model is used right away while a fresh fit runs in the background.
+    iso_forest = load_anomaly_model(training_csv, filters)
+    if retrain:
+        retrain_anomaly_model(iso_forest, training_csv, filters)
+    unet_model = load_unet_model(eager=eager_unet)
+    return iso_forest, unet_model
+
+def emit_record(row_data):
+    record_writer.write_records([row_data])
+
+def emit_records(rows):
+    # Several records in one frame when the framed channel is in use
+    record_writer.write_records(rows)
+
+def find_nearby_vessels(row):
+    end = int(row.BaseDateTime.timestamp())
+    return vessel_index.nearby_vessels(row.LAT, row.LON, NEARBY_RADIUS_KM, end - NEARBY_WINDOW_SECONDS, end,
+                                       NEARBY_MAX_VESSELS)
+
+def segment_anomaly(job):
+    # Runs on a segmentation_jobs worker after the row went out with oil_spill "pending";
+    # the result repeats the row's fields so the dashboard doesn't depend on arrival order.
+    # It goes out even if something here raises (oil_spill "failed"), so the row never stays pending.
+    row_data, row, unet_model, image_path = job
+    segmentation_id = row_data.pop('segmentation_id')
+    result = dict(row_data, event='oil-spill-result', id=segmentation_id, oil_spill='failed', image_path=None)
+    try:
+        oil_spill = detect_and_visualize_oil_spill(SINGLE_IMAGE_PATH, unet_model, image_path,
+                                                   get_unet_segmenter(unet_model))
+        result.update(oil_spill=int(oil_spill), image_path=image_path if oil_spill else None)
+        if oil_spill:
+            result['nearby_vessels'] = find_nearby_vessels(row)
+    finally:
+        emit_record(result)
+
+def build_row_data(row, unet_model, image_tag=None):
+    index = row.Index
+    anomaly = row.anomaly
+
+    # If anomaly is detected, check for oil spill
+    oil_spill = False
+    image_path = None
+    nearby = None
+    pending = False
+    if anomaly:
+        logging.info(f"Anomaly detected at index {index}")
+        if os.path.exists(SINGLE_IMAGE_PATH):
+            image_path = f"oil_spill_images/oil_spill_{index if image_tag is None else image_tag}.png"
+            if segmentation_jobs is not None:
+                pending = True
+            else:
+                oil_spill = detect_and_visualize_oil_spill(SINGLE_IMAGE_PATH, unet_model, image_path)
+                if oil_spill:
+                    nearby = find_nearby_vessels(row)
+        else:
+            logging.warning(f"No image found at path: {SINGLE_IMAGE_PATH}")
+
+    # Prepare row data
+    row_data = {
+        'MMSI': int(row.MMSI),
+        'BaseDateTime': row.BaseDateTime.isoformat(),
+        'SOG': float(row.SOG),
+        'COG': float(row.COG),
+        'LAT': float(row.LAT),
+        'LON': float(row.LON),
+        'Change': float(row.sudden_speed_change),
+        'anomaly': int(anomaly),
+        'oil_spill': int(oil_spill),
+        'image_path': image_path if oil_spill else None
+    }
+    if nearby is not None:
+        row_data['nearby_vessels'] = nearby
+    contributions = getattr(row, 'anomaly_contributions', None)
+    if anomaly and contributions is not None:
+        row_data['contributions'] = contributions
+    if pending:
+        # Emitted now; an 'oil-spill-result' record with this id follows when the job is done
+        row_data['oil_spill'] = 'pending'
+        row_data['segmentation_id'] = f"{SEGMENTATION_ID_PREFIX}-{next(segmentation_ids)}"
+        if not segmentation_jobs.submit((dict(row_data), row, unet_model, image_path)):
+            row_data['oil_spill'] = 'skipped'
+            del row_data['segmentation_id']
+    return row_data
+
+def replay_clock(df, delay, speed=None, keep=None):
+    # (rows in emit order, clock saying when each is due): at the recorded BaseDateTime
+    # pace scaled by speed (0 = as fast as possible), or every delay seconds without one.
+    # Only rows in keep are emitted; the others keep their time slot, so the pace doesn't change.
+    order, offsets = replay_schedule(df['BaseDateTime'], speed, delay)
+    if keep is not None:
+        emitted = keep[order]
+        order, offsets = order[emitted], offsets[emitted]
+    return df.iloc[order], ReplayClock(offsets)
+
+def map_positions(df):
+    # Rows worth sending to the map (None = all): Douglas-Peucker over each vessel's track in the frame
+    if SIMPLIFY_TOLERANCE_M <= 0 or df.empty:
+        return None
+    keep = simplify_frame(df, SIMPLIFY_TOLERANCE_M)
+    logging.info(f"Track simplification ({SIMPLIFY_TOLERANCE_M:g} m) keeps {int(keep.sum())} of {len(df)} positions")
+    return keep
+
+def process_frame(df, iso_forest, unet_model, delay=2, image_prefix=None, speed=None):
+    # Create a directory for saving oil spill images
+    os.makedirs('oil_spill_images', exist_ok=True)
+
+    # Score every row in one vectorized pass
+    add_anomaly_columns(df, iso_forest, ANOMALY_FEATURE_COLUMNS)
+    # Worker requests add to what earlier ones indexed; a position sent again is kept once
+    vessel_index.add_frame(df)
+    trajectories.add_frame(df, new_only=True)
+
+    # Pace the output for the live dashboard: every wakeup emits all rows that are due,
+    # so a slow row (inline segmentation) delays the next ones instead of the whole schedule
+    rows, clock = replay_clock(df, delay, speed, map_positions(df))
+    for start, stop in clock.batches():
+        emit_records([build_row_data(row, unet_model, None if image_prefix is None else f"{image_prefix}_{row.Index}")
+                      for row in rows.iloc[start:stop].itertuples()])
+    logging.info(f"Replayed {clock.summary()}")
+
+def process_data(models=None, csv_path='anomalous_dataset.csv', delay=2, filters=None, speed=None):
     try:
         # Load and preprocess the data
         logging.info("Loading and preprocessing data...")
-        df = pd.read_csv('anomalous_dataset.csv')
-        df['sudden_speed_change'] = abs(df['SOG'] - df['SOG'].shift(1))
-        df = df.dropna()
-        df['BaseDateTime'] = pd.to_datetime(df['BaseDateTime'])
-
-        # Prepare features for anomaly detection
-        X = df[['sudden_speed_change']]
+        df = load_ais_frame(csv_path, filters)
 
-        # Train the Isolation Forest model
-        logging.info("Training Isolation Forest model...")
-        iso_forest = IsolationForest(contamination=0.02, random_state=42)
-        iso_forest.fit(X)
-
-        # Load U-Net model
-        logging.info("Loading U-Net model...")
-        unet_model = load_model('unet_model.h5')
-        logging.info("U-Net model loaded successfully")
+        # Each cycle replays the same file; don't index its positions twice
+        vessel_index.clear()
+        trajectories.clear()
 
-        # Create a directory for saving oil spill images
-        os.makedirs('oil_spill_images', exist_ok=True)
+        if models is None:
+            iso_forest = train_anomaly_model(df)
+            unet_model = load_unet_model()
+        else:
+            iso_forest, unet_model = models
 
-        # Process each row
-        for index, row in df.iterrows():
-            # Predict anomaly for this row
-            row_features = pd.DataFrame({'sudden_speed_change': [row['sudden_speed_change']]})
-            anomaly = iso_forest.predict(row_features)[0]
-
-            # If anomaly is detected, check for oil spill
-            oil_spill = False
-            image_path = None
-            if anomaly == -1:  # -1 indicates an anomaly in Isolation Forest
-                logging.info(f"Anomaly detected at index {index}")
-                if os.path.exists(SINGLE_IMAGE_PATH):
-                    image_path = f"oil_spill_images/oil_spill_{index}.png"
-                    oil_spill = detect_and_visualize_oil_spill(SINGLE_IMAGE_PATH, unet_model, image_path)
-                else:
-                    logging.warning(f"No image found at path: {SINGLE_IMAGE_PATH}")
-
-            # Prepare row data
-            row_data = {
-                'BaseDateTime': row['BaseDateTime'].isoformat(),
-                'SOG': float(row['SOG']),
-                'COG': float(row['COG']),
-                'LAT': float(row['LAT']),
-                'LON': float(row['LON']),
-                'Change': float(row['sudden_speed_change']),
-                'anomaly': int(anomaly == -1),
-                'oil_spill': int(oil_spill),
-                'image_path': image_path if oil_spill else None
-            }
-
-            # Print the row data as JSON with a marker
-            json_output = "JSON_START" + json.dumps(row_data) + "JSON_END"
-            print(json_output)
-            sys.stdout.flush()  # Ensure the output is immediately sent to Node.js
-
-            # Sleep for 2 seconds
-            time.sleep(2)
+        process_frame(df, iso_forest, unet_model, delay, speed=speed)
     except Exception as e:
         logging.error(f"Error in process_data: {str(e)}")
 
+def read_worker_requests(request_queue):
+    # One JSON request per stdin line, e.g.
+    #   {"id": "r1", "type": "csv", "path": "new_feed.csv"}
+    #     optional "delay" (seconds between rows) or "speed" (multiple of the recorded pace, 0 = unthrottled)
+    #   {"id": "r8", "type": "dataset", "path": "ais_parquet/", "start": "2023-02-22", "end": "2023-02-23",
+    #    "bbox": [west, south, east, north], "mmsi": [367123456]}  (filters are optional, also accepted by "csv")
+    #   {"id": "r2", "type": "ais", "records": [{"MMSI": ..., "BaseDateTime": ..., ...}]}
+    #   {"id": "r5", "type": "nmea", "sentences": ["!AIVDM,1,1,,A,15RTgt0PAso;90TKcjM8h6g208CQ,0*4A", ...]}
+    #     report times come from tag blocks (\c:1677103278*hh\!AIVDM,...) or an optional
+    #     "received_at" list with one time per sentence; otherwise every report is timed now
+    #   {"id": "r3", "type": "image", "path": "images/img_0004.jpg"}
+    #   {"id": "r9", "type": "retrain", "path": "new_feed.csv"}  (fits in the background, then hot-swaps the anomaly model;
+    #     an online model saves its learned state to the registry instead)
+    #   {"id": "r4", "type": "images", "paths": ["images/img_0001.jpg", "images/img_0002.jpg"]}
+    #   {"id": "r6", "type": "scene", "path": "scene.tif", "overlap": 64, "pixel_size_m": 10}  (tif/ENVI raw/npy are memory-mapped)
+    #     optional "bounds": [west, south, east, north] in degrees; GeoTIFFs carry their own
+    #   {"id": "r10", "type": "track", "mmsi": 367123456, "limit": 20}  (optional "start"/"end")
+    #   {"id": "r7", "type": "nearby", "lat": 33.68, "lon": -78.25, "radius_km": 20, "start": "2023-02-22T16:00:00", "end": "2023-02-22T22:00:00"}
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request_queue.put(json.loads(line))
+        except ValueError as e:
+            logging.error(f"Invalid worker request: {str(e)}")
+    request_queue.put(None)
+
+def request_filters(request):
+    return {key: request[key] for key in ('start', 'end', 'bbox', 'mmsi') if request.get(key) is not None}
+
+def handle_worker_request(request, iso_forest, unet_model, delay, speed=None, training_source='anomalous_dataset.csv',
+                          training_filters=None):
+    request_id = request.get('id', 'request')
+    request_type = request.get('type')
+    logging.info(f"Handling worker request {request_id} ({request_type})")
+
+    if request_type in ('csv', 'dataset'):
+        df = load_ais_frame(request['path'], request_filters(request))
+        process_frame(df, iso_forest, unet_model, request.get('delay', delay), image_prefix=request_id,
+                      speed=request.get('speed', speed))
+    elif request_type == 'ais':
+        df = load_ais_frame(pd.DataFrame(request['records']))
+        process_frame(df, iso_forest, unet_model, request.get('delay', 0), image_prefix=request_id,
+                      speed=request.get('speed'))
+    elif request_type == 'nmea':
+        df = load_ais_frame(decode_sentences(request['sentences'], request.get('received_at')))
+        process_frame(df, iso_forest, unet_model, request.get('delay', 0), image_prefix=request_id,
+                      speed=request.get('speed'))
+    elif request_type == 'retrain':
+        # Without a path, refit on the data (and filters) the worker was started with
+        if 'path' in request:
+            retrain_anomaly_model(iso_forest, request['path'], request_filters(request))
+        else:
+            retrain_anomaly_model(iso_forest, training_source, training_filters)
+    elif request_type == 'image':
+        os.makedirs('oil_spill_images', exist_ok=True)
+        save_path = request.get('save_path', f"oil_spill_images/oil_spill_{request_id}.png")
+        oil_spill = detect_and_visualize_oil_spill(request['path'], unet_model, save_path)
+        emit_record({
+            'event': 'segmentation-result',
+            'id': request_id,
+            'oil_spill': int(oil_spill),
+            'image_path': save_path if oil_spill else None
+        })
+    elif request_type == 'images':
+        # Several scenes at once: one forward pass per batch, no rendering.
+        # Every path gets one result, in request order; unreadable ones carry an error instead.
+        from segmentation import load_scene, segment_images
+        paths = request['paths']
+        scenes = [load_scene(path)[1] for path in paths]
+        readable = [scene for scene in scenes if scene is not None]
+        results = iter(segment_images(unet_model, readable, request.get('max_batch_size', 16)))
+        records = []
+        for path, scene in zip(paths, scenes):
+            record = {'event': 'segmentation-result', 'id': request_id, 'path': path}
+            if scene is None:
+                record.update(oil_spill=None, class_distribution=None, error="unable to read image")
+            else:
+                result = next(results)
+                record.update(oil_spill=int(result['oil_spill']), class_distribution=result['class_distribution'])
+            records.append(record)
+        emit_records(records)
+    elif request_type == 'nearby':
+        start, end = (int(pd.Timestamp(request[key]).timestamp()) for key in ('start', 'end'))
+        emit_record({
+            'event': 'nearby-vessels',
+            'id': request_id,
+            'vessels': vessel_index.nearby_vessels(request['lat'], request['lon'],
+                                                   request.get('radius_km', NEARBY_RADIUS_KM), start, end)
+        })
+    elif request_type == 'track':
+        start, end = (None if request.get(key) is None else int(pd.Timestamp(request[key]).timestamp())
+                      for key in ('start', 'end'))
+        track = trajectories.track(request['mmsi'], request.get('limit'), start, end)
+        emit_record({
+            'event': 'vessel-track',
+            'id': request_id,
+            'MMSI': int(request['mmsi']),
+            'positions': [{
+                'BaseDateTime': str(np.datetime64(int(seconds), 's')),
+                'LAT': round(float(lat), 5), 'LON': round(float(lon), 5),
+                'SOG': round(float(sog), 1), 'COG': round(float(cog), 1), 'Heading': int(heading),
+            } for seconds, lat, lon, sog, cog, heading in zip(*(track[name] for name in
+                                                                ('seconds', 'lat', 'lon', 'sog', 'cog', 'heading')))]
+        })
+    elif request_type == 'scene':
+        # Full-resolution scene: overlapping tiles instead of one squashed 256x256 pass
+        from overlay_render import colorize_mask, encode_png
+        from scene_reader import geotiff_bounds, open_scene
+        from spill_polygons import class_areas_m2, vectorize_spills
+        from tiled_segmentation import DEFAULT_TILE_OVERLAP, segment_tiled
+        scene = open_scene(request['path'])
+        if scene is None:
+            logging.error(f"Error: Unable to read scene at {request['path']}")
+            return
+        # The mask is written strip by strip into a memory-mapped .npy, so it is never held whole
+        os.makedirs('oil_spill_images', exist_ok=True)
+        mask_npy_path = f"oil_spill_images/scene_mask_{request_id}.npy"
+        mask = np.lib.format.open_memmap(mask_npy_path, mode='w+', dtype=np.uint8, shape=scene.shape[:2])
+        result = segment_tiled(unet_model, scene, request.get('overlap', DEFAULT_TILE_OVERLAP),
+                               request.get('max_batch_size', 16), request.get('pixel_size_m'), out=mask)
+        mask.flush()
+        logging.info(f"Segmented {scene.shape[1]}x{scene.shape[0]} scene in {result['tiles']} tiles")
+
+        # Spill outlines as GeoJSON: a few kB on the record stream instead of a full-scene PNG
+        bounds = request.get('bounds')
+        if bounds is None and request['path'].lower().endswith(('.tif', '.tiff')):
+            bounds = geotiff_bounds(request['path'])
+        spills = vectorize_spills(mask, bounds, request.get('pixel_size_m'))
+        # With bounds the ground scale comes from them (as for the spill areas), varying with latitude
+        class_area_m2 = result.get('class_area_m2')
+        if bounds is not None:
+            class_area_m2 = class_areas_m2(mask, result['class_pixels'], bounds)
+        area = 'unknown area' if spills['total_area_km2'] is None else f"{spills['total_area_km2']:.3f} km2"
+        logging.info(f"{len(spills['features'])} spill polygons, {area}")
+        # Nearest-neighbour downsample (class labels must not blend) for the colorized preview
+        step = -(-max(mask.shape) // SCENE_PREVIEW_SIZE)
+        mask_path = request.get('save_path', f"oil_spill_images/scene_mask_{request_id}.png")
+        with open(mask_path, 'wb') as f:
+            f.write(encode_png(colorize_mask(np.asarray(mask[::step, ::step]))))
+        del mask, result['mask']
+        emit_record({
+            'event': 'segmentation-result',
+            'id': request_id,
+            'path': request['path'],
+            'oil_spill': int(result['oil_spill']),
+            'class_pixels': result['class_pixels'],
+            'class_area_m2': class_area_m2,
+            'mask_path': mask_path,
+            'mask_scale': step,
+            'mask_npy_path': mask_npy_path,
+            'spill_area_km2': spills['total_area_km2'],
+            'spills': spills
+        })
+    else:
+        logging.error(f"Unknown worker request type: {request_type}")
+
+def run_worker(replay_csv=None, delay=2, eager_unet=False, filters=None, retrain=False, speed=None,
+               training_source='anomalous_dataset.csv'):
+    # Long-lived mode: models stay resident and new work arrives on stdin.
+    # With replay_csv the worker keeps replaying that file while idle.
+    # The anomaly model is trained on training_source with filters, as in batch mode.
+    iso_forest, unet_model = load_models(training_source, eager_unet, filters, retrain)
+    request_queue = queue.Queue(maxsize=WORKER_QUEUE_SIZE)
+    threading.Thread(target=read_worker_requests, args=(request_queue,), daemon=True).start()
+
+    replay = None
+    while True:
+        # While replaying, wait for a request only until the next replay row is due
+        wait = None if replay_csv is None else 0 if replay is None else replay[1].wait_time()
+        try:
+            request = request_queue.get_nowait() if wait == 0 else request_queue.get(timeout=wait)
+        except queue.Empty:
+            request = False
+
+        if request is None:
+            if replay_csv is None:
+                if segmentation_jobs is not None:
+                    segmentation_jobs.drain()
+                if is_online_model(iso_forest):
+                    save_online_model(iso_forest, 'worker')
+                break
+        elif request is not False:
+            try:
+                handle_worker_request(request, iso_forest, unet_model, delay, speed, training_source, filters)
+            except Exception as e:
+                logging.error(f"Error handling worker request: {str(e)}")
+            continue
+
+        # Idle: emit the replay rows that are due, then go back to waiting for requests
+        try:
+            if replay is None:
+                logging.info(f"Replaying {replay_csv}...")
+                df = load_ais_frame(replay_csv, filters)
+                add_anomaly_columns(df, iso_forest, ANOMALY_FEATURE_COLUMNS)
+                # Queries are bounded by the replayed row's time, so later rows don't leak in
+                vessel_index.clear()
+                vessel_index.add_frame(df)
+                trajectories.clear()
+                trajectories.add_frame(df)
+                os.makedirs('oil_spill_images', exist_ok=True)
+                replay = replay_clock(df, delay, speed, map_positions(df))
+            rows, clock = replay
+            due = clock.poll()
+            if due is not None:
+                emit_records([build_row_data(row, unet_model) for row in rows.iloc[due[0]:due[1]].itertuples()])
+            if clock.done:
+                logging.info(f"Replayed {clock.summary()}")
+                replay = None
+        except Exception as e:
+            logging.error(f"Error in worker replay: {str(e)}")
+            replay = None
+            time.sleep(delay)
+
+def score_stream(spec, batch_size, batch_wait, iso_forest):
+    for batch in read_ais_stream(spec, batch_size, batch_wait):
+        yield add_anomaly_columns(batch, iso_forest, ANOMALY_FEATURE_COLUMNS)
+
+def run_stream(spec, batch_size, batch_wait, eager_unet=False, shards=1, training_source='anomalous_dataset.csv',
+               filters=None):
+    # Score an unbounded AIS feed as it arrives, one micro-batch at a time.
+    # With shards > 1, vessels are spread over that many scoring processes by MMSI.
+    # filters select the training rows of training_source; the feed itself is scored whole.
+    iso_forest = load_anomaly_model(training_source, filters)
+    scorer = None
+    if shards > 1:
+        # Started before the U-Net loader thread, so forked workers don't inherit it.
+        # Each worker keeps the model it started with.
+        scorer = ShardedScorer(iso_forest.current, ANOMALY_FEATURE_COLUMNS, shards)
+        batches = scorer.map(read_ais_batches(spec, batch_size, batch_wait))
+    else:
+        batches = score_stream(spec, batch_size, batch_wait, iso_forest)
+    unet_model = load_unet_model(eager=eager_unet)
+    os.makedirs('oil_spill_images', exist_ok=True)
+    # Live positions can't wait for the rest of the track, so the map gets a dead-reckoning deadband
+    deadband = DeadReckoningFilter(SIMPLIFY_TOLERANCE_M, SIMPLIFY_MAX_INTERVAL) if SIMPLIFY_TOLERANCE_M > 0 else None
+    try:
+        for batch in batches:
+            vessel_index.add_frame(batch)
+            trajectories.add_frame(batch, new_only=True)
+            if deadband is not None:
+                batch = batch[deadband.filter_frame(batch)]
+            emit_records([build_row_data(row, unet_model) for row in batch.itertuples()])
+    finally:
+        if scorer is not None:
+            scorer.close()
+        elif is_online_model(iso_forest):
+            save_online_model(iso_forest, spec)
+        if deadband is not None and deadband.seen:
+            logging.info(f"Track simplification sent {deadband.sent} of {deadband.seen} positions")
+    if segmentation_jobs is not None:
+        # Feed ended; let outstanding oil-spill results go out before exiting
+        segmentation_jobs.drain()
+
+def segment_backfill_frame(df, unet_model, image_dir):
+    # The live path's oil-spill check for every anomalous row of a backfill task, as columns
+    oil_spill = np.zeros(len(df), dtype=np.int8)
+    image_paths = pd.array([None] * len(df), dtype='string')
+    anomalous = np.flatnonzero(df['anomaly'].to_numpy())
+    if os.path.exists(SINGLE_IMAGE_PATH):
+        if len(anomalous):
+            # Every anomaly is checked against the same scene, so one overlay per task serves them all
+            mmsi, when = df['MMSI'].iat[anomalous[0]], df['BaseDateTime'].iat[anomalous[0]]
+            image_path = os.path.join(image_dir, f"oil_spill_{mmsi}_{when:%Y%m%dT%H%M%S}.png")
+            if detect_and_visualize_oil_spill(SINGLE_IMAGE_PATH, unet_model, image_path):
+                oil_spill[anomalous] = 1
+                image_paths[anomalous] = image_path
+    elif len(anomalous):
+        logging.warning(f"No image found at path: {SINGLE_IMAGE_PATH}")
+    df['oil_spill'] = oil_spill
+    df['image_path'] = image_paths
+
+def backfill(source, out, workers=None, filters=None, segment=False):
+    # Score a whole archive once and write the results instead of streaming them to the dashboard
+    tasks = list_tasks(source)
+    if not tasks:
+        raise ValueError(f"no AIS files found in {source}")
+    if not pending_tasks(tasks, out, filters):
+        logging.info(f"Backfill of {source}: all {len(tasks)} tasks already done")
+        return True
+    # The registry's model if there is one, else fit on a sample of tasks from across the archive
+    iso_forest = load_anomaly_model(source, filters, lambda: training_sample(tasks, filters))
+    segment_frame = None
+    if segment:
+        # Loaded after the worker processes are forked, from the first task that needs it
+        unet_model = []
+        image_dir = os.path.join(out, 'oil_spill_images')
+        os.makedirs(image_dir, exist_ok=True)
+
+        def segment_frame(df):
+            if not unet_model:
+                unet_model.append(load_unet_model())
+            segment_backfill_frame(df, unet_model[0], image_dir)
+    rows, anomalies, failed = run_backfill(source, out, iso_forest.current, ANOMALY_FEATURE_COLUMNS, workers,
+                                           filters, segment_frame)
+    if failed:
+        logging.error(f"{len(failed)} backfill tasks failed; rerun to retry them")
+    return not failed
+
 def main():
+    global ANOMALY_MODEL, OVERLAY_RENDERER, SIMPLIFY_TOLERANCE_M, SIMPLIFY_MAX_INTERVAL, model_registry, record_writer, segmentation_jobs, trajectories
+    parser = argparse.ArgumentParser(description="AIS anomaly and oil spill detection pipeline")
+    parser.add_argument('--worker', action='store_true', help="keep models loaded and read JSON requests from stdin")
+    parser.add_argument('--data', default='anomalous_dataset.csv', help="AIS input: CSV file, Parquet/Arrow file or partitioned Parquet dataset directory (with --worker or --stream, the anomaly model's training data)")
+    parser.add_argument('--start', help="only rows at or after this time (e.g. 2023-02-22T16:00)")
+    parser.add_argument('--end', help="only rows before this time")
+    parser.add_argument('--bbox', type=float, nargs=4, metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'), help="only rows inside this box, in degrees")
+    parser.add_argument('--mmsi', type=int, nargs='+', help="only these vessels")
+    parser.add_argument('--replay', metavar='CSV', help="in worker mode, replay this CSV (or Parquet dataset) while idle")
+    parser.add_argument('--backfill', metavar='OUT', help="score the whole --data archive (directory of AIS files or Parquet dataset) in parallel and write the results to this Parquet dataset; reruns resume")
+    parser.add_argument('--workers', type=int, help="processes for --backfill (default: one per CPU)")
+    parser.add_argument('--segment', action='store_true', help="with --backfill, also run oil-spill segmentation for anomalous rows")
+    parser.add_argument('--stream', metavar='SOURCE', help="score a live feed (CSV lines or NMEA !AIVDM): stdin, file:PATH, tcp:HOST:PORT or udp:HOST:PORT")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="stream micro-batch size")
+    parser.add_argument('--batch-wait', type=float, default=DEFAULT_BATCH_WAIT, help="max seconds before a partial micro-batch is scored")
+    parser.add_argument('--delay', type=float, default=2, help="seconds between emitted rows (without --speed)")
+    parser.add_argument('--speed', type=float, help="replay at this multiple of the recorded BaseDateTime pace (1 = real time, 0 = as fast as possible)")
+    parser.add_argument('--cache-dir', help="also keep segmentation results on disk in this directory")
+    parser.add_argument('--anomaly-model', choices=ANOMALY_MODELS, default=ANOMALY_MODEL, help="batch Isolation Forest or online half-space trees")
+    parser.add_argument('--registry', metavar='DIR', help="load the fitted anomaly model from this registry instead of refitting (fit and save it there if missing)")
+    parser.add_argument('--retrain', action='store_true', help="refit in the background on start and hot-swap the model if the training data changed (half-space-trees is never refit, which would discard what it learned; with --registry its state is saved instead)")
+    parser.add_argument('--segmentation-queue', type=int, default=DEFAULT_MAX_PENDING, help="anomalies waiting for segmentation before new ones are skipped")
+    parser.add_argument('--inline-segmentation', action='store_true', help="segment anomalies in the emit loop instead of a background stage (records wait for U-Net)")
+    parser.add_argument('--renderer', choices=OVERLAY_RENDERERS, default=OVERLAY_RENDERER, help="oil spill overlay renderer")
+    parser.add_argument('--ipc-fd', type=int, help="write length-prefixed record frames to this file descriptor instead of stdout")
+    parser.add_argument('--shards', type=int, default=1, help="with --stream, score vessels in this many processes, sharded by MMSI")
+    parser.add_argument('--simplify-m', type=float, default=SIMPLIFY_TOLERANCE_M, help="only send positions that move a vessel's drawn track by more than this many metres (anomalies always go out; 0 = send all)")
+    parser.add_argument('--simplify-max-interval', type=float, default=SIMPLIFY_MAX_INTERVAL, help="with --stream, send a vessel's position at least this often (seconds of data time)")
+    parser.add_argument('--track-memory-mb', type=float, default=TRACK_MEMORY_MB, help=f"memory for per-vessel tracks (last {TRACK_POSITIONS} positions each)")
+    parser.add_argument('--eager-unet', action='store_true', help="load TensorFlow and the U-Net model before emitting the first record")
+    args = parser.parse_args()
+    record_writer = open_writer(args.ipc_fd)
+    trajectories = TrajectoryStore.for_budget(args.track_memory_mb * 2 ** 20, TRACK_POSITIONS)
+    segmentation_cache.disk_dir = args.cache_dir
+    OVERLAY_RENDERER = args.renderer
+    ANOMALY_MODEL = args.anomaly_model
+    SIMPLIFY_TOLERANCE_M = args.simplify_m
+    SIMPLIFY_MAX_INTERVAL = args.simplify_max_interval
+    if not args.inline_segmentation and not args.backfill:
+        segmentation_jobs = BackgroundJobs(segment_anomaly, args.segmentation_queue, SEGMENTATION_BATCH_SIZE)
+    if args.registry:
+        model_registry = ModelRegistry(args.registry)
+
+    filters = request_filters(vars(args))
+    if args.stream:
+        run_stream(args.stream, args.batch_size, args.batch_wait, args.eager_unet, args.shards, args.data, filters)
+        return
+
+    if args.backfill:
+        if not backfill(args.data, args.backfill, args.workers, filters, args.segment):
+            sys.exit(1)
+        return
+    if args.worker:
+        run_worker(args.replay, args.delay, args.eager_unet, filters, args.retrain, args.speed, args.data)
+        return
+
+    models = None
     while True:
         logging.info("Starting anomaly detection process...")
         try:
-            process_data()
+            if models is None:
+                models = load_models(args.data, args.eager_unet, filters, args.retrain)
+            process_data(models, args.data, args.delay, filters, args.speed)
         except Exception as e:
             logging.error(f"An error occurred in main: {str(e)}")
         logging.info("Anomaly detection process completed. Restarting in 5 seconds...")
@@ -0,0 +1,102 @@
+import json
+import os
+import struct
+import sys
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Framed record channel between the pipeline and app.js. Every frame is
+#   uint32 big-endian length of what follows | uint8 frame type | payload
+# and is written to a dedicated file descriptor so stdout stays free for logs.
+
+FRAME_JSON = 1          # one JSON object (any record, e.g. segmentation results)
+FRAME_JSON_BATCH = 2    # JSON array of records
+FRAME_AIS_BATCH = 3     # packed AIS records, see AIS_RECORD below (same layout in ipc.js)
+
+_HEADER = struct.Struct('>IB')
+_COUNT = struct.Struct('>I')
+
+# Packed AIS record: MMSI, epoch ms, LAT, LON, SOG, COG, Change, anomaly, oil_spill, image_path length
+AIS_RECORD = np.dtype([
+    ('mmsi', '>u4'), ('time_ms', '>f8'), ('lat', '>f8'), ('lon', '>f8'),
+    ('sog', '>f8'), ('cog', '>f8'), ('change', '>f8'),
+    ('anomaly', 'u1'), ('oil_spill', 'u1'), ('path_len', '>u2'),
+])
+AIS_KEYS = {'MMSI', 'BaseDateTime', 'SOG', 'COG', 'LAT', 'LON', 'Change', 'anomaly', 'oil_spill', 'image_path'}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _epoch_ms(iso_time):
+    moment = datetime.fromisoformat(iso_time)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (moment - _EPOCH).total_seconds() * 1000.0
+
+
+def _packable(record):
+    return record.keys() == AIS_KEYS and isinstance(record['oil_spill'], int)
+
+
+def encode_frame(frame_type, payload):
+    return _HEADER.pack(len(payload) + 1, frame_type) + payload
+
+
+def encode_json(record):
+    return encode_frame(FRAME_JSON, json.dumps(record, separators=(',', ':')).encode())
+
+
+def encode_ais_batch(records):
+    # Fixed-size numeric part for all records, then the variable-length image paths
+    paths = [(record['image_path'] or '').encode() for record in records]
+    packed = np.empty(len(records), dtype=AIS_RECORD)
+    packed['time_ms'] = [_epoch_ms(record['BaseDateTime']) for record in records]
+    for field, key in (('mmsi', 'MMSI'), ('lat', 'LAT'), ('lon', 'LON'), ('sog', 'SOG'), ('cog', 'COG'), ('change', 'Change'),
+                       ('anomaly', 'anomaly'), ('oil_spill', 'oil_spill')):
+        packed[field] = [record[key] for record in records]
+    packed['path_len'] = [len(path) for path in paths]
+    payload = _COUNT.pack(len(records)) + packed.tobytes() + b''.join(paths)
+    return encode_frame(FRAME_AIS_BATCH, payload)
+
+
+def encode_records(records):
+    # Packing only pays off for batches; single records stay JSON
+    if len(records) == 1:
+        return encode_json(records[0])
+    if all(_packable(record) for record in records):
+        return encode_ais_batch(records)
+    return encode_frame(FRAME_JSON_BATCH, json.dumps(records, separators=(',', ':')).encode())
+
+
+class FrameWriter:
+    def __init__(self, fd):
+        self._file = os.fdopen(fd, 'wb')
+        self._lock = threading.Lock()
+
+    def write_records(self, records):
+        if not records:
+            return
+        frame = encode_records(records)
+        with self._lock:
+            self._file.write(frame)
+            self._file.flush()
+
+
+class MarkerWriter:
+    # Legacy text protocol: JSON_START{...}JSON_END on stdout, one record at a time
+
+    def __init__(self):
+        # Background stages (e.g. segmentation jobs) write too; keep each record's text whole
+        self._lock = threading.Lock()
+
+    def write_records(self, records):
+        with self._lock:
+            for record in records:
+                print("JSON_START" + json.dumps(record) + "JSON_END")
+            sys.stdout.flush()  # Ensure the output is immediately sent to Node.js
+
+
+def open_writer(ipc_fd=None):
+    return FrameWriter(ipc_fd) if ipc_fd is not None else MarkerWriter()
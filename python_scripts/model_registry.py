@@ -0,0 +1,146 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+# On-disk registry of fitted anomaly detectors:
+#   ROOT/<name>/v0003/model.joblib   uncompressed, so numpy arrays can be memory-mapped
+#   ROOT/<name>/v0003/meta.json      version, feature schema, training data fingerprint
+#   ROOT/<name>/CURRENT              the version workers load
+# Versions are written to a temporary directory and renamed into place, and
+# CURRENT is replaced atomically, so a reader never sees a half-written model.
+
+MODEL_FILE = 'model.joblib'
+META_FILE = 'meta.json'
+CURRENT_FILE = 'CURRENT'
+
+
+def data_fingerprint(X):
+    # Content hash of the training features (values and column names, not file paths or mtimes)
+    X = pd.DataFrame(X)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([str(c) for c in X.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, name, *parts):
+        return os.path.join(self.root, name, *parts)
+
+    def versions(self, name):
+        if not os.path.isdir(self._path(name)):
+            return []
+        return sorted(int(entry[1:]) for entry in os.listdir(self._path(name))
+                      if entry.startswith('v') and entry[1:].isdigit())
+
+    def current_version(self, name):
+        try:
+            with open(self._path(name, CURRENT_FILE)) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def metadata(self, name, version=None):
+        version = self.current_version(name) if version is None else version
+        if version is None:
+            return None
+        with open(self._path(name, f"v{version:04d}", META_FILE)) as f:
+            return json.load(f)
+
+    def save(self, name, model, feature_columns, fingerprint, make_current=True, **info):
+        import joblib
+
+        os.makedirs(self._path(name), exist_ok=True)
+        staging = self._path(name, f".staging-{os.getpid()}-{threading.get_ident()}")
+        os.makedirs(staging, exist_ok=True)
+        meta = {'name': name, 'kind': type(model).__name__, 'feature_columns': list(feature_columns),
+                'fingerprint': fingerprint, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), **info}
+        joblib.dump(model, os.path.join(staging, MODEL_FILE))
+
+        # Another process may claim the same number; take the next one
+        while True:
+            version = max(self.versions(name), default=0) + 1
+            meta['version'] = version
+            with open(os.path.join(staging, META_FILE), 'w') as f:
+                json.dump(meta, f, indent=2)
+            try:
+                os.rename(staging, self._path(name, f"v{version:04d}"))
+                break
+            except OSError:
+                if not os.path.isdir(self._path(name, f"v{version:04d}")):
+                    raise
+        if make_current:
+            self.set_current(name, version)
+        logging.info(f"Saved {name} v{version} ({meta['kind']}) to {self.root}")
+        return version
+
+    def set_current(self, name, version):
+        temporary = self._path(name, f".{CURRENT_FILE}-{os.getpid()}-{threading.get_ident()}")
+        with open(temporary, 'w') as f:
+            f.write(str(version))
+        os.replace(temporary, self._path(name, CURRENT_FILE))
+
+    def load(self, name, version=None, feature_columns=None, mmap=False):
+        # (model, meta) for the current (or given) version; None if there is none or its
+        # feature schema differs. mmap maps the model's numpy arrays copy-on-write instead of
+        # reading them; that pays off for array-backed models only, as sklearn trees copy their
+        # nodes out of the pickle either way.
+        import joblib
+
+        meta = self.metadata(name, version)
+        if meta is None:
+            return None
+        if feature_columns is not None and meta['feature_columns'] != list(feature_columns):
+            logging.warning(f"{name} v{meta['version']} was trained on {meta['feature_columns']}, "
+                            f"not {list(feature_columns)}; ignoring it")
+            return None
+        path = self._path(name, f"v{meta['version']:04d}", MODEL_FILE)
+        return joblib.load(path, mmap_mode='c' if mmap else None), meta
+
+
+class HotSwapModel:
+    # Holds the model scoring uses; a background retrain replaces it with swap().
+    # Callers take .current once per frame, so every frame is scored by one version.
+
+    def __init__(self, model, meta=None):
+        self._model = model
+        self.meta = meta or {}
+        self._lock = threading.Lock()
+        self._retraining = None
+
+    @property
+    def current(self):
+        return self._model
+
+    def swap(self, model, meta=None):
+        with self._lock:
+            self._model = model
+            self.meta = meta or {}
+        logging.info(f"Anomaly model swapped in (version {self.meta.get('version', 'unsaved')})")
+
+    def retrain_async(self, train):
+        # train() -> (model, meta) or None to keep the current one; runs on a background thread
+        with self._lock:
+            if self._retraining is not None and self._retraining.is_alive():
+                logging.info("Anomaly model retrain already running")
+                return None
+
+            def run():
+                try:
+                    result = train()
+                    if result is not None:
+                        self.swap(*result)
+                except Exception as e:
+                    logging.error(f"Error retraining anomaly model: {str(e)}")
+
+            self._retraining = threading.Thread(target=run, name="anomaly-retrain", daemon=True)
+            self._retraining.start()
+            return self._retraining
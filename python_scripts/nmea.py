@@ -0,0 +1,333 @@
+import logging
+import re
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+# Decoder for raw NMEA 0183 AIS sentences (!AIVDM from other vessels, !AIVDO from own ship).
+# Sentences are reassembled into payloads, then each message type is decoded as a
+# batch: payloads become an N x bits matrix and every field is a vectorized slice.
+
+POSITION_TYPES = (1, 2, 3, 18, 19)
+STATIC_TYPES = (5, 19, 24)
+SUPPORTED_TYPES = (1, 2, 3, 5, 18, 19, 24)
+
+# Not-available markers in the raw fields
+SOG_UNAVAILABLE = 1023
+COG_UNAVAILABLE = 3600
+HEADING_UNAVAILABLE = 511
+LON_UNAVAILABLE = 181 * 600000
+LAT_UNAVAILABLE = 91 * 600000
+
+# Incomplete multi-fragment messages older than this many sentences are dropped
+FRAGMENT_TIMEOUT = 1000
+
+DEFAULT_BUFFER_CAPACITY = 65536
+
+# c: field of an NMEA 4.10 tag block (\s:station,c:1676990000*hh\!AIVDM,...): when the source
+# received the sentence, in unix seconds (or milliseconds)
+_TAG_BLOCK_TIME = re.compile(r'(?:^|[\\,])c:(\d+)')
+
+# Armored character -> 6-bit value
+_ARMOR = np.zeros(256, dtype=np.uint8)
+for _c in range(48, 120):
+    _ARMOR[_c] = _c - 48 if _c - 48 <= 40 else _c - 56
+
+# 6-bit value -> AIS text character
+_SIXBIT_TEXT = np.array([c + 64 if c < 32 else c for c in range(64)], dtype=np.uint8)
+
+# Bit length to decode per type (longer payloads are truncated, shorter ones zero padded)
+_TYPE_BITS = {1: 168, 2: 168, 3: 168, 18: 168, 19: 312, 5: 424, 24: 168}
+
+
+def nmea_checksum(body):
+    return reduce(lambda a, b: a ^ b, body.encode(), 0)
+
+
+def batch_checksums(bodies):
+    # XOR of every sentence body in one reduceat over the concatenated bytes
+    encoded = [body.encode() for body in bodies]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    return np.bitwise_xor.reduceat(np.frombuffer(b''.join(encoded), dtype=np.uint8), starts)
+
+
+def tag_block_time(prefix):
+    # Source time from the tag block in front of a sentence, or None
+    match = _TAG_BLOCK_TIME.search(prefix)
+    if match is None:
+        return None
+    value = int(match.group(1))
+    return np.datetime64(value, 'ms' if value >= 10 ** 11 else 's')
+
+
+def tag_block(time):
+    # \c:<unix seconds>*hh\ to put in front of a sentence
+    body = f"c:{int(time)}"
+    return f"\\{body}*{nmea_checksum(body):02X}\\"
+
+
+def payload_bits(payloads, n_bits):
+    # Pad/truncate armored payloads to a common width and unpack to an N x n_bits 0/1 matrix
+    width = -(-n_bits // 6)
+    joined = ''.join(p[:width].ljust(width, '0') for p in payloads).encode()
+    values = _ARMOR[np.frombuffer(joined, dtype=np.uint8)].reshape(len(payloads), width)
+    bits = np.unpackbits(values[:, :, None], axis=2)[:, :, 2:]
+    return bits.reshape(len(payloads), width * 6)[:, :n_bits]
+
+
+def bit_field(bits, start, length, signed=False):
+    weights = np.left_shift(np.int64(1), np.arange(length - 1, -1, -1, dtype=np.int64))
+    values = bits[:, start:start + length].astype(np.int64) @ weights
+    if signed:
+        values = np.where(values >= 1 << (length - 1), values - (1 << length), values)
+    return values
+
+
+def text_field(bits, start, n_chars):
+    chars = bits[:, start:start + 6 * n_chars].reshape(len(bits), n_chars, 6).astype(np.uint8)
+    codes = _SIXBIT_TEXT[chars @ np.array([32, 16, 8, 4, 2, 1], dtype=np.uint8)]
+    return [row.tobytes().decode('ascii').rstrip('@ ') for row in codes]
+
+
+def encode_payload(fields):
+    # fields: [(value, bit_length), ...] -> (armored payload, fill bits); used to build sample logs
+    bits = ''.join(format(value & ((1 << length) - 1), f'0{length}b') for value, length in fields)
+    fill = -len(bits) % 6
+    bits += '0' * fill
+    chars = []
+    for i in range(0, len(bits), 6):
+        value = int(bits[i:i + 6], 2)
+        chars.append(chr(value + 48 if value < 40 else value + 56))
+    return ''.join(chars), fill
+
+
+def encode_position_report(mmsi, lat, lon, sog, cog, heading=HEADING_UNAVAILABLE, msg_type=1, channel='A'):
+    fields = [
+        (msg_type, 6), (0, 2), (int(mmsi), 30), (0, 4), (-128, 8),
+        (int(round(sog * 10)), 10), (0, 1),
+        (int(round(lon * 600000)), 28), (int(round(lat * 600000)), 27),
+        (int(round(cog * 10)), 12), (int(heading), 9), (60, 6), (0, 6), (0, 19),
+    ]
+    payload, fill = encode_payload(fields)
+    body = f"AIVDM,1,1,,{channel},{payload},{fill}"
+    return f"!{body}*{nmea_checksum(body):02X}"
+
+
+class AisColumnBuffer:
+    # Preallocated position-report columns; decoded batches are written into slices
+    # and handed out as DataFrames with the same columns as the CSV feed.
+
+    def __init__(self, capacity=DEFAULT_BUFFER_CAPACITY):
+        self.capacity = capacity
+        self.length = 0
+        self.mmsi = np.empty(capacity, dtype=np.int64)
+        self.msg_type = np.empty(capacity, dtype=np.uint8)
+        self.time = np.empty(capacity, dtype='datetime64[ms]')
+        self.lat = np.empty(capacity, dtype=np.float64)
+        self.lon = np.empty(capacity, dtype=np.float64)
+        # float64 like the CSV feed: float32 tenths of a knot/degree come out as 6.300000190734863
+        self.sog = np.empty(capacity, dtype=np.float64)
+        self.cog = np.empty(capacity, dtype=np.float64)
+        self.heading = np.empty(capacity, dtype=np.uint16)
+
+    def reserve(self, n):
+        # Grow geometrically if a single batch does not fit
+        if self.length + n <= self.capacity:
+            return
+        capacity = max(self.capacity * 2, self.length + n)
+        for name in ('mmsi', 'msg_type', 'time', 'lat', 'lon', 'sog', 'cog', 'heading'):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.length] = column[:self.length]
+            setattr(self, name, grown)
+        self.capacity = capacity
+
+    def to_frame(self, reset=True):
+        n = self.length
+        df = pd.DataFrame({
+            'MMSI': self.mmsi[:n].copy(),
+            'BaseDateTime': self.time[:n].copy(),
+            'LAT': self.lat[:n].copy(),
+            'LON': self.lon[:n].copy(),
+            'SOG': self.sog[:n].copy(),
+            'COG': self.cog[:n].copy(),
+            'Heading': self.heading[:n].astype(np.int64),
+        })
+        if reset:
+            self.length = 0
+        return df
+
+
+class NmeaDecoder:
+    # Feed raw sentences, get position reports in an AisColumnBuffer and static
+    # vessel data (name, call sign, ship type) in a dict keyed by MMSI.
+
+    def __init__(self, buffer=None, verify_checksum=True):
+        self.buffer = buffer if buffer is not None else AisColumnBuffer()
+        self.verify_checksum = verify_checksum
+        self.static = {}
+        self.sentences = 0
+        self.rejected = 0
+        self._fragments = {}
+
+    def feed(self, lines, received_at=None):
+        # Returns the number of position reports written to the buffer.
+        # received_at: when the lines were read, one time for all (default now) or one per line;
+        # a sentence's tag block time (c:) takes precedence over it
+        lines = list(lines)
+        received_at = np.broadcast_to(np.asarray('now' if received_at is None else received_at,
+                                                 dtype='datetime64[ms]'), (len(lines),))
+        payloads, times = self._reassemble(lines, received_at)
+        return self._decode(payloads, times)
+
+    def _reassemble(self, lines, received_at):
+        sentences = []
+        for line, line_time in zip(lines, received_at):
+            start = line.find('!AIVD')
+            if start < 0:
+                continue
+            body, _, checksum = line[start + 1:].strip().partition('*')
+            source_time = tag_block_time(line[:start]) if start else None
+            sentences.append((body, checksum[:2], line_time if source_time is None else source_time))
+        first = self.sentences
+        self.sentences += len(sentences)
+        if not sentences:
+            return [], []
+        if self.verify_checksum:
+            expected = batch_checksums([body for body, _, _ in sentences])
+
+        # A multi-fragment message gets the time of its first fragment
+        payloads = []
+        times = []
+        for i, (body, checksum, sentence_time) in enumerate(sentences):
+            if self.verify_checksum:
+                try:
+                    valid = int(checksum, 16) == expected[i]
+                except ValueError:
+                    valid = False
+                if not valid:
+                    self.rejected += 1
+                    continue
+            parts = body.split(',')
+            if len(parts) != 7 or not parts[1].isdigit() or not parts[2].isdigit():
+                self.rejected += 1
+                continue
+
+            _, count, number, seq_id, channel, payload, fill = parts
+            if count == '1':
+                payloads.append(payload)
+                times.append(sentence_time)
+                continue
+
+            # Multi-fragment message: collect by (sequence id, channel) until complete
+            key = (seq_id, channel)
+            if number == '1':
+                self._fragments[key] = (first + i, int(count), [payload], sentence_time)
+                continue
+            pending = self._fragments.get(key)
+            if pending is None or len(pending[2]) + 1 != int(number):
+                self.rejected += 1
+                self._fragments.pop(key, None)
+                continue
+            pending[2].append(payload)
+            if len(pending[2]) == pending[1]:
+                payloads.append(''.join(pending[2]))
+                times.append(pending[3])
+                del self._fragments[key]
+
+        if len(self._fragments) > 64:
+            stale = [k for k, v in self._fragments.items() if self.sentences - v[0] > FRAGMENT_TIMEOUT]
+            for key in stale:
+                del self._fragments[key]
+        return payloads, times
+
+    def _decode(self, payloads, times):
+        if not payloads:
+            return 0
+        times = np.array(times, dtype='datetime64[ms]')
+        types = _ARMOR[np.frombuffer(''.join(p[:1] or '0' for p in payloads).encode(), dtype=np.uint8)]
+        written = 0
+        for msg_type in np.unique(types):
+            msg_type = int(msg_type)
+            if msg_type not in SUPPORTED_TYPES:
+                continue
+            indices = np.flatnonzero(types == msg_type)
+            bits = payload_bits([payloads[i] for i in indices], _TYPE_BITS[msg_type])
+            if msg_type in POSITION_TYPES:
+                written += self._write_positions(msg_type, bits, times[indices])
+            if msg_type in STATIC_TYPES:
+                self._store_static(msg_type, bits)
+        return written
+
+    def _write_positions(self, msg_type, bits, times):
+        # Class A (1/2/3) and class B (18/19) differ only in field offsets
+        offset = 0 if msg_type in (1, 2, 3) else -4
+        mmsi = bit_field(bits, 8, 30)
+        sog = bit_field(bits, 50 + offset, 10)
+        lon = bit_field(bits, 61 + offset, 28, signed=True)
+        lat = bit_field(bits, 89 + offset, 27, signed=True)
+        cog = bit_field(bits, 116 + offset, 12)
+        heading = bit_field(bits, 128 + offset, 9)
+
+        # Reports without a usable position cannot be scored or mapped
+        valid = ((lon != LON_UNAVAILABLE) & (lat != LAT_UNAVAILABLE)
+                 & (np.abs(lon) <= 180 * 600000) & (np.abs(lat) <= 90 * 600000))
+        n = int(valid.sum())
+        if n == 0:
+            return 0
+        buffer = self.buffer
+        buffer.reserve(n)
+        window = slice(buffer.length, buffer.length + n)
+        buffer.mmsi[window] = mmsi[valid]
+        buffer.msg_type[window] = msg_type
+        buffer.time[window] = times[valid]
+        buffer.lat[window] = lat[valid] / 600000.0
+        buffer.lon[window] = lon[valid] / 600000.0
+        buffer.sog[window] = np.where(sog[valid] == SOG_UNAVAILABLE, np.nan, sog[valid] / 10.0)
+        buffer.cog[window] = np.where(cog[valid] >= COG_UNAVAILABLE, np.nan, cog[valid] / 10.0)
+        buffer.heading[window] = heading[valid]
+        buffer.length += n
+        return n
+
+    def _store_static(self, msg_type, bits):
+        mmsi = bit_field(bits, 8, 30)
+        if msg_type == 5:
+            updates = {
+                'callsign': text_field(bits, 70, 7),
+                'name': text_field(bits, 112, 20),
+                'ship_type': bit_field(bits, 232, 8).tolist(),
+            }
+        elif msg_type == 19:
+            updates = {
+                'name': text_field(bits, 143, 20),
+                'ship_type': bit_field(bits, 263, 8).tolist(),
+            }
+        else:
+            # Type 24 comes in two parts: A carries the name, B the ship type and call sign
+            part = bit_field(bits, 38, 2)
+            names = text_field(bits, 40, 20)
+            callsigns = text_field(bits, 90, 7)
+            ship_types = bit_field(bits, 40, 8).tolist()
+            for i, vessel in enumerate(mmsi.tolist()):
+                info = self.static.setdefault(vessel, {})
+                if part[i] == 0:
+                    info['name'] = names[i]
+                elif part[i] == 1:
+                    info['ship_type'] = ship_types[i]
+                    info['callsign'] = callsigns[i]
+            return
+        for i, vessel in enumerate(mmsi.tolist()):
+            info = self.static.setdefault(vessel, {})
+            for field, values in updates.items():
+                info[field] = values[i]
+
+
+def decode_sentences(lines, received_at=None):
+    # Convenience wrapper: raw sentences -> DataFrame of position reports
+    decoder = NmeaDecoder()
+    decoder.feed(lines, received_at)
+    if decoder.rejected:
+        logging.warning(f"Rejected {decoder.rejected} of {decoder.sentences} NMEA sentences")
+    return decoder.buffer.to_frame()
@@ -0,0 +1,158 @@
+import numpy as np
+
+# Streaming half-space trees (Tan, Ting & Liu, 2011): an anomaly detector that
+# learns as it scores, in constant time and memory per record. Each tree
+# splits a randomly perturbed copy of the feature space in half, depth times,
+# with no data needed to build it. Records are counted into the nodes they
+# pass through; counts from the last full window are the "reference" mass a
+# new record is scored against, so sparse regions (low mass) are anomalous.
+# Every window_size records the latest counts replace the reference.
+#
+# The interface follows IsolationForest where the pipeline uses it:
+# decision_function() < 0 means anomalous and predict() returns -1/1. The
+# threshold is the contamination quantile of the scores in the last window.
+
+DEFAULT_TREES = 25
+DEFAULT_DEPTH = 10
+DEFAULT_WINDOW_SIZE = 250
+
+
+class HalfSpaceTrees:
+    def __init__(self, n_trees=DEFAULT_TREES, depth=DEFAULT_DEPTH, window_size=DEFAULT_WINDOW_SIZE,
+                 size_limit=None, contamination=0.02, random_state=None):
+        self.n_trees = n_trees
+        self.depth = depth
+        self.window_size = window_size
+        # A node with no more reference mass than this is treated as a leaf
+        self.size_limit = 0.1 * window_size if size_limit is None else size_limit
+        self.contamination = contamination
+        self.random_state = random_state
+        self.threshold_ = None
+        self.n_seen_ = 0
+
+    def _build(self, X):
+        # Random tree structure over the feature ranges of the bootstrap data
+        rng = np.random.default_rng(self.random_state)
+        n_features = X.shape[1]
+        self.offset_ = X.min(axis=0)
+        span = X.max(axis=0) - self.offset_
+        self.scale_ = np.where(span > 0, span, 1.0)
+
+        n_internal = 2 ** self.depth - 1
+        self.n_nodes_ = 2 ** (self.depth + 1) - 1
+        trees = np.arange(self.n_trees)
+        self.split_feature_ = rng.integers(0, n_features, size=(self.n_trees, n_internal))
+        self.split_value_ = np.empty((self.n_trees, n_internal))
+
+        # Work range per tree: [s - r, s + r] with s uniform in [0, 1] and r = 2 max(s, 1 - s)
+        pivot = rng.uniform(size=(self.n_trees, n_features))
+        radius = 2 * np.maximum(pivot, 1 - pivot)
+        low = np.empty((self.n_trees, n_internal, n_features))
+        high = np.empty((self.n_trees, n_internal, n_features))
+        low[:, 0], high[:, 0] = pivot - radius, pivot + radius
+        for node in range(n_internal):
+            feature = self.split_feature_[:, node]
+            middle = (low[trees, node, feature] + high[trees, node, feature]) / 2
+            self.split_value_[:, node] = middle
+            left, right = 2 * node + 1, 2 * node + 2
+            if right < n_internal:
+                low[:, left], high[:, left] = low[:, node], high[:, node]
+                low[:, right], high[:, right] = low[:, node], high[:, node]
+                high[trees, left, feature] = middle
+                low[trees, right, feature] = middle
+
+        self.reference_ = np.zeros((self.n_trees, self.n_nodes_), dtype=np.int32)
+        self.latest_ = np.zeros((self.n_trees, self.n_nodes_), dtype=np.int32)
+        self._has_reference = False
+        self._window_rows = []
+        self._window_scores = []
+        self._window_count = 0
+
+    def _normalize(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        return (X.reshape(len(X), -1) - self.offset_) / self.scale_
+
+    def _descend(self, X, learn=False):
+        # Mass score of each row (higher = denser = more normal); with learn, count the rows into latest_
+        n_rows = len(X)
+        trees = np.arange(self.n_trees)
+        rows = np.arange(n_rows)[:, None]
+        node = np.zeros((n_rows, self.n_trees), dtype=np.int64)
+        active = np.ones((n_rows, self.n_trees), dtype=bool)
+        mass = np.zeros(n_rows)
+        visited = []
+        for level in range(self.depth + 1):
+            if learn:
+                visited.append((node + trees * self.n_nodes_).ravel())
+            reference = self.reference_[trees, node]
+            stop = active & ((reference <= self.size_limit) | (level == self.depth))
+            mass += (reference * stop).sum(axis=1) * 2.0 ** level
+            active &= ~stop
+            if level < self.depth:
+                feature = self.split_feature_[trees, node]
+                node = 2 * node + 1 + (X[rows, feature] > self.split_value_[trees, node])
+        if learn:
+            visited = np.concatenate(visited)
+            latest = self.latest_.reshape(-1)
+            if len(visited) * 4 < latest.size:
+                np.add.at(latest, visited, 1)
+            else:
+                latest += np.bincount(visited, minlength=latest.size).astype(latest.dtype)
+        return mass
+
+    def _decision(self, mass):
+        if self.threshold_ is None:
+            return np.zeros(len(mass))
+        return (mass - self.threshold_) / (self.threshold_ + 1.0)
+
+    def _end_window(self):
+        self.reference_, self.latest_ = self.latest_, self.reference_
+        self.latest_[:] = 0
+        if self._has_reference:
+            scores = np.concatenate(self._window_scores)
+        else:
+            # First window: nothing scored it yet, so score it against itself
+            scores = self._descend(np.concatenate(self._window_rows))
+        self.threshold_ = float(np.quantile(scores, self.contamination))
+        self._has_reference = True
+        self._window_rows, self._window_scores, self._window_count = [], [], 0
+
+    def score_partial_fit(self, X):
+        # Score each row against the reference, then learn from it; rows are taken in order,
+        # so a window boundary inside X is handled exactly as if they arrived one by one
+        if not hasattr(self, 'reference_'):
+            self._build(np.asarray(X, dtype=np.float64).reshape(len(X), -1))
+        X = self._normalize(X)
+        decisions = np.empty(len(X))
+        start = 0
+        while start < len(X):
+            stop = min(len(X), start + self.window_size - self._window_count)
+            chunk = X[start:stop]
+            mass = self._descend(chunk, learn=True)
+            decisions[start:stop] = self._decision(mass)
+            self._window_scores.append(mass)
+            if not self._has_reference:
+                self._window_rows.append(chunk)
+            self._window_count += len(chunk)
+            self.n_seen_ += len(chunk)
+            if self._window_count == self.window_size:
+                self._end_window()
+            start = stop
+        return decisions
+
+    def partial_fit(self, X):
+        self.score_partial_fit(X)
+        return self
+
+    def fit(self, X):
+        # Bootstrap from recent history; a short history still gives a (partial) reference window
+        self.score_partial_fit(X)
+        if not self._has_reference and self._window_count:
+            self._end_window()
+        return self
+
+    def decision_function(self, X):
+        return self._decision(self._descend(self._normalize(X)))
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)
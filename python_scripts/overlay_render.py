@@ -0,0 +1,117 @@
+import functools
+import io
+
+import cv2
+import numpy as np
+
+from segmentation import CLASS_NAMES, COLOR_MAP
+
+# Palette lookup table: mask class index -> RGB
+PALETTE = np.array(COLOR_MAP, dtype=np.uint8)
+
+# Layout of the rendered figure (panels are upscaled masks, so keep nearest-neighbour)
+PANEL_SCALE = 2
+TITLE_HEIGHT = 40
+LEGEND_WIDTH = 170
+BACKGROUND = (255, 255, 255)
+TEXT_COLOR = (0, 0, 0)
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+RENDERERS = ('lut', 'matplotlib')
+
+
+def colorize_mask(mask):
+    # One fancy-index gather instead of a colormap pass
+    return PALETTE[mask]
+
+
+def blend_mask(image_resized, mask, alpha=0.5):
+    colored = colorize_mask(mask).astype(np.uint16)
+    blended = (image_resized.astype(np.uint16) * (256 - int(alpha * 256)) + colored * int(alpha * 256)) >> 8
+    return blended.astype(np.uint8)
+
+
+def _titled_panel(panel, title):
+    height, width = panel.shape[:2]
+    canvas = np.full((height + TITLE_HEIGHT, width, 3), BACKGROUND, dtype=np.uint8)
+    canvas[TITLE_HEIGHT:] = panel
+    (text_width, _), _ = cv2.getTextSize(title, FONT, 0.7, 2)
+    cv2.putText(canvas, title, ((width - text_width) // 2, TITLE_HEIGHT - 12), FONT, 0.7, TEXT_COLOR, 2, cv2.LINE_AA)
+    return canvas
+
+
+@functools.lru_cache(maxsize=4)
+def _legend(height):
+    # Same legend as the matplotlib colorbar: one swatch per class, class 0 at the bottom
+    legend = np.full((height, LEGEND_WIDTH, 3), BACKGROUND, dtype=np.uint8)
+    swatch = (height - TITLE_HEIGHT) // len(COLOR_MAP)
+    for index, (color, name) in enumerate(zip(COLOR_MAP, CLASS_NAMES)):
+        top = TITLE_HEIGHT + (len(COLOR_MAP) - 1 - index) * swatch
+        legend[top:top + swatch, 10:40] = color
+        cv2.putText(legend, name, (48, top + swatch // 2 + 6), FONT, 0.55, TEXT_COLOR, 1, cv2.LINE_AA)
+    legend[TITLE_HEIGHT:TITLE_HEIGHT + swatch * len(COLOR_MAP), 9] = TEXT_COLOR
+    legend[TITLE_HEIGHT:TITLE_HEIGHT + swatch * len(COLOR_MAP), 40] = TEXT_COLOR
+    legend.setflags(write=False)
+    return legend
+
+
+def compose_overlay(image_resized, mask, mode='side_by_side', alpha=0.5):
+    # Returns the RGB figure: original | predicted mask (or blend) | legend
+    if mode == 'blend':
+        right = blend_mask(image_resized, mask, alpha)
+        right_title = "Predicted Overlay"
+    else:
+        right = colorize_mask(mask)
+        right_title = "Predicted Mask"
+    if PANEL_SCALE != 1:
+        right = np.repeat(np.repeat(right, PANEL_SCALE, axis=0), PANEL_SCALE, axis=1)
+        left = cv2.resize(image_resized, (right.shape[1], right.shape[0]), interpolation=cv2.INTER_LINEAR)
+    else:
+        left = image_resized
+    left = _titled_panel(left, "Original Image")
+    right = _titled_panel(right, right_title)
+    return np.hstack([left, right, _legend(left.shape[0])])
+
+
+def encode_png(image_rgb):
+    ok, encoded = cv2.imencode('.png', cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    if not ok:
+        raise ValueError("PNG encoding failed")
+    return encoded.tobytes()
+
+
+def render_lut(image_resized, mask, mode='side_by_side', alpha=0.5):
+    return encode_png(compose_overlay(image_resized, mask, mode, alpha))
+
+
+def render_matplotlib(image_resized, mask):
+    # Original figure-based renderer, kept for comparison and as a fallback
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.colors as mcolors
+    import matplotlib.pyplot as plt
+
+    cmap = mcolors.ListedColormap(PALETTE / 255.0)
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 6))
+    ax1.imshow(image_resized)
+    ax1.set_title("Original Image")
+    ax1.axis('off')
+    im = ax2.imshow(mask, cmap=cmap, vmin=0, vmax=len(COLOR_MAP) - 1, interpolation='none')
+    ax2.set_title("Predicted Mask")
+    ax2.axis('off')
+    cbar = fig.colorbar(im, ax=ax2, orientation='vertical', fraction=0.046, pad=0.04)
+    cbar.set_ticks(range(len(COLOR_MAP)))
+    cbar.set_ticklabels(CLASS_NAMES)
+    plt.tight_layout()
+
+    # Save figure to a bytes buffer
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png')
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def render_overlay(image_resized, mask, renderer='lut'):
+    if renderer == 'matplotlib':
+        return render_matplotlib(image_resized, mask)
+    return render_lut(image_resized, mask)
@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+
+from features import epoch_seconds
+
+# Replay scheduling: every record gets a due time on the monotonic clock, and
+# the emit loop takes all records that are due in one batch instead of
+# sleeping after each row. Due times come from the records' own BaseDateTime
+# gaps scaled by a speed factor (1 = as recorded, 60 = a minute per second,
+# 0 = as fast as possible), or from a fixed interval for the old --delay pacing.
+
+# Records emitted together at most, so an unthrottled backfill still streams
+DEFAULT_MAX_BATCH = 500
+
+
+def replay_schedule(times, speed=None, interval=0.0):
+    # (order, offsets): rows to emit and their due times in seconds from the start.
+    # With speed, rows go out in time order at their recorded gaps / speed;
+    # without, in the given order every interval seconds.
+    n = len(times)
+    if speed is None:
+        return np.arange(n), np.arange(n) * float(interval)
+    seconds = epoch_seconds(times)
+    order = np.argsort(seconds, kind='stable')
+    if speed <= 0 or n == 0:
+        return order, np.zeros(n)
+    return order, (seconds[order] - seconds[order[0]]) / float(speed)
+
+
+class ReplayClock:
+    def __init__(self, offsets, max_batch=DEFAULT_MAX_BATCH):
+        self.offsets = np.asarray(offsets, dtype=np.float64)
+        self.max_batch = max_batch
+        self.emitted = 0
+        self.max_lag = 0.0
+        self.start = time.monotonic()
+
+    @property
+    def done(self):
+        return self.emitted >= len(self.offsets)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def wait_time(self):
+        # Seconds until the next record is due (0 if one is due now), None when finished
+        if self.done:
+            return None
+        return max(0.0, self.start + self.offsets[self.emitted] - time.monotonic())
+
+    def poll(self):
+        # (start, stop) of the records due now, or None if the next one isn't due yet
+        if self.done:
+            return None
+        now = time.monotonic() - self.start
+        due = int(np.searchsorted(self.offsets, now, side='right'))
+        if due <= self.emitted:
+            return None
+        start, stop = self.emitted, min(due, self.emitted + self.max_batch)
+        self.max_lag = max(self.max_lag, now - self.offsets[start])
+        self.emitted = stop
+        return start, stop
+
+    def batches(self):
+        # Blocking iteration over due batches
+        while not self.done:
+            due = self.poll()
+            if due is None:
+                time.sleep(self.wait_time() or 0.0)
+                continue
+            yield due
+
+    def summary(self):
+        elapsed = self.elapsed
+        rate = self.emitted / elapsed if elapsed > 0 else float('inf')
+        return f"{self.emitted} records in {elapsed:.2f} s ({rate:,.0f} records/s, max lag {self.max_lag * 1000:.0f} ms)"
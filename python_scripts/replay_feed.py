@@ -0,0 +1,87 @@
+import argparse
+import socket
+import sys
+import time
+
+import pandas as pd
+
+from nmea import encode_position_report, tag_block
+
+# Stand-in for a live AIS receiver: replays a CSV as newline-delimited records
+
+
+def open_target(target):
+    # target: "-" (stdout), "file:PATH" (append), "tcp:HOST:PORT" or "udp:HOST:PORT"
+    if target == '-':
+        return lambda data: (sys.stdout.write(data), sys.stdout.flush()), lambda: None
+    kind, _, rest = target.partition(':')
+    if kind == 'file':
+        f = open(rest, 'a')
+        return lambda data: (f.write(data), f.flush()), f.close
+    host, _, port = rest.rpartition(':')
+    address = (host or '127.0.0.1', int(port))
+    if kind == 'tcp':
+        sock = socket.create_connection(address)
+        return lambda data: sock.sendall(data.encode()), sock.close
+    if kind == 'udp':
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        return lambda data: sock.sendto(data.encode(), address), sock.close
+    raise ValueError(f"Unknown replay target: {target}")
+
+
+def to_nmea(header, records):
+    # Re-encode CSV rows as type 1 position reports, as a receiver would emit them, with the
+    # row's BaseDateTime as the tag block receive time
+    columns = header.split(',')
+    index = {name: columns.index(name) for name in ('MMSI', 'BaseDateTime', 'LAT', 'LON', 'SOG', 'COG', 'Heading')}
+    sentences = []
+    for record in records:
+        values = record.split(',')
+        sentences.append(tag_block(pd.Timestamp(values[index['BaseDateTime']]).timestamp()) + encode_position_report(
+            int(values[index['MMSI']]), float(values[index['LAT']]), float(values[index['LON']]),
+            float(values[index['SOG']]), float(values[index['COG']]), int(float(values[index['Heading']]))))
+    return sentences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an AIS CSV as a live feed")
+    parser.add_argument('csv')
+    parser.add_argument('--target', default='-', help="-, file:PATH, tcp:HOST:PORT or udp:HOST:PORT")
+    parser.add_argument('--rate', type=float, default=100, help="records per second (0 = as fast as possible)")
+    parser.add_argument('--chunk', type=int, default=1, help="records per write / datagram")
+    parser.add_argument('--loop', action='store_true', help="start over at the end of the file")
+    parser.add_argument('--nmea', action='store_true', help="send raw !AIVDM sentences instead of CSV lines")
+    args = parser.parse_args()
+
+    with open(args.csv) as f:
+        header, *records = f.read().splitlines()
+    if args.nmea:
+        records = to_nmea(header, records)
+
+    send, close = open_target(args.target)
+    interval = args.chunk / args.rate if args.rate > 0 else 0
+    sent = 0
+    start = time.monotonic()
+    try:
+        if not args.nmea and not args.target.startswith('udp:'):
+            send(header + '\n')
+        while True:
+            for i in range(0, len(records), args.chunk):
+                send('\n'.join(records[i:i + args.chunk]) + '\n')
+                sent += len(records[i:i + args.chunk])
+                # Pace against the start time so rounding errors do not accumulate
+                delay = start + sent / args.chunk * interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            if not args.loop:
+                break
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
+    finally:
+        close()
+        elapsed = time.monotonic() - start
+        print(f"Replayed {sent} records in {elapsed:.2f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
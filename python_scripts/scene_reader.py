@@ -0,0 +1,220 @@
+import logging
+import os
+import struct
+
+import cv2
+import numpy as np
+
+# Memory-mapped access to large scenes. Uncompressed TIFF/GeoTIFF (classic and
+# BigTIFF, contiguous strips), ENVI raw (.hdr + data file) and .npy scenes are
+# mapped read-only, so a window is a zero-copy view and only the pages that
+# are actually read get loaded. Everything else falls back to cv2.imread.
+#
+# Scenes are HxWxC arrays; windows are plain slices, e.g. scene[r0:r1, c0:c1].
+
+# TIFF tags used here
+TIFF_IMAGE_WIDTH = 256
+TIFF_IMAGE_LENGTH = 257
+TIFF_BITS_PER_SAMPLE = 258
+TIFF_COMPRESSION = 259
+TIFF_STRIP_OFFSETS = 273
+TIFF_SAMPLES_PER_PIXEL = 277
+TIFF_STRIP_BYTE_COUNTS = 279
+TIFF_PLANAR_CONFIGURATION = 284
+TIFF_TILE_OFFSETS = 324
+TIFF_SAMPLE_FORMAT = 339
+GEOTIFF_PIXEL_SCALE = 33550
+GEOTIFF_TIEPOINT = 33922
+
+# TIFF field type -> (numpy type, size)
+TIFF_TYPES = {1: ('u1', 1), 2: ('u1', 1), 3: ('u2', 2), 4: ('u4', 4), 5: ('u4', 8), 6: ('i1', 1),
+              7: ('u1', 1), 8: ('i2', 2), 9: ('i4', 4), 11: ('f4', 4), 12: ('f8', 8), 16: ('u8', 8),
+              17: ('i8', 8), 18: ('u8', 8)}
+
+# TIFF SampleFormat -> numpy kind
+TIFF_SAMPLE_KINDS = {1: 'u', 2: 'i', 3: 'f'}
+
+# ENVI "data type" -> numpy type
+ENVI_DTYPES = {1: 'u1', 2: 'i2', 3: 'i4', 4: 'f4', 5: 'f8', 12: 'u2', 13: 'u4', 14: 'i8', 15: 'u8'}
+
+
+def read_tiff_tags(f):
+    # Tags of the first IFD as {tag: ndarray}, plus the byte order prefix
+    header = f.read(16)
+    order = {b'II': '<', b'MM': '>'}.get(header[:2])
+    if order is None:
+        raise ValueError("not a TIFF file")
+    magic = struct.unpack(order + 'H', header[2:4])[0]
+    if magic == 42:
+        ifd_offset = struct.unpack(order + 'I', header[4:8])[0]
+        count_format, entry_format, inline = 'H', 'HHI4s', 4
+    elif magic == 43:
+        ifd_offset = struct.unpack(order + 'Q', header[8:16])[0]
+        count_format, entry_format, inline = 'Q', 'HHQ8s', 8
+    else:
+        raise ValueError(f"unknown TIFF magic {magic}")
+
+    f.seek(ifd_offset)
+    count_struct = struct.Struct(order + count_format)
+    entry_struct = struct.Struct(order + entry_format)
+    (n_entries,) = count_struct.unpack(f.read(count_struct.size))
+    entries = [entry_struct.unpack(f.read(entry_struct.size)) for _ in range(n_entries)]
+
+    tags = {}
+    for tag, field_type, count, value in entries:
+        if field_type not in TIFF_TYPES:
+            continue
+        kind, size = TIFF_TYPES[field_type]
+        nbytes = count * size
+        if nbytes <= inline:
+            raw = value[:nbytes]
+        else:
+            f.seek(struct.unpack(order + ('I' if inline == 4 else 'Q'), value)[0])
+            raw = f.read(nbytes)
+        tags[tag] = np.frombuffer(raw, dtype=order + kind)
+    return tags, order
+
+
+def open_tiff(path):
+    # Read-only HxWxC memmap of an uncompressed, chunky, single-image TIFF
+    with open(path, 'rb') as f:
+        tags, order = read_tiff_tags(f)
+
+    def tag(code, default=None):
+        return int(tags[code][0]) if code in tags else default
+
+    if tag(TIFF_COMPRESSION, 1) != 1:
+        raise ValueError(f"{path}: compressed TIFF (compression={tag(TIFF_COMPRESSION)}) cannot be memory-mapped")
+    if TIFF_TILE_OFFSETS in tags:
+        raise ValueError(f"{path}: tiled TIFF layout cannot be mapped as one array")
+    samples = tag(TIFF_SAMPLES_PER_PIXEL, 1)
+    if samples > 1 and tag(TIFF_PLANAR_CONFIGURATION, 1) != 1:
+        raise ValueError(f"{path}: planar TIFF layout is not supported")
+    bits = {int(b) for b in tags.get(TIFF_BITS_PER_SAMPLE, [8])}
+    if len(bits) != 1 or bits.pop() % 8:
+        raise ValueError(f"{path}: unsupported BitsPerSample {tags.get(TIFF_BITS_PER_SAMPLE)}")
+    dtype = np.dtype(f"{order}{TIFF_SAMPLE_KINDS.get(tag(TIFF_SAMPLE_FORMAT, 1), 'u')}"
+                     f"{int(tags[TIFF_BITS_PER_SAMPLE][0]) // 8}")
+
+    offsets = tags[TIFF_STRIP_OFFSETS].astype(np.int64)
+    byte_counts = tags[TIFF_STRIP_BYTE_COUNTS].astype(np.int64)
+    if np.any(offsets[1:] != offsets[:-1] + byte_counts[:-1]):
+        raise ValueError(f"{path}: TIFF strips are not contiguous")
+
+    shape = (tag(TIFF_IMAGE_LENGTH), tag(TIFF_IMAGE_WIDTH), samples)
+    return np.memmap(path, dtype=dtype, mode='r', offset=int(offsets[0]), shape=shape)
+
+
+def geotiff_bounds(path):
+    # (west, south, east, north) of a north-up GeoTIFF from its tiepoint and pixel scale,
+    # in the file's CRS (lon/lat for the scenes we use); None when not georeferenced
+    with open(path, 'rb') as f:
+        tags, _ = read_tiff_tags(f)
+    if GEOTIFF_PIXEL_SCALE not in tags or GEOTIFF_TIEPOINT not in tags:
+        return None
+    scale_x, scale_y = tags[GEOTIFF_PIXEL_SCALE][:2]
+    i, j, _, x, y, _ = tags[GEOTIFF_TIEPOINT][:6]
+    west, north = x - i * scale_x, y + j * scale_y
+    width, height = int(tags[TIFF_IMAGE_WIDTH][0]), int(tags[TIFF_IMAGE_LENGTH][0])
+    return (float(west), float(north - height * scale_y), float(west + width * scale_x), float(north))
+
+
+def read_envi_header(path):
+    # ENVI .hdr "key = value" pairs; braced values may span lines
+    with open(path, 'r') as f:
+        text = f.read()
+    if not text.lstrip().startswith('ENVI'):
+        raise ValueError(f"{path}: not an ENVI header")
+    header = {}
+    key, value, depth = None, [], 0
+    for line in text.splitlines()[1:]:
+        if key is None:
+            if '=' not in line:
+                continue
+            key, line = (part.strip() for part in line.split('=', 1))
+            key = key.lower()
+        depth += line.count('{') - line.count('}')
+        value.append(line)
+        if depth <= 0:
+            header[key] = ' '.join(value).strip().strip('{}').strip()
+            key, value, depth = None, [], 0
+    return header
+
+
+def open_envi(path, header_path=None):
+    # Read-only HxWxC view of an ENVI raw file (bip, bil or bsq interleave)
+    if header_path is None:
+        header_path = os.path.splitext(path)[0] + '.hdr'
+        if not os.path.exists(header_path):
+            header_path = path + '.hdr'
+    header = read_envi_header(header_path)
+    lines, samples, bands = int(header['lines']), int(header['samples']), int(header.get('bands', 1))
+    dtype = np.dtype(ENVI_DTYPES[int(header['data type'])]).newbyteorder('>' if header.get('byte order') == '1' else '<')
+    offset = int(header.get('header offset', 0))
+    interleave = header.get('interleave', 'bsq').lower()
+
+    if interleave == 'bip':
+        return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(lines, samples, bands))
+    if interleave == 'bil':
+        return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(lines, bands, samples)).transpose(0, 2, 1)
+    if interleave == 'bsq':
+        return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(bands, lines, samples)).transpose(1, 2, 0)
+    raise ValueError(f"{header_path}: unknown interleave {interleave}")
+
+
+def open_raw(path, shape, dtype=np.uint8, offset=0):
+    # Headerless raw scene with a known HxWxC layout
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=tuple(shape))
+
+
+def open_array(path):
+    # Any supported scene as an HxWxC array, memory-mapped where the format allows
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npy':
+        scene = np.load(path, mmap_mode='r')
+        return scene if scene.ndim == 3 else scene[..., None]
+    if extension in ('.raw', '.img', '.dat', '.bin'):
+        return open_envi(path)
+    if extension in ('.tif', '.tiff'):
+        try:
+            return open_tiff(path)
+        except ValueError as e:
+            logging.warning(f"{str(e)}; reading it into memory instead")
+
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        return None
+    if image.ndim == 2:
+        return image[..., None]
+    # cv2 decodes to BGR(A); flip the colour channels back to file order
+    return image[..., [2, 1, 0] + list(range(3, image.shape[2]))]
+
+
+def as_rgb(scene):
+    # 3-channel view for the segmentation model: grey is broadcast, alpha/extra bands dropped
+    if scene.shape[2] == 1:
+        return np.broadcast_to(scene, scene.shape[:2] + (3,))
+    return scene[..., :3]
+
+
+def open_scene(path):
+    # RGB uint8 scene for segmentation, memory-mapped where possible
+    scene = open_array(path)
+    if scene is None:
+        return None
+    if scene.dtype != np.uint8:
+        raise ValueError(f"{path}: expected 8-bit samples, got {scene.dtype}")
+    return as_rgb(scene)
+
+
+def read_window(scene, rows, cols):
+    # Zero-copy view of rows [r0, r1) and cols [c0, c1); pages are read on first access
+    (r0, r1), (c0, c1) = rows, cols
+    return scene[r0:r1, c0:c1]
+
+
+def thumbnail(scene, max_size=1024):
+    # Downscaled copy that only reads every step-th row of a mapped scene
+    height, width = scene.shape[:2]
+    step = max(1, -(-max(height, width) // max_size))
+    return np.ascontiguousarray(scene[::step, ::step])
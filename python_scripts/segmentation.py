@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+# Constants for image processing
+IMG_HEIGHT = 256
+IMG_WIDTH = 256
+IMG_CLASSES = 5
+IMG_CHANNELS = 3
+
+# Color map for oil spill detection
+COLOR_MAP = [
+    [0, 0, 0],        # Black (Background)
+    [0, 255, 255],    # Cyan (Sea)
+    [238, 130, 238],  # Violet (Oil Spill)
+    [255, 0, 0],      # Red (Ship)
+    [0, 128, 0]       # Green (Land)
+]
+CLASS_NAMES = ['Background', 'Sea', 'Oil Spill', 'Ship', 'Land']
+OIL_SPILL_CLASS = 2
+
+# Defaults for gathering scenes into one forward pass
+DEFAULT_MAX_BATCH_SIZE = 16
+DEFAULT_MAX_WAIT = 0.05
+
+
+def load_scene(image_path):
+    # Read and preprocess the image; returns (resized RGB uint8, normalized float32)
+    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    return preprocess_scene(image)
+
+
+def decode_scene(image_bytes):
+    # Same as load_scene for image bytes that were already read (e.g. to hash them)
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return preprocess_scene(image)
+
+
+def preprocess_scene(image):
+    if image is None:
+        return None, None
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)  # Convert BGR to RGB
+    image_resized = cv2.resize(image, (IMG_HEIGHT, IMG_WIDTH))
+    return image_resized, image_resized.astype(np.float32) / 255.0
+
+
+def segment_batch(unet_model, images):
+    # Stack normalized HxWx3 scenes into one NxHxWx3 tensor and run a single forward pass
+    batch = np.stack(images).astype(np.float32, copy=False)
+    prediction = unet_model.predict(batch, batch_size=len(batch), verbose=0)
+    masks = np.argmax(prediction, axis=3).astype(np.uint8)
+
+    results = []
+    for mask in masks:
+        counts = np.bincount(mask.ravel(), minlength=IMG_CLASSES)
+        results.append({
+            'mask': mask,
+            'class_distribution': {c: int(n) for c, n in enumerate(counts) if n},
+            'oil_spill': bool(counts[OIL_SPILL_CLASS]),
+        })
+    return results
+
+
+def segment_images(unet_model, images, max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+    # Segment any number of scenes, max_batch_size per forward pass
+    results = []
+    for start in range(0, len(images), max_batch_size):
+        results.extend(segment_batch(unet_model, images[start:start + max_batch_size]))
+    return results
+
+
+class BatchSegmenter:
+    # Collects scenes submitted from any thread and segments them together.
+    # A batch is flushed when it reaches max_batch_size or when the oldest
+    # pending scene has waited max_wait seconds.
+
+    def __init__(self, unet_model, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT):
+        self.unet_model = unet_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, image_normalized):
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("BatchSegmenter is closed")
+            self._pending.append((time.monotonic(), image_normalized, future))
+            self._condition.notify()
+        return future
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _next_batch(self):
+        with self._condition:
+            while True:
+                if self._pending:
+                    deadline = self._pending[0][0] + self.max_wait
+                    remaining = deadline - time.monotonic()
+                    if len(self._pending) >= self.max_batch_size or remaining <= 0 or self._closed:
+                        batch = self._pending[:self.max_batch_size]
+                        del self._pending[:self.max_batch_size]
+                        return batch
+                    self._condition.wait(remaining)
+                elif self._closed:
+                    return None
+                else:
+                    self._condition.wait()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            futures = [future for _, _, future in batch]
+            try:
+                results = segment_batch(self.unet_model, [image for _, image, _ in batch])
+            except Exception as e:
+                logging.error(f"Error in batch segmentation: {str(e)}")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, result in zip(futures, results):
+                future.set_result(result)
@@ -0,0 +1,131 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+@functools.lru_cache(maxsize=8)
+def _file_digest(path, mtime, size):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def model_version(model_path):
+    # Content hash of the model file; recomputed only when the file changes
+    stat = os.stat(model_path)
+    return _file_digest(model_path, stat.st_mtime_ns, stat.st_size)
+
+
+def cache_key(image_bytes, version):
+    digest = hashlib.sha256(image_bytes)
+    digest.update(b'\0' + str(version).encode())
+    return digest.hexdigest()
+
+
+class SegmentationCache:
+    # LRU cache of segmentation results keyed by image content + model version.
+    # Entries hold the argmax mask, class distribution, oil-spill flag and the
+    # rendered overlay PNG. With disk_dir set, evicted and new entries are also
+    # kept on disk so they survive restarts.
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key, mask, class_distribution, oil_spill, overlay_png):
+        entry = {
+            'mask': mask,
+            'class_distribution': class_distribution,
+            'oil_spill': bool(oil_spill),
+            'overlay_png': overlay_png,
+        }
+        with self._lock:
+            self._remember(key, entry)
+        self._write_disk(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_paths(self, key):
+        folder = os.path.join(self.disk_dir, key[:2])
+        return folder, os.path.join(folder, key + '.npz'), os.path.join(folder, key + '.png')
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        _, npz_path, png_path = self._disk_paths(key)
+        if not os.path.exists(npz_path):
+            return None
+        try:
+            with np.load(npz_path) as data:
+                mask = data['mask']
+                meta = json.loads(str(data['meta']))
+            overlay_png = None
+            if os.path.exists(png_path):
+                with open(png_path, 'rb') as f:
+                    overlay_png = f.read()
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable segmentation cache entry {key}: {str(e)}")
+            return None
+        return {
+            'mask': mask,
+            'class_distribution': {int(c): n for c, n in meta['class_distribution'].items()},
+            'oil_spill': meta['oil_spill'],
+            'overlay_png': overlay_png,
+        }
+
+    def _write_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        folder, npz_path, png_path = self._disk_paths(key)
+        try:
+            os.makedirs(folder, exist_ok=True)
+            meta = json.dumps({'class_distribution': entry['class_distribution'], 'oil_spill': entry['oil_spill']})
+            # Write to temp names first so readers never see a partial entry;
+            # the .npz goes last because its presence marks the entry as complete
+            if entry['overlay_png'] is not None:
+                with open(png_path + '.tmp', 'wb') as f:
+                    f.write(entry['overlay_png'])
+                os.replace(png_path + '.tmp', png_path)
+            tmp_path = npz_path + '.tmp.npz'
+            np.savez_compressed(tmp_path, mask=entry['mask'], meta=np.array(meta))
+            os.replace(tmp_path, npz_path)
+        except Exception as e:
+            logging.warning(f"Failed to write segmentation cache entry {key}: {str(e)}")
@@ -0,0 +1,59 @@
+import logging
+import queue
+import threading
+import time
+
+# Background stage for oil-spill segmentation. The AIS loop submits a job and
+# moves on; worker threads run the jobs and emit their own result records.
+# The queue is bounded and submit() never blocks: when it is full the job is
+# rejected, so a burst of anomalies can't stall the vessel stream.
+
+DEFAULT_MAX_PENDING = 32
+DEFAULT_WORKERS = 1  # one U-Net inference at a time; TensorFlow already uses every core
+DRAIN_POLL_INTERVAL = 0.05
+
+
+class BackgroundJobs:
+    def __init__(self, handler, max_pending=DEFAULT_MAX_PENDING, workers=DEFAULT_WORKERS, name="segmentation"):
+        self.handler = handler
+        self.name = name
+        self.submitted = 0
+        self.rejected = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True).start()
+
+    @property
+    def in_flight(self):
+        # Queued plus running
+        return self._queue.unfinished_tasks
+
+    def submit(self, job):
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self.rejected += 1
+            if self.rejected == 1 or self.rejected % 100 == 0:
+                logging.warning(f"{self.name} queue full ({self._queue.maxsize} jobs); {self.rejected} jobs skipped so far")
+            return False
+        self.submitted += 1
+        return True
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self.handler(job)
+            except Exception as e:
+                logging.error(f"Error in {self.name} job: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def drain(self, timeout=None):
+        # Wait for queued and running jobs, e.g. before exiting; True if none are left
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.in_flight:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(DRAIN_POLL_INTERVAL)
+        return True
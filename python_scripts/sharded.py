@@ -0,0 +1,189 @@
+import multiprocessing
+import pickle
+import queue
+import time
+
+import numpy as np
+import pandas as pd
+
+from ais_stream import DEFAULT_MAX_VESSELS, VesselStateTable, featurize_batch
+from anomaly_scoring import add_anomaly_columns
+
+# Sharded scoring: every micro-batch is split by a hash of MMSI across worker
+# processes. A vessel always lands on the same worker, which keeps that
+# vessel's feature state and its own copy of the scoring model. Results are
+# merged back per batch, in submission order and original row order.
+
+# Fibonacci hashing; MMSIs share country prefixes, so spread them before the modulo
+SHARD_HASH = np.uint64(11400714819323198485)
+
+# Batches queued per worker before submit() blocks
+DEFAULT_SHARD_QUEUE_SIZE = 8
+# A worker that has fallen behind scores up to this many queued parts in one pass,
+# so per-call overhead doesn't grow with the number of shards
+MAX_COALESCED_PARTS = 8
+# Seconds between checks that every worker is still alive while waiting on the queues
+SHARD_POLL_INTERVAL = 1.0
+# Seconds close() waits for the workers to exit before terminating them
+SHARD_CLOSE_TIMEOUT = 10.0
+CLOSE_DRAIN_INTERVAL = 0.05
+
+
+def shard_ids(mmsi, n_shards):
+    hashed = np.asarray(mmsi, dtype=np.uint64) * SHARD_HASH
+    return (hashed >> np.uint64(32)) % np.uint64(n_shards)
+
+
+def take_parts(inbox):
+    # Blocks for one part, then takes whatever else is already queued (None = stop)
+    items = [inbox.get()]
+    while items[-1] is not None and len(items) < MAX_COALESCED_PARTS:
+        try:
+            items.append(inbox.get_nowait())
+        except queue.Empty:
+            break
+    return items
+
+
+def run_shard(shard, model_bytes, feature_columns, max_vessels, inbox, outbox):
+    # An online model keeps learning here, from this shard's vessels only
+    model = pickle.loads(model_bytes)
+    state = VesselStateTable(max_vessels)
+    while True:
+        items = take_parts(inbox)
+        stop = items[-1] is None
+        items = [item for item in items if item is not None]
+        seqs = [seq for seq, _ in items]
+        try:
+            if items:
+                batch = pd.concat([part for _, part in items]) if len(items) > 1 else items[0][1]
+                position = np.repeat(np.arange(len(items)), [len(part) for _, part in items])
+                batch['shard_part'] = position
+                batch = featurize_batch(state, batch)
+                if not batch.empty:
+                    add_anomaly_columns(batch, model, feature_columns)
+                parts = batch.pop('shard_part').to_numpy()
+                for i, seq in enumerate(seqs):
+                    outbox.put((seq, shard, batch[parts == i], None))
+        except Exception as e:
+            for seq in seqs:
+                outbox.put((seq, shard, None, f"{type(e).__name__}: {e}"))
+        if stop:
+            return
+
+
+class ShardedScorer:
+    # Start it before any other threads (e.g. the U-Net loader) where processes are forked
+
+    def __init__(self, model, feature_columns, n_shards, max_vessels=DEFAULT_MAX_VESSELS,
+                 queue_size=DEFAULT_SHARD_QUEUE_SIZE):
+        context = multiprocessing.get_context()
+        model_bytes = pickle.dumps(model)
+        self.n_shards = n_shards
+        self._inboxes = [context.Queue(queue_size) for _ in range(n_shards)]
+        self._outbox = context.Queue()
+        self._workers = [
+            context.Process(target=run_shard, name=f"shard-{shard}", daemon=True,
+                            args=(shard, model_bytes, feature_columns, max_vessels, inbox, self._outbox))
+            for shard, inbox in enumerate(self._inboxes)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._next_seq = 0
+        self._next_out = 0
+        self._waiting = {}  # seq -> [parts still expected, parts received]
+
+    @property
+    def in_flight(self):
+        return self._next_seq - self._next_out
+
+    def _check_workers(self):
+        # A shard that died (OOM kill, signal) never answers; fail instead of waiting for it
+        for shard, worker in enumerate(self._workers):
+            if not worker.is_alive():
+                raise RuntimeError(f"shard {shard} worker exited unexpectedly (exit code {worker.exitcode})")
+
+    def _put(self, shard, item):
+        while True:
+            try:
+                self._inboxes[shard].put(item, timeout=SHARD_POLL_INTERVAL)
+                return
+            except queue.Full:
+                self._check_workers()
+
+    def submit(self, batch):
+        seq = self._next_seq
+        self._next_seq += 1
+        shards = shard_ids(batch['MMSI'].to_numpy(), self.n_shards)
+        parts = [(shard, batch[shards == shard]) for shard in range(self.n_shards)]
+        parts = [(shard, part) for shard, part in parts if len(part)]
+        self._waiting[seq] = [len(parts), []]
+        for shard, part in parts:
+            self._put(shard, (seq, part))
+        return seq
+
+    def _receive(self, block=True):
+        try:
+            seq, shard, part, error = self._outbox.get(block, SHARD_POLL_INTERVAL)
+        except queue.Empty:
+            if block:
+                self._check_workers()
+            return False
+        if error is not None:
+            raise RuntimeError(f"shard {shard} failed on batch {seq}: {error}")
+        waiting = self._waiting[seq]
+        waiting[0] -= 1
+        waiting[1].append(part)
+        return True
+
+    def completed(self, block=False):
+        # Merged batches that are complete, oldest first; with block, wait for the oldest one
+        while self._receive(block=False):
+            pass
+        while self._next_out < self._next_seq:
+            waiting = self._waiting[self._next_out]
+            if waiting[0]:
+                if not block:
+                    return
+                self._receive()
+                continue
+            del self._waiting[self._next_out]
+            self._next_out += 1
+            parts = [part for part in waiting[1] if not part.empty]
+            if parts:
+                yield pd.concat(parts).sort_index()
+            block = False
+
+    def map(self, batches, max_in_flight=None):
+        # Pipelined: keeps up to max_in_flight batches in the workers while yielding results in order
+        max_in_flight = max_in_flight or 2 * self.n_shards
+        for batch in batches:
+            self.submit(batch)
+            while self.in_flight >= max_in_flight:
+                yield from self.completed(block=True)
+            yield from self.completed()
+        while self.in_flight:
+            yield from self.completed(block=True)
+
+    def close(self):
+        # Stops the workers. After a failure some may be dead, or busy flushing results nobody will
+        # read: those results are drained and dropped, and the wait for the workers is bounded.
+        for inbox, worker in zip(self._inboxes, self._workers):
+            while worker.is_alive():
+                try:
+                    inbox.put(None, timeout=SHARD_POLL_INTERVAL)
+                    break
+                except queue.Full:
+                    pass
+            if not worker.is_alive():
+                inbox.cancel_join_thread()
+        deadline = time.monotonic() + SHARD_CLOSE_TIMEOUT
+        while any(worker.is_alive() for worker in self._workers) and time.monotonic() < deadline:
+            try:
+                self._outbox.get(timeout=CLOSE_DRAIN_INTERVAL)
+            except queue.Empty:
+                pass
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
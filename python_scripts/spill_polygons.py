@@ -0,0 +1,198 @@
+import cv2
+import numpy as np
+
+from segmentation import OIL_SPILL_CLASS
+
+# Oil-spill vectorization: connected components of the oil class become
+# polygons (outer ring + holes), georeferenced against the scene bounds and
+# emitted as GeoJSON with per-spill areas. Only the box around the oil pixels
+# is labelled, so a memory-mapped scene mask is read a strip at a time and
+# never held in memory whole.
+
+KM_PER_DEG_LAT = 110.574
+KM_PER_DEG_LON_EQUATOR = 111.320
+
+# Components smaller than this are treated as speckle
+DEFAULT_MIN_PIXELS = 4
+# Douglas-Peucker tolerance applied to contours, in pixels
+DEFAULT_SIMPLIFY_PX = 1.0
+# Coordinates are rounded to about this fraction of a pixel
+COORDINATE_RESOLUTION_PX = 0.1
+# Mask rows read at a time while looking for the oil pixels
+EXTENT_STRIP_ROWS = 1024
+
+
+class PixelGrid:
+    # Pixel -> map coordinates and per-pixel ground area for a north-up scene.
+    # bounds: (west, south, east, north) in degrees; pixel_size_m: square pixels
+    # in metres for scenes without geographic bounds (coordinates stay in pixels).
+    # origin: (x, y) of the pixels handed in within the scene, for a window of it.
+
+    def __init__(self, shape, bounds=None, pixel_size_m=None, origin=(0, 0)):
+        self.height, self.width = shape[:2]
+        self.bounds = bounds
+        self.pixel_size_m = pixel_size_m
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.decimals = 1
+        if bounds is not None:
+            west, south, east, north = bounds
+            self.dx = (east - west) / self.width
+            self.dy = (north - south) / self.height
+            # Enough decimals to resolve COORDINATE_RESOLUTION_PX and no more; keeps the GeoJSON small
+            step = min(self.dx, self.dy) * COORDINATE_RESOLUTION_PX
+            self.decimals = max(0, int(np.ceil(-np.log10(step))))
+
+    def to_map(self, points):
+        # points: Nx2 (x, y) in pixel units, (0, 0) being the top-left corner of the window
+        points = points + self.origin
+        if self.bounds is None:
+            return points.astype(np.float64)
+        west, _, _, north = self.bounds
+        return np.column_stack((west + points[:, 0] * self.dx, north - points[:, 1] * self.dy))
+
+    def pixel_area_km2(self, rows):
+        # Ground area of one pixel at the given (fractional) image rows; None without a ground scale
+        if self.bounds is not None:
+            lat = np.radians(self.bounds[3] - (np.asarray(rows) + self.origin[1] + 0.5) * self.dy)
+            return (self.dx * KM_PER_DEG_LON_EQUATOR * np.cos(lat)) * (self.dy * KM_PER_DEG_LAT)
+        if self.pixel_size_m is not None:
+            return np.full(np.shape(rows), (self.pixel_size_m / 1000.0) ** 2)
+        return None
+
+
+def class_areas_m2(mask, classes, bounds=None, pixel_size_m=None, strip_rows=EXTENT_STRIP_ROWS):
+    # {class: ground area in m2} for the given classes, every mask row weighted by its own
+    # pixel area (it shrinks towards the poles); None without a ground scale.
+    # Read a strip at a time like oil_extent.
+    grid = PixelGrid(mask.shape, bounds, pixel_size_m)
+    areas = dict.fromkeys(classes, 0.0)
+    for top in range(0, mask.shape[0], strip_rows):
+        strip = np.asarray(mask[top:top + strip_rows])
+        row_area_km2 = grid.pixel_area_km2(np.arange(top, top + len(strip)))
+        if row_area_km2 is None:
+            return None
+        for c in areas:
+            areas[c] += float(np.dot((strip == c).sum(axis=1), row_area_km2)) * 1e6
+    return areas
+
+
+def oil_extent(mask, oil_class=OIL_SPILL_CLASS, strip_rows=EXTENT_STRIP_ROWS):
+    # (top, bottom, left, right) of the oil pixels, end-exclusive, or None without any
+    top = bottom = None
+    left, right = mask.shape[1], 0
+    for y in range(0, mask.shape[0], strip_rows):
+        oil = np.asarray(mask[y:y + strip_rows]) == oil_class
+        rows = np.flatnonzero(oil.any(axis=1))
+        if not len(rows):
+            continue
+        cols = np.flatnonzero(oil.any(axis=0))
+        if top is None:
+            top = y + int(rows[0])
+        bottom = y + int(rows[-1]) + 1
+        left, right = min(left, int(cols[0])), max(right, int(cols[-1]) + 1)
+    return None if top is None else (top, bottom, left, right)
+
+
+def ring_coordinates(contour, grid):
+    # Closed GeoJSON ring; cv2 traces boundary pixel indices, +0.5 puts them on pixel centres
+    points = contour.reshape(-1, 2).astype(np.float64) + 0.5
+    coordinates = np.round(grid.to_map(points), grid.decimals)
+    return np.vstack((coordinates, coordinates[:1])).tolist()
+
+
+def valid_ring(ring):
+    # RFC 7946: at least four positions, and one that collapsed onto a line encloses nothing
+    return len(ring) >= 4 and signed_area(ring) != 0
+
+
+def pixel_outline(contour):
+    # Smallest rectangle around the pixels' own edges, for components one pixel wide
+    corners = contour.reshape(-1, 1, 2) + np.array([[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5]])
+    return cv2.boxPoints(cv2.minAreaRect(corners.reshape(-1, 2).astype(np.float32)))
+
+
+def outer_ring(contour, grid, simplify_px):
+    # Simplified outline; when that collapses, the traced one, then the pixels' edges
+    if simplify_px:
+        ring = ring_coordinates(cv2.approxPolyDP(contour, simplify_px, True), grid)
+        if valid_ring(ring):
+            return ring
+    ring = ring_coordinates(contour, grid)
+    if valid_ring(ring):
+        return ring
+    ring = ring_coordinates(pixel_outline(contour), grid)
+    return ring if valid_ring(ring) else None
+
+
+def vectorize_spills(mask, bounds=None, pixel_size_m=None, min_pixels=DEFAULT_MIN_PIXELS,
+                     simplify_px=DEFAULT_SIMPLIFY_PX, oil_class=OIL_SPILL_CLASS):
+    # Returns a GeoJSON FeatureCollection with one Polygon feature per spill.
+    # mask may be memory-mapped; only the box around its oil pixels is loaded.
+    extent = oil_extent(mask, oil_class)
+    if extent is None:
+        return {'type': 'FeatureCollection', 'features': [], 'total_area_km2': 0.0}
+    top, bottom, left, right = extent
+    oil = (np.asarray(mask[top:bottom, left:right]) == oil_class).astype(np.uint8)
+    grid = PixelGrid(mask.shape, bounds, pixel_size_m, origin=(left, top))
+
+    # One labelling pass gives every component's size and centroid; one contour pass
+    # gives every outer ring with its holes (RETR_CCOMP: two-level hierarchy).
+    _, labels, stats, centroids = cv2.connectedComponentsWithStats(oil, connectivity=8)
+    contours, hierarchy = cv2.findContours(oil, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return {'type': 'FeatureCollection', 'features': [], 'total_area_km2': 0.0}
+    hierarchy = hierarchy[0]
+    pixel_area = grid.pixel_area_km2(centroids[:, 1])
+    areas_km2 = None if pixel_area is None else stats[:, cv2.CC_STAT_AREA] * pixel_area
+
+    features = []
+    for i, contour in enumerate(contours):
+        if hierarchy[i][3] != -1:
+            continue  # hole, attached to its parent below
+        x, y = contour[0, 0]
+        label = labels[y, x]
+        pixels = int(stats[label, cv2.CC_STAT_AREA])
+        if pixels < min_pixels:
+            continue
+
+        rings = [outer_ring(contour, grid, simplify_px)]
+        if rings[0] is None:
+            continue
+        child = hierarchy[i][2]
+        while child != -1:
+            if cv2.contourArea(contours[child]) >= min_pixels:
+                hole = contours[child]
+                hole = ring_coordinates(cv2.approxPolyDP(hole, simplify_px, True) if simplify_px else hole, grid)
+                if valid_ring(hole):
+                    rings.append(hole)
+            child = hierarchy[child][0]
+
+        # RFC 7946 winding: exterior counter-clockwise, holes clockwise (in lon/lat, y up)
+        coordinates = []
+        for k, ring in enumerate(rings):
+            clockwise = signed_area(ring) < 0
+            if clockwise == (k == 0):
+                ring.reverse()
+            coordinates.append(ring)
+
+        cx, cy = centroids[label]
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon', 'coordinates': coordinates},
+            'properties': {
+                'pixels': pixels,
+                'area_km2': None if areas_km2 is None else round(float(areas_km2[label]), 6),
+                'centroid': np.round(grid.to_map(np.array([[cx + 0.5, cy + 0.5]]))[0], grid.decimals).tolist(),
+            },
+        })
+
+    # Without bounds or a pixel size the areas are unknown (null), not NaN, which JSON can't carry
+    total = None if areas_km2 is None else round(sum(feature['properties']['area_km2'] for feature in features), 6)
+    return {'type': 'FeatureCollection', 'features': features, 'total_area_km2': total}
+
+
+def signed_area(ring):
+    # Shoelace formula; positive when counter-clockwise with y pointing up
+    points = np.asarray(ring)
+    x, y = points[:, 0], points[:, 1]
+    return 0.5 * float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from trajectory_store import TrajectoryStore
+
+
+def ais_frame(n_vessels, positions_per_vessel):
+    # Vessels take turns, so vessel i's last position arrives after vessel i-1's
+    mmsi = np.tile(np.arange(n_vessels) + 100000000, positions_per_vessel)
+    times = pd.Timestamp('2023-02-22') + pd.to_timedelta(np.arange(len(mmsi)), unit='s')
+    return pd.DataFrame({'MMSI': mmsi, 'BaseDateTime': times, 'LAT': 33.0, 'LON': -78.0,
+                         'SOG': 5.0, 'COG': 90.0, 'Heading': 90})
+
+
+def test_frame_with_more_vessels_than_slots_keeps_the_latest():
+    store = TrajectoryStore(max_vessels=6, capacity=4)
+    store.add_frame(ais_frame(20, 3))
+
+    assert len(store) == 6
+    assert all(mmsi in store for mmsi in range(100000014, 100000020))
+    assert 100000013 not in store
+    assert len(store.track(100000019)['seconds']) == 3
+
+
+def test_store_keeps_working_after_an_overflowing_frame():
+    store = TrajectoryStore(max_vessels=6, capacity=4)
+    store.add_frame(ais_frame(20, 3))
+    store.add_frame(ais_frame(2, 1))
+
+    assert len(store) == 6
+    assert 100000000 in store and 100000001 in store
+    # The two vessels updated longest ago made room
+    assert 100000014 not in store and 100000015 not in store
+
+
+def test_new_only_skips_positions_already_stored():
+    store = TrajectoryStore(max_vessels=6, capacity=16)
+    store.add_frame(ais_frame(2, 5), new_only=True)
+    store.add_frame(ais_frame(2, 5), new_only=True)
+
+    assert len(store.track(100000000)['seconds']) == 5
@@ -0,0 +1,89 @@
+import numpy as np
+
+from segmentation import DEFAULT_MAX_BATCH_SIZE, IMG_CLASSES, IMG_HEIGHT, IMG_WIDTH, OIL_SPILL_CLASS
+
+# Full-resolution segmentation: the scene is cut into overlapping tiles of the
+# U-Net input size, tiles are predicted in batches and their softmax maps are
+# blended back together. Work proceeds one strip of tile rows at a time and
+# rows are finalised to the argmax mask as soon as no later tile covers them,
+# so besides the output mask only a tile-high band of probabilities is held.
+
+DEFAULT_TILE_OVERLAP = 64
+
+
+def tile_origins(length, tile, overlap):
+    # Tile start offsets covering [0, length); the last tile is flush with the end
+    if length <= tile:
+        return [0]
+    stride = tile - overlap
+    origins = list(range(0, length - tile, stride))
+    origins.append(length - tile)
+    return origins
+
+
+def blend_window(tile, overlap):
+    # Separable weights that ramp up across the overlap, so seams fade instead of cutting.
+    # Never zero: a pixel covered by a single tile keeps that tile's prediction.
+    if overlap <= 0:
+        return np.ones((tile, tile), dtype=np.float32)
+    ramp = np.minimum(1.0, (np.arange(tile) + 0.5) / overlap)
+    ramp = np.minimum(ramp, ramp[::-1]).astype(np.float32)
+    return np.outer(ramp, ramp)
+
+
+def read_tile(scene, y, x, tile):
+    # Normalised tile at (y, x); tiles hanging over the scene edge are reflect-padded
+    patch = np.asarray(scene[y:y + tile, x:x + tile])
+    h, w = patch.shape[:2]
+    if h < tile or w < tile:
+        mode = 'reflect' if h > 1 and w > 1 else 'edge'
+        patch = np.pad(patch, ((0, tile - h), (0, tile - w), (0, 0)), mode=mode)
+    return patch.astype(np.float32) / 255.0
+
+
+def segment_tiled(unet_model, scene, overlap=DEFAULT_TILE_OVERLAP, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                  pixel_size_m=None, out=None):
+    # scene: HxWx3 RGB uint8, any array supporting 2-D slicing (see scene_reader.open_scene).
+    # out: optional HxW uint8 array to receive the mask (e.g. a memmap for huge scenes).
+    tile = IMG_HEIGHT
+    assert IMG_HEIGHT == IMG_WIDTH, "tiling assumes a square model input"
+    if not 0 <= overlap < tile:
+        raise ValueError(f"tile overlap must be in [0, {tile}), got {overlap}")
+    height, width = scene.shape[:2]
+    mask = np.empty((height, width), dtype=np.uint8) if out is None else out
+    window = blend_window(tile, min(overlap, tile // 2))
+
+    ys = tile_origins(height, tile, overlap)
+    xs = tile_origins(width, tile, overlap)
+    band_rows = min(tile, height)
+    # Weighted sum of softmax maps; the weights are positive, so argmax needs no normalising
+    probabilities = np.zeros((band_rows, width, IMG_CLASSES), dtype=np.float32)
+    counts = np.zeros(IMG_CLASSES, dtype=np.int64)
+
+    for i, y in enumerate(ys):
+        rows = min(tile, height - y)
+        for start in range(0, len(xs), max_batch_size):
+            batch_xs = xs[start:start + max_batch_size]
+            batch = np.stack([read_tile(scene, y, x, tile) for x in batch_xs])
+            prediction = unet_model.predict(batch, batch_size=len(batch), verbose=0)
+            for x, tile_probabilities in zip(batch_xs, prediction):
+                cols = min(tile, width - x)
+                w = window[:rows, :cols]
+                probabilities[:rows, x:x + cols] += tile_probabilities[:rows, :cols] * w[..., None]
+
+        # Rows above the next strip are complete: write them out and slide the band down
+        done = ys[i + 1] - y if i + 1 < len(ys) else rows
+        mask[y:y + done] = np.argmax(probabilities[:done], axis=2)
+        counts += np.bincount(mask[y:y + done].ravel(), minlength=IMG_CLASSES)[:IMG_CLASSES]
+        probabilities[:band_rows - done] = probabilities[done:]
+        probabilities[band_rows - done:] = 0
+
+    result = {
+        'mask': mask,
+        'class_pixels': {c: int(n) for c, n in enumerate(counts) if n},
+        'oil_spill': bool(counts[OIL_SPILL_CLASS]),
+        'tiles': len(ys) * len(xs),
+    }
+    if pixel_size_m is not None:
+        result['class_area_m2'] = {c: n * pixel_size_m ** 2 for c, n in result['class_pixels'].items()}
+    return result
@@ -0,0 +1,164 @@
+import numpy as np
+
+from features import EARTH_RADIUS_M, KNOTS_PER_M_S, epoch_seconds, haversine_m
+from trajectory_store import TrajectoryStore
+
+# Track simplification before positions go to the map: only points that change
+# the drawn track (within a tolerance in metres) are forwarded, plus every
+# point that must be shown on its own (anomalies).
+#   simplify_tracks: Douglas-Peucker per vessel over a whole frame, with all
+#       vessels' segments split in the same vectorized pass
+#   DeadReckoningFilter: online deadband for live streams; a position goes
+#       out when it is further than the tolerance from where the vessel
+#       would be if it had carried on along the last drawn segment (the
+#       velocity between the last two forwarded positions), or on its
+#       reported SOG/COG while only one has been forwarded
+
+DEFAULT_TOLERANCE_M = 50.0
+# A vessel moving exactly as predicted still gets a position out this often
+DEFAULT_MAX_INTERVAL = 600
+DEFAULT_MAX_VESSELS = 200000
+
+# AIS "not available" values
+SOG_UNAVAILABLE = 102.3
+COG_UNAVAILABLE = 360.0
+
+
+def _local_xy(lat0, lon0, lat, lon):
+    # Metres east/north of (lat0, lon0), equirectangular; accurate over the length of one track segment
+    dlon = (lon - lon0 + 180.0) % 360.0 - 180.0
+    x = np.radians(dlon) * np.cos(np.radians(lat0)) * EARTH_RADIUS_M
+    y = np.radians(lat - lat0) * EARTH_RADIUS_M
+    return x, y
+
+
+def simplify_tracks(mmsi, seconds, lat, lon, tolerance_m=DEFAULT_TOLERANCE_M, keep=None):
+    # Mask (in input order) of the points Douglas-Peucker keeps in each vessel's track.
+    # Points in keep are always kept and split the track there, so the line stays exact around them.
+    n = len(mmsi)
+    if not n:
+        return np.zeros(0, dtype=bool)
+    mmsi = np.asarray(mmsi)
+    order = np.lexsort((np.asarray(seconds), mmsi))
+    lat = np.asarray(lat, dtype=np.float64)[order]
+    lon = np.asarray(lon, dtype=np.float64)[order]
+    sorted_mmsi = mmsi[order]
+
+    kept = np.zeros(n, dtype=bool)
+    kept[0] = kept[-1] = True
+    boundary = np.flatnonzero(sorted_mmsi[1:] != sorted_mmsi[:-1])
+    kept[boundary] = kept[boundary + 1] = True
+    if keep is not None:
+        kept |= np.asarray(keep, dtype=bool)[order]
+
+    # Every segment between consecutive kept points is split at its farthest point until none is
+    # farther than the tolerance; segments across a vessel boundary have no interior points
+    anchors = np.flatnonzero(kept)
+    start, end = anchors[:-1], anchors[1:]
+    while True:
+        interior = end - start - 1
+        active = interior > 0
+        start, end, interior = start[active], end[active], interior[active]
+        if not len(start):
+            break
+        segment = np.repeat(np.arange(len(start)), interior)
+        first = np.cumsum(interior) - interior
+        points = start[segment] + 1 + np.arange(len(segment)) - first[segment]
+
+        s, e = start[segment], end[segment]
+        px, py = _local_xy(lat[s], lon[s], lat[points], lon[points])
+        bx, by = _local_xy(lat[s], lon[s], lat[e], lon[e])
+        length2 = bx * bx + by * by
+        t = np.clip(np.divide(px * bx + py * by, length2, out=np.zeros_like(px), where=length2 > 0), 0.0, 1.0)
+        distance = np.hypot(px - t * bx, py - t * by)
+
+        farthest = np.maximum.reduceat(distance, first)
+        at_max = np.flatnonzero(distance == farthest[segment])
+        split_segments, first_max = np.unique(segment[at_max], return_index=True)
+        split_points = points[at_max[first_max]]
+        split = farthest[split_segments] > tolerance_m
+        split_segments, split_points = split_segments[split], split_points[split]
+        kept[split_points] = True
+        start = np.concatenate([start[split_segments], split_points])
+        end = np.concatenate([split_points, end[split_segments]])
+
+    mask = np.empty(n, dtype=bool)
+    mask[order] = kept
+    return mask
+
+
+def simplify_frame(df, tolerance_m=DEFAULT_TOLERANCE_M, keep_column='anomaly'):
+    keep = df[keep_column].to_numpy() != 0 if keep_column in df else None
+    return simplify_tracks(df['MMSI'].to_numpy(), epoch_seconds(df['BaseDateTime'].values),
+                           df['LAT'].to_numpy(), df['LON'].to_numpy(), tolerance_m, keep)
+
+
+def dead_reckon(lat, lon, sog, cog, elapsed):
+    # Position after sailing elapsed seconds at sog knots on course cog; unknown SOG/COG = stationary
+    moving = (sog < SOG_UNAVAILABLE) & (cog < COG_UNAVAILABLE)
+    distance = np.where(moving, sog / KNOTS_PER_M_S * elapsed, 0.0)
+    course = np.radians(cog)
+    lat_out = lat + np.degrees(distance * np.cos(course) / EARTH_RADIUS_M)
+    lon_out = lon + np.degrees(distance * np.sin(course) / (EARTH_RADIUS_M * np.maximum(np.cos(np.radians(lat)), 1e-6)))
+    return lat_out, lon_out
+
+
+def extrapolate(prev_seconds, prev_lat, prev_lon, seconds, lat, lon, elapsed):
+    # Position elapsed seconds after (lat, lon) at the velocity from the previous position to it
+    scale = elapsed / np.maximum(seconds - prev_seconds, 1)
+    dlon = (lon - prev_lon + 180.0) % 360.0 - 180.0
+    return lat + (lat - prev_lat) * scale, lon + dlon * scale
+
+
+class DeadReckoningFilter:
+    # The last two forwarded positions of each vessel live in a TrajectoryStore,
+    # so the filter's memory is fixed and stale vessels are dropped first
+
+    def __init__(self, tolerance_m=DEFAULT_TOLERANCE_M, max_interval=DEFAULT_MAX_INTERVAL,
+                 max_vessels=DEFAULT_MAX_VESSELS):
+        self.tolerance_m = tolerance_m
+        self.max_interval = max_interval
+        self.forwarded = TrajectoryStore(max_vessels, capacity=2)
+        self.seen = 0
+        self.sent = 0
+
+    def filter(self, mmsi, seconds, lat, lon, sog, cog, keep=None):
+        # Mask of the positions to forward; messages are taken per vessel in time order,
+        # one message of every vessel in the batch per vectorized round
+        mmsi = np.asarray(mmsi, dtype=np.int64)
+        n = len(mmsi)
+        seconds = np.asarray(seconds, dtype=np.int64)
+        lat, lon, sog, cog = (np.asarray(values, dtype=np.float64) for values in (lat, lon, sog, cog))
+        keep = np.zeros(n, dtype=bool) if keep is None else np.asarray(keep, dtype=bool)
+        order = np.lexsort((seconds, mmsi))
+        starts = np.flatnonzero(np.r_[True, mmsi[order][1:] != mmsi[order][:-1]])
+        counts = np.diff(np.r_[starts, n])
+        rank = np.arange(n) - np.repeat(starts, counts)
+
+        forward = np.zeros(n, dtype=bool)
+        for r in range(int(counts.max(initial=0))):
+            rows = order[rank == r]
+            window = self.forwarded.windows(mmsi[rows], 2)
+            prev, last = ({name: values[:, i].astype(np.float64) if name != 'valid' else values[:, i]
+                           for name, values in window.items()} for i in (0, 1))
+            elapsed = seconds[rows] - last['seconds']
+            predicted_lat, predicted_lon = dead_reckon(last['lat'], last['lon'], last['sog'], last['cog'],
+                                                       np.maximum(elapsed, 0))
+            on_track = prev['valid'] & (last['seconds'] > prev['seconds'])
+            track_lat, track_lon = extrapolate(prev['seconds'], prev['lat'], prev['lon'], last['seconds'],
+                                               last['lat'], last['lon'], np.maximum(elapsed, 0))
+            predicted_lat = np.where(on_track, track_lat, predicted_lat)
+            predicted_lon = np.where(on_track, track_lon, predicted_lon)
+            off_course = haversine_m(predicted_lat, predicted_lon, lat[rows], lon[rows]) > self.tolerance_m
+            send = ~last['valid'] | keep[rows] | off_course | (elapsed >= self.max_interval) | (elapsed < 0)
+            forward[rows] = send
+            sent = rows[send]
+            self.forwarded.append_batch(mmsi[sent], seconds[sent], lat[sent], lon[sent], sog[sent], cog[sent])
+        self.seen += n
+        self.sent += int(forward.sum())
+        return forward
+
+    def filter_frame(self, df, keep_column='anomaly'):
+        keep = df[keep_column].to_numpy() != 0 if keep_column in df else None
+        return self.filter(df['MMSI'].to_numpy(), epoch_seconds(df['BaseDateTime'].values), df['LAT'].to_numpy(),
+                           df['LON'].to_numpy(), df['SOG'].to_numpy(), df['COG'].to_numpy(), keep)
@@ -0,0 +1,228 @@
+import logging
+import threading
+
+import numpy as np
+
+from features import HEADING_UNAVAILABLE, epoch_seconds
+
+# Recent trajectory of every vessel in preallocated column arrays. Each vessel
+# owns one row ("slot") of every column, used as a ring buffer of its last
+# `capacity` positions:
+#   seconds int64, lat/lon/sog/cog float32, heading uint16 -> 26 bytes per position
+# so the memory budget is fixed when the store is created (1M vessels x 64
+# positions is about 1.7 GB). Positions are kept in arrival order. Once every
+# slot is taken, the vessels updated longest ago make room for new ones; a batch
+# with more vessels than slots keeps only those it updated last.
+
+DEFAULT_CAPACITY = 64
+DEFAULT_MAX_VESSELS = 100000
+
+COLUMNS = {'seconds': np.int64, 'lat': np.float32, 'lon': np.float32, 'sog': np.float32, 'cog': np.float32,
+           'heading': np.uint16}
+# head, count (int32), last update tick, MMSI (int64) per slot
+SLOT_BYTES = 4 + 4 + 8 + 8
+
+
+class SlotIndex:
+    # MMSI -> slot. Freed slots are reused before fresh ones, so the index never holds more than
+    # the store's vessels; __slots__ keeps it to these three fields.
+    __slots__ = ('slots', 'released', 'next_fresh')
+
+    def __init__(self):
+        self.slots = {}
+        self.released = []
+        self.next_fresh = 0
+
+
+class TrajectoryStore:
+    def __init__(self, max_vessels=DEFAULT_MAX_VESSELS, capacity=DEFAULT_CAPACITY):
+        self.max_vessels = max_vessels
+        self.capacity = capacity
+        self.columns = {name: np.zeros((max_vessels, capacity), dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.head = np.zeros(max_vessels, dtype=np.int32)  # next write position
+        self.count = np.zeros(max_vessels, dtype=np.int32)
+        self.touched = np.zeros(max_vessels, dtype=np.int64)
+        self.mmsi = np.zeros(max_vessels, dtype=np.int64)
+        self.index = SlotIndex()
+        self._tick = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def bytes_per_vessel(capacity=DEFAULT_CAPACITY):
+        return capacity * sum(np.dtype(dtype).itemsize for dtype in COLUMNS.values()) + SLOT_BYTES
+
+    @classmethod
+    def for_budget(cls, budget_bytes, capacity=DEFAULT_CAPACITY):
+        # As many vessels as fit in budget_bytes of arrays (the MMSI dict comes on top, ~100 bytes per vessel)
+        return cls(max(1, int(budget_bytes // cls.bytes_per_vessel(capacity))), capacity)
+
+    @property
+    def nbytes(self):
+        arrays = list(self.columns.values()) + [self.head, self.count, self.touched, self.mmsi]
+        return sum(array.nbytes for array in arrays)
+
+    def __len__(self):
+        return len(self.index.slots)
+
+    def __contains__(self, mmsi):
+        return int(mmsi) in self.index.slots
+
+    def clear(self):
+        with self._lock:
+            self.index = SlotIndex()
+            self.count[:] = 0
+            self.head[:] = 0
+
+    def drop(self, mmsi):
+        with self._lock:
+            slot = self.index.slots.pop(int(mmsi), None)
+            if slot is not None:
+                self.count[slot] = 0
+                self.index.released.append(slot)
+
+    def _allocate(self, vessels, keep):
+        # Slots for MMSIs not in the store yet; slots in keep (this batch's other vessels) are never evicted
+        index = self.index
+        slots = [index.released.pop() for _ in range(min(len(vessels), len(index.released)))]
+        fresh = min(len(vessels) - len(slots), self.max_vessels - index.next_fresh)
+        slots += range(index.next_fresh, index.next_fresh + fresh)
+        index.next_fresh += fresh
+        short = len(vessels) - len(slots)
+        if short:
+            if len(vessels) + len(keep) > self.max_vessels:
+                raise ValueError(f"{len(vessels) + len(keep)} vessels in one update, the store holds {self.max_vessels}")
+            touched = self.touched.copy()
+            touched[np.r_[keep, slots].astype(np.int64)] = np.iinfo(np.int64).max
+            evicted = np.argpartition(touched, short - 1)[:short].tolist()
+            for slot in evicted:
+                del index.slots[int(self.mmsi[slot])]
+            slots += evicted
+        slots = np.asarray(slots, dtype=np.int64)
+        self.head[slots] = 0
+        self.count[slots] = 0
+        self.mmsi[slots] = vessels
+        index.slots.update(zip(vessels.tolist(), slots.tolist()))
+        return slots
+
+    def _slots_for(self, vessels):
+        # Slot of each (unique) MMSI, allocating for new vessels
+        slots = np.empty(len(vessels), dtype=np.int64)
+        get = self.index.slots.get
+        new = []
+        for i, mmsi in enumerate(vessels.tolist()):
+            slot = get(mmsi)
+            if slot is None:
+                new.append(i)
+            else:
+                slots[i] = slot
+        if new:
+            known = np.delete(slots, new)
+            slots[new] = self._allocate(vessels[new], known)
+        return slots
+
+    def append(self, mmsi, seconds, lat, lon, sog, cog, heading=HEADING_UNAVAILABLE):
+        # One position, O(1)
+        with self._lock:
+            slot = self.index.slots.get(int(mmsi))
+            if slot is None:
+                slot = int(self._allocate(np.array([mmsi], dtype=np.int64), np.empty(0, dtype=np.int64))[0])
+            position = self.head[slot]
+            for name, value in (('seconds', seconds), ('lat', lat), ('lon', lon), ('sog', sog), ('cog', cog),
+                                ('heading', heading)):
+                self.columns[name][slot, position] = value
+            self.head[slot] = (position + 1) % self.capacity
+            self.count[slot] = min(self.count[slot] + 1, self.capacity)
+            self._tick += 1
+            self.touched[slot] = self._tick
+
+    def append_batch(self, mmsi, seconds, lat, lon, sog, cog, heading=None):
+        # Columns of equal length in arrival order; O(1) per position, one Python step per distinct vessel
+        mmsi = np.asarray(mmsi, dtype=np.int64)
+        n = len(mmsi)
+        if not n:
+            return
+        if heading is None:
+            heading = np.full(n, HEADING_UNAVAILABLE)
+        heading = np.nan_to_num(np.asarray(heading, dtype=np.float64), nan=HEADING_UNAVAILABLE)
+        values = {'seconds': seconds, 'lat': lat, 'lon': lon, 'sog': sog, 'cog': cog, 'heading': heading}
+
+        order = np.argsort(mmsi, kind='stable')
+        sorted_mmsi = mmsi[order]
+        starts = np.flatnonzero(np.r_[True, sorted_mmsi[1:] != sorted_mmsi[:-1]])
+        counts = np.diff(np.r_[starts, n])
+        if len(starts) > self.max_vessels:
+            # As if the batch had been appended in pieces: the vessels whose last position
+            # arrived earliest would be evicted again by the later ones
+            last_row = order[starts + counts - 1]
+            cutoff = np.partition(last_row, len(starts) - self.max_vessels)[len(starts) - self.max_vessels]
+            rows = np.isin(mmsi, sorted_mmsi[starts][last_row >= cutoff])
+            logging.warning(f"{len(starts)} vessels in one update, the store holds {self.max_vessels}; "
+                            f"keeping the {self.max_vessels} updated last")
+            self.append_batch(mmsi[rows], *(np.asarray(values[name])[rows]
+                                            for name in ('seconds', 'lat', 'lon', 'sog', 'cog', 'heading')))
+            return
+        rank = np.arange(n) - np.repeat(starts, counts)
+        # Only a vessel's last `capacity` positions of the batch survive
+        keep = rank >= np.repeat(counts - self.capacity, counts)
+        with self._lock:
+            slots = self._slots_for(sorted_mmsi[starts])
+            row_slots = np.repeat(slots, counts)[keep]
+            positions = (self.head[row_slots] + rank[keep]) % self.capacity
+            rows = order[keep]
+            for name, column in self.columns.items():
+                column[row_slots, positions] = np.asarray(values[name])[rows]
+            self.head[slots] = (self.head[slots] + counts) % self.capacity
+            self.count[slots] = np.minimum(self.count[slots] + counts, self.capacity)
+            self._tick += 1
+            self.touched[slots] = self._tick
+
+    def add_frame(self, df, new_only=False):
+        # AIS frame with MMSI, BaseDateTime, LAT, LON, SOG, COG (and Heading), appended in time order.
+        # With new_only, positions no newer than their vessel's latest stored one are skipped,
+        # so data sent twice isn't stored twice.
+        seconds = epoch_seconds(df['BaseDateTime'].values)
+        mmsi = df['MMSI'].to_numpy()
+        order = np.argsort(seconds, kind='stable')
+        if new_only and len(order):
+            vessels, inverse = np.unique(mmsi, return_inverse=True)
+            latest = self.latest(vessels)
+            newest = np.where(latest['valid'], latest['seconds'], np.iinfo(np.int64).min)
+            order = order[seconds[order] > newest[inverse.reshape(-1)][order]]
+        heading = df['Heading'].to_numpy()[order] if 'Heading' in df else None
+        self.append_batch(mmsi[order], seconds[order],
+                          df['LAT'].to_numpy()[order], df['LON'].to_numpy()[order], df['SOG'].to_numpy()[order],
+                          df['COG'].to_numpy()[order], heading)
+
+    def windows(self, mmsi, n=None):
+        # Last n positions of each vessel as (len(mmsi), n) arrays, oldest first and right-aligned,
+        # plus 'valid' marking the entries that exist (unknown vessels have none)
+        mmsi = np.asarray(mmsi, dtype=np.int64).reshape(-1)
+        n = self.capacity if n is None else min(n, self.capacity)
+        with self._lock:
+            get = self.index.slots.get
+            slots = np.array([get(m, -1) for m in mmsi.tolist()], dtype=np.int64)
+            known = slots >= 0
+            slots = np.where(known, slots, 0)
+            back = np.arange(n, 0, -1)
+            positions = (self.head[slots, None] - back) % self.capacity
+            valid = known[:, None] & (back <= self.count[slots, None])
+            result = {name: column[slots[:, None], positions] for name, column in self.columns.items()}
+        result['valid'] = valid
+        return result
+
+    def track(self, mmsi, n=None, start=None, end=None):
+        # One vessel's last n stored positions within [start, end] epoch seconds, oldest first
+        window = self.windows([mmsi])
+        keep = window.pop('valid')[0]
+        seconds = window['seconds'][0]
+        if start is not None:
+            keep &= seconds >= start
+        if end is not None:
+            keep &= seconds <= end
+        rows = np.flatnonzero(keep)[-n:] if n else np.flatnonzero(keep)
+        return {name: values[0][rows] for name, values in window.items()}
+
+    def latest(self, mmsi):
+        # Most recent position of each vessel; 'valid' is False for unknown ones
+        window = self.windows(mmsi, 1)
+        return {name: values[:, 0] for name, values in window.items()}
@@ -0,0 +1,168 @@
+import threading
+
+import numpy as np
+
+from features import epoch_seconds, haversine_m
+
+# Spatiotemporal index of recent vessel positions, for "who was near this
+# spill" queries. Positions are grouped into time buckets; inside a bucket
+# they are kept sorted by a lat/lon grid cell id, so a query only scans the
+# cells its search box overlaps and then filters those rows exactly. A position
+# added twice (same MMSI and second, e.g. a file sent to the worker again) is
+# kept once.
+# Buckets older than the retention window (in data time) are dropped.
+
+DEFAULT_BUCKET_SECONDS = 3600
+DEFAULT_RETENTION_SECONDS = 24 * 3600
+DEFAULT_CELL_DEG = 0.1
+
+KM_PER_DEG_LAT = 111.32
+
+COLUMNS = ('cell', 'mmsi', 'seconds', 'lat', 'lon')
+
+
+class _TimeBucket:
+    # Appended chunks are merged into the cell-sorted arrays lazily, on the next query
+
+    def __init__(self):
+        self.columns = {name: np.empty(0, dtype=np.float64 if name in ('lat', 'lon') else np.int64) for name in COLUMNS}
+        self.chunks = []
+
+    def __len__(self):
+        return len(self.columns['cell']) + sum(len(chunk['cell']) for chunk in self.chunks)
+
+    def append(self, chunk):
+        self.chunks.append(chunk)
+
+    def sorted_columns(self):
+        if self.chunks:
+            merged = {name: np.concatenate([self.columns[name]] + [chunk[name] for chunk in self.chunks])
+                      for name in COLUMNS}
+            # MMSIs are 9 digits (< 2**30) and epoch seconds < 2**32, so one int64 key per position
+            _, first = np.unique(merged['mmsi'] * (1 << 32) + merged['seconds'], return_index=True)
+            if len(first) < len(merged['cell']):
+                first.sort()
+                merged = {name: values[first] for name, values in merged.items()}
+            # Already-sorted prefix + new rows: stable sort is close to a merge here
+            order = np.argsort(merged['cell'], kind='stable')
+            self.columns = {name: values[order] for name, values in merged.items()}
+            self.chunks = []
+        return self.columns
+
+
+class VesselIndex:
+    def __init__(self, bucket_seconds=DEFAULT_BUCKET_SECONDS, retention_seconds=DEFAULT_RETENTION_SECONDS,
+                 cell_deg=DEFAULT_CELL_DEG):
+        self.bucket_seconds = bucket_seconds
+        self.retention_seconds = retention_seconds
+        self.cell_deg = cell_deg
+        self.lon_cells = int(np.ceil(360.0 / cell_deg))
+        self._buckets = {}
+        self._latest = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(bucket) for bucket in self._buckets.values())
+
+    def _cell_ids(self, lat, lon):
+        row = np.floor((np.asarray(lat) + 90.0) / self.cell_deg).astype(np.int64)
+        col = np.floor((np.asarray(lon) + 180.0) / self.cell_deg).astype(np.int64) % self.lon_cells
+        return row * self.lon_cells + col
+
+    def add(self, mmsi, seconds, lat, lon):
+        # Columns of equal length; seconds are epoch seconds (see features.epoch_seconds)
+        mmsi = np.asarray(mmsi, dtype=np.int64)
+        seconds = np.asarray(seconds, dtype=np.int64)
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        if not len(seconds):
+            return
+        bucket_ids = seconds // self.bucket_seconds
+        cells = self._cell_ids(lat, lon)
+        with self._lock:
+            for bucket_id in np.unique(bucket_ids):
+                rows = bucket_ids == bucket_id
+                bucket = self._buckets.get(bucket_id)
+                if bucket is None:
+                    bucket = self._buckets[bucket_id] = _TimeBucket()
+                bucket.append({'cell': cells[rows], 'mmsi': mmsi[rows], 'seconds': seconds[rows],
+                               'lat': lat[rows], 'lon': lon[rows]})
+            latest = int(seconds.max())
+            self._latest = latest if self._latest is None else max(self._latest, latest)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._latest = None
+
+    def add_frame(self, df):
+        # AIS frame with MMSI, BaseDateTime, LAT, LON columns
+        self.add(df['MMSI'].to_numpy(), epoch_seconds(df['BaseDateTime'].values),
+                 df['LAT'].to_numpy(), df['LON'].to_numpy())
+
+    def _evict(self):
+        oldest = (self._latest - self.retention_seconds) // self.bucket_seconds
+        for bucket_id in [b for b in self._buckets if b < oldest]:
+            del self._buckets[bucket_id]
+
+    def _cell_ranges(self, lat, lon, radius_km):
+        # Contiguous cell id ranges covering the search box, one per grid row
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlon = radius_km / (KM_PER_DEG_LAT * max(np.cos(np.radians(min(abs(lat) + dlat, 89.9))), 1e-6))
+        row_lo, row_hi = (int(np.floor((v + 90.0) / self.cell_deg)) for v in (lat - dlat, lat + dlat))
+        col_lo, col_hi = (int(np.floor((v + 180.0) / self.cell_deg)) for v in (lon - dlon, lon + dlon))
+        if col_hi - col_lo + 1 >= self.lon_cells:
+            col_spans = [(0, self.lon_cells - 1)]
+        elif col_lo < 0 or col_hi >= self.lon_cells:
+            # Box crosses the antimeridian
+            col_spans = [(col_lo % self.lon_cells, self.lon_cells - 1), (0, col_hi % self.lon_cells)]
+        else:
+            col_spans = [(col_lo, col_hi)]
+        return [(row * self.lon_cells + lo, row * self.lon_cells + hi)
+                for row in range(row_lo, row_hi + 1) for lo, hi in col_spans]
+
+    def query(self, lat, lon, radius_km, start_seconds, end_seconds):
+        # Positions within radius_km of (lat, lon) with start <= time <= end, as column arrays
+        ranges = self._cell_ranges(lat, lon, radius_km)
+        parts = []
+        with self._lock:
+            for bucket_id in range(start_seconds // self.bucket_seconds, end_seconds // self.bucket_seconds + 1):
+                bucket = self._buckets.get(bucket_id)
+                if bucket is None:
+                    continue
+                columns = bucket.sorted_columns()
+                bounds = np.searchsorted(columns['cell'], np.array(ranges).ravel() + [0, 1] * len(ranges))
+                rows = np.concatenate([np.arange(lo, hi) for lo, hi in bounds.reshape(-1, 2)])
+                if len(rows):
+                    parts.append({name: columns[name][rows] for name in COLUMNS[1:]})
+
+        if not parts:
+            return {name: np.empty(0) for name in COLUMNS[1:] + ('distance_km',)}
+        found = {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS[1:]}
+        distance_km = haversine_m(lat, lon, found['lat'], found['lon']) / 1000.0
+        keep = (distance_km <= radius_km) & (found['seconds'] >= start_seconds) & (found['seconds'] <= end_seconds)
+        found = {name: values[keep] for name, values in found.items()}
+        found['distance_km'] = distance_km[keep]
+        return found
+
+    def nearby_vessels(self, lat, lon, radius_km, start_seconds, end_seconds, limit=None):
+        # One entry per vessel: its closest recorded approach in the window, nearest first
+        found = self.query(lat, lon, radius_km, start_seconds, end_seconds)
+        if not len(found['mmsi']):
+            return []
+        order = np.lexsort((found['distance_km'], found['mmsi']))
+        mmsi = found['mmsi'][order]
+        first = np.flatnonzero(np.r_[True, mmsi[1:] != mmsi[:-1]])
+        counts = np.diff(np.r_[first, len(mmsi)])
+        closest = order[first]
+        nearest = np.argsort(found['distance_km'][closest], kind='stable')[:limit]
+        return [{
+            'MMSI': int(found['mmsi'][i]),
+            'distance_km': round(float(found['distance_km'][i]), 3),
+            'BaseDateTime': str(np.datetime64(int(found['seconds'][i]), 's')),
+            'LAT': float(found['lat'][i]),
+            'LON': float(found['lon'][i]),
+            'positions': int(n),
+        } for i, n in zip(closest[nearest], counts[nearest])]